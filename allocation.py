@@ -0,0 +1,261 @@
+# allocation.py
+"""
+资产配置汇总
+
+按账户、资产类别（含顶层大类）、资产类型、"四笔钱"和币种汇总每个日期的基准货币市值。
+每个 (资产, 账户) 持仓在每个净值日期的数量、净值和汇率都由 as-of 连接取得，所有维度在
+一次分组求和中算出，结果保存在 allocation_snapshot 表中，查看配置时直接读取。
+
+汇总按来源表（交易、净值、汇率）的自增ID记录高水位，只重算最早受新增记录影响的日期之后的部分。
+
+用法: python -m allocation [--rebuild]
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import LOG_LEVEL, ALLOCATION_CHUNK_DATES, FX_BACKFILL_BEFORE_FIRST_RATE
+from currency_converter import CurrencyConverter, asof_lookup, to_days
+from database import (DatabaseManager, ALLOCATION_DIMENSIONS, ALLOCATION_SOURCES, POSITION_TABLES,
+                      get_database)
+from utils import setup_logging
+from valuation import cumulative_by_key, transaction_signs
+
+logger = logging.getLogger(__name__)
+
+# 资产的维度字段（来自 stock/fund 表）
+ASSET_DIMENSION_FIELDS = {
+    "class_assets": "class_assets_id",
+    "type_assets": "type_assets_id",
+    "four_type_money": "four_type_money_id",
+    "currency": "currency_id",
+}
+
+
+def _asset_key(kind_index: int, asset_ids: np.ndarray) -> np.ndarray:
+    """股票和基金的ID会重复，合成全局资产键"""
+    return asset_ids.astype(np.int64) * len(POSITION_TABLES) + kind_index
+
+
+def _load_positions(db: DatabaseManager, start_date: Optional[str]) -> Dict[str, Any]:
+    """读取全部交易、start_date 之后（含此前最后一条）的净值和资产维度字段，股票和基金合并为数组"""
+    tx_keys, tx_accounts, tx_days, tx_quantities = [], [], [], []
+    nav_keys, nav_days, nav_values = [], [], []
+    attributes: Dict[str, Dict[int, Optional[int]]] = {name: {} for name in ASSET_DIMENSION_FIELDS}
+    
+    for kind_index, kind in enumerate(POSITION_TABLES):
+        transactions = db.get_transaction_rows(kind)
+        asset_ids = np.array([row[1] for row in transactions], dtype=np.int64)
+        type_ids = np.array([row[3] if row[3] is not None else -1 for row in transactions], dtype=np.int64)
+        quantities = np.array([row[5] for row in transactions], dtype=float)
+        tx_keys.append(_asset_key(kind_index, asset_ids))
+        tx_accounts.append(np.array([row[2] or 0 for row in transactions], dtype=np.int64))
+        tx_days.append(to_days([row[4] for row in transactions]))
+        tx_quantities.append(transaction_signs(type_ids) * np.nan_to_num(quantities))
+        
+        series = db.get_value_series(kind, start_date, include_previous=True)
+        nav_keys.append(_asset_key(kind_index, np.array([row[0] for row in series], dtype=np.int64)))
+        nav_days.append(to_days([row[1] for row in series]))
+        nav_values.append(np.array([row[2] for row in series], dtype=float))
+        
+        for asset in db.get_latest_values(kind):
+            key = int(_asset_key(kind_index, np.array([asset['id']]))[0])
+            for name, field in ASSET_DIMENSION_FIELDS.items():
+                attributes[name][key] = asset.get(field)
+    
+    return {
+        'tx_keys': np.concatenate(tx_keys),
+        'tx_accounts': np.concatenate(tx_accounts),
+        'tx_days': np.concatenate(tx_days),
+        'tx_quantities': np.concatenate(tx_quantities),
+        'nav_keys': np.concatenate(nav_keys),
+        'nav_days': np.concatenate(nav_days),
+        'nav_values': np.concatenate(nav_values),
+        'attributes': attributes,
+    }
+
+
+def _top_level_classes(db: DatabaseManager) -> Dict[int, int]:
+    """资产类别ID -> 顶层大类ID（代码前两位相同、其余为 0 的类别）"""
+    codes = db.get_class_asset_codes()
+    top_ids = {code[:2]: class_id for class_id, code in codes.items() if code and code[2:].strip("0") == ""}
+    return {class_id: top_ids.get(code[:2], class_id) for class_id, code in codes.items() if code}
+
+
+def compute_allocation(db: DatabaseManager, start_date: Optional[str] = None,
+                       converter: Optional[CurrencyConverter] = None,
+                       chunk_dates: int = ALLOCATION_CHUNK_DATES) -> Iterator[Tuple[str, str, int, float, Optional[float]]]:
+    """计算 start_date（含）之后每个净值日期、每个维度成员的基准货币市值和占比
+    
+    日期取所有持仓资产的净值日期；每个 (资产, 账户) 持仓在某日的数量为此前全部交易的累计，净值和汇率
+    取当天或之前最近的一条，还没有净值的持仓不计入。逐行生成 (日期, 维度, 成员ID, 市值, 占比)，
+    未设置维度字段的归入成员 0。持仓 × 日期 的网格每次只展开 chunk_dates 个日期，重算多年的历史时
+    内存占用不随日期数增长
+    """
+    converter = converter or CurrencyConverter(db)
+    data = _load_positions(db, start_date)
+    
+    # 每个 (资产, 账户) 一个持仓
+    pairs, pair_index = np.unique(np.stack([data['tx_keys'], data['tx_accounts']], axis=1),
+                                  axis=0, return_inverse=True)
+    pair_index = pair_index.reshape(-1)
+    held = np.isin(data['nav_keys'], pairs[:, 0])
+    dates = np.unique(data['nav_days'][held])
+    if start_date:
+        dates = dates[dates >= np.datetime64(start_date[:10])]
+    if len(pairs) == 0 or len(dates) == 0:
+        return
+    
+    cumulative = cumulative_by_key(pair_index, data['tx_days'], data['tx_quantities'])
+    
+    def member(name: str) -> np.ndarray:
+        values = data['attributes'][name]
+        return np.array([values.get(int(key)) or 0 for key in pairs[:, 0]], dtype=np.int64)
+    
+    # 每个持仓在各维度的成员
+    class_members = member("class_assets")
+    top_classes = _top_level_classes(db)
+    pair_members = {
+        "account": pairs[:, 1],
+        "asset_class": np.array([top_classes.get(int(c), int(c)) for c in class_members], dtype=np.int64),
+        "class_assets": class_members,
+        "type_assets": member("type_assets"),
+        "four_type_money": member("four_type_money"),
+        "currency": member("currency"),
+    }
+    dimension_names = list(ALLOCATION_DIMENSIONS)
+    member_count = int(max(values.max(initial=0) for values in pair_members.values())) + 1
+    
+    for first in range(0, len(dates), chunk_dates):
+        yield from _allocate_dates(dates[first:first + chunk_dates], pairs, pair_members, dimension_names,
+                                   member_count, cumulative, data, converter)
+
+
+def _allocate_dates(dates: np.ndarray, pairs: np.ndarray, pair_members: Dict[str, np.ndarray],
+                    dimension_names: List[str], member_count: int, cumulative: Tuple[np.ndarray, ...],
+                    data: Dict[str, Any], converter: CurrencyConverter) -> List[Tuple[str, str, int, float, Optional[float]]]:
+    """计算一段日期的资产配置：展开 持仓 × 日期 的网格，所有维度一次分组求和"""
+    grid_pairs = np.repeat(np.arange(len(pairs)), len(dates))
+    grid_dates = np.tile(np.arange(len(dates)), len(pairs))
+    days = dates[grid_dates]
+    
+    quantity = np.nan_to_num(asof_lookup(*cumulative, grid_pairs, days))
+    nav = asof_lookup(data['nav_keys'], data['nav_days'], data['nav_values'], pairs[grid_pairs, 0], days)
+    currency_ids = pair_members["currency"][grid_pairs]
+    market_value = quantity * nav * converter.rates_on(np.where(currency_ids > 0, currency_ids, -1), days)
+    valued = (quantity != 0) & np.isfinite(market_value)
+    valued_pairs = grid_pairs[valued]
+    valued_dates = grid_dates[valued]
+    market_value = market_value[valued]
+    
+    # 键 = (维度, 日期, 成员)
+    keys = np.concatenate([
+        (dimension_index * len(dates) + valued_dates) * member_count + pair_members[name][valued_pairs]
+        for dimension_index, name in enumerate(dimension_names)
+    ])
+    values = np.tile(market_value, len(dimension_names))
+    group_keys, groups = np.unique(keys, return_inverse=True)
+    sums = np.bincount(groups, weights=values, minlength=len(group_keys))
+    totals = np.bincount(valued_dates, weights=market_value, minlength=len(dates))
+    
+    dimension_index, rest = np.divmod(group_keys, len(dates) * member_count)
+    date_index, member_ids = np.divmod(rest, member_count)
+    weights = np.divide(sums, totals[date_index], out=np.full(len(sums), np.nan), where=totals[date_index] != 0)
+    date_labels = dates.astype(str)
+    return [
+        (date_labels[d], dimension_names[j], int(m), float(s), None if np.isnan(w) else float(w))
+        for j, d, m, s, w in zip(dimension_index, date_index, member_ids, sums, weights)
+    ]
+
+
+def update_allocation(db: DatabaseManager, rebuild: bool = False) -> Dict[str, Any]:
+    """增量更新 allocation_snapshot
+    
+    按来源表的高水位找出新增的交易、净值和汇率，从其中最早的日期起重算；某货币的最早汇率提前时，从该货币计价
+    持仓的第一笔交易起重算；没有新增记录时不做任何计算。
+    来源表有记录被删除（最大ID小于高水位）或 rebuild 为 True 时重算全部日期。记录被原地修改时
+    需要 rebuild。返回 {'start_date': 重算起始日期, 'rows': 写入条数}
+    """
+    started = time.perf_counter()
+    watermarks = db.get_allocation_watermarks()
+    rebuild = rebuild or not watermarks
+    new_marks = {}
+    start_date = None
+    for table in ALLOCATION_SOURCES:
+        last_id = watermarks.get(table, 0)
+        max_id, min_date = db.get_changes_since(table, last_id)
+        new_marks[table] = max_id
+        if max_id < last_id:
+            logger.warning(f"{table} 的最大ID小于资产配置高水位 {last_id}，重算全部日期")
+            rebuild = True
+        elif min_date and (start_date is None or str(min_date)[:10] < start_date):
+            start_date = str(min_date)[:10]
+    
+    # 早于某货币第一条汇率的日期按其最早的汇率换算：最早汇率提前时，该货币计价的持仓从第一笔交易起市值都会变化
+    if not rebuild and FX_BACKFILL_BEFORE_FIRST_RATE:
+        currencies = db.get_currencies_with_earlier_first_rate(watermarks.get("foreign_exchange_rate", 0))
+        first_date = db.get_first_position_date(currencies)
+        if first_date and first_date < start_date:
+            logger.info(f"货币 {currencies} 的最早汇率提前，从 {first_date} 起重算")
+            start_date = first_date
+    
+    if rebuild:
+        start_date = None
+    elif start_date is None:
+        logger.info("没有新增的交易、净值或汇率，资产配置汇总已是最新")
+        return {'start_date': None, 'rows': 0}
+    
+    # 按日期分段计算的结果直接流入写入事务，不在内存中汇总全部行
+    written = 0
+    
+    def counted_rows() -> Iterator[Tuple[str, str, int, float, Optional[float]]]:
+        nonlocal written
+        for row in compute_allocation(db, start_date):
+            written += 1
+            yield row
+    
+    if not db.replace_allocation_snapshots(start_date, counted_rows(), new_marks):
+        return {'start_date': start_date, 'rows': 0}
+    logger.info(f"资产配置汇总完成: {start_date or '全部日期'} 起 {written} 条, "
+                f"耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+    return {'start_date': start_date, 'rows': written}
+
+
+def get_allocation_report(db: DatabaseManager, date: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """读取各维度在某日期（默认最新日期）的配置，每项带成员名称"""
+    report = {}
+    for dimension in ALLOCATION_DIMENSIONS:
+        names = db.get_dimension_names(dimension)
+        rows = db.get_allocation(dimension, date)
+        for row in rows:
+            row['name'] = names.get(row['member_id'], "未分类")
+        report[dimension] = rows
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口：增量更新资产配置汇总（供定时任务在获取数据后运行），--rebuild 时重算全部日期"""
+    parser = argparse.ArgumentParser(prog="python -m allocation", description="更新资产配置汇总")
+    parser.add_argument("--rebuild", action="store_true", help="重算全部日期（交易、净值或汇率被修改后使用）")
+    args = parser.parse_args(argv)
+    setup_logging(LOG_LEVEL)
+    
+    db = get_database()
+    if not db.connect():
+        logger.error("无法连接数据库")
+        return 1
+    try:
+        result = update_allocation(db, args.rebuild)
+        print(f"资产配置汇总: {result['start_date'] or '全部日期'} 起写入 {result['rows']} 条")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,285 @@
+# async_fetcher.py
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Dict, Any, Optional, Callable
+
+from config import FETCH_ENGINE, FETCH_MAX_WORKERS, SOURCE_CONCURRENCY, SKIP_UP_TO_DATE_ASSETS
+from data_sources import DataSourceType
+from fetcher import DataFetcher
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDataFetcher(DataFetcher):
+    """基于 asyncio 的数据获取类
+
+    对外方法与 DataFetcher 相同（同步调用），内部用 asyncio.run 驱动：
+    - 阻塞的数据源调用在有界线程池中执行，每个数据源一个信号量限制并发请求数
+    - 每个市场一个批量任务，一键更新时股票、基金、汇率同时获取
+    - 工作线程只负责网络请求，结果的打印和提交写线程都在事件循环中完成
+    """
+
+    def __init__(self, max_workers: int = FETCH_MAX_WORKERS, skip_up_to_date: bool = SKIP_UP_TO_DATE_ASSETS):
+        super().__init__(max_workers, skip_up_to_date)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def fetch_stock_prices(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有股票的最新收盘价"""
+        return self._run(self._fetch_stock_prices_async)
+
+    def fetch_us_stocks_only(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """仅获取美股数据"""
+        return self._run(self._fetch_stock_prices_async, "US")
+
+    def fetch_fund_navs(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有基金的最新净值"""
+        return self._run(self._fetch_fund_navs_async)
+
+    def fetch_exchange_rates(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有货币的最新汇率"""
+        return self._run(self._fetch_exchange_rates_async)
+
+    def _fetch_all_data(self, db) -> Dict[str, Any]:
+        """一键获取所有数据：股票、基金、汇率同时获取"""
+        results = {}
+
+        print("\n" + "="*60)
+        print("开始一键更新所有数据")
+        print("="*60)
+
+        # 1. 备份数据库
+        print("\n1. 备份数据库...")
+        if db is not None:
+            if db.backup():
+                print("  √ 数据库备份成功")
+            else:
+                print("  × 数据库备份失败，继续执行...")
+        else:
+            print("  × 无法连接数据库，跳过备份...")
+
+        # 2. 同时获取股票、基金、汇率
+        print("\n2. 同时获取股票收盘价、基金净值和汇率...")
+        if db is not None:
+            stock_result, fund_result, rate_result = self._run(self._fetch_all_async)
+        else:
+            stock_result = fund_result = rate_result = (0, 0, [])
+
+        for key, (success, failure, failed_items) in (
+                ('stocks', stock_result), ('funds', fund_result), ('rates', rate_result)):
+            results[key] = {
+                'success': success,
+                'failure': failure,
+                'failed_items': failed_items
+            }
+
+        total_success = stock_result[0] + fund_result[0] + rate_result[0]
+        total_failure = stock_result[1] + fund_result[1] + rate_result[1]
+        results['total'] = {
+            'success': total_success,
+            'failure': total_failure
+        }
+
+        print("\n" + "="*60)
+        print("数据更新完成")
+        print("="*60)
+        print(f"股票: 成功 {stock_result[0]} 只, 失败 {stock_result[1]} 只")
+        print(f"基金: 成功 {fund_result[0]} 只, 失败 {fund_result[1]} 只")
+        print(f"汇率: 成功 {rate_result[0]} 种, 失败 {rate_result[1]} 种")
+        print(f"总计: 成功 {total_success} 项, 失败 {total_failure} 项")
+        print("="*60)
+
+        return results
+
+    def _run(self, coro_func: Callable, *args):
+        """在本次获取过程的连接和线程池中运行协程"""
+        with self._run_connection() as db:
+            if db is None:
+                return 0, 0, []
+
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="AsyncDataFetcher")
+            # 信号量绑定在创建它的事件循环上，每次 asyncio.run 都重新创建
+            self._semaphores = {}
+            try:
+                return asyncio.run(coro_func(db, *args))
+            finally:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    async def _fetch_all_async(self, db) -> Tuple[Tuple, Tuple, Tuple]:
+        """并发获取股票、基金和汇率"""
+        return await asyncio.gather(
+            self._fetch_stock_prices_async(db),
+            self._fetch_fund_navs_async(db),
+            self._fetch_exchange_rates_async(db),
+        )
+
+    async def _call(self, source_key: str, func: Callable, *args):
+        """在线程池中执行阻塞的数据源调用，受该数据源的信号量限制"""
+        semaphore = self._semaphores.get(source_key)
+        if semaphore is None:
+            limit = SOURCE_CONCURRENCY.get(source_key, SOURCE_CONCURRENCY["default"])
+            semaphore = self._semaphores[source_key] = asyncio.Semaphore(limit)
+
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _timed(func: Callable, *args) -> Tuple[Any, float]:
+        """执行数据源调用，返回 (结果, 耗时秒数)"""
+        started = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - started
+
+    def _source_key(self, market_code: Optional[str]) -> str:
+        """获取市场对应的数据源类型，用于选择信号量"""
+        if market_code and hasattr(self.data_source, 'get_data_source_for_market'):
+            source = self.data_source.get_data_source_for_market(market_code)
+            if source is not None:
+                return source.get_data_source_type().value
+        return "default"
+
+    async def _fetch_batches(self, kind: str, assets: List[Dict[str, Any]], batch_func: Callable,
+                             default_market: Optional[str], unit: str) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """按市场分组，每个市场一个批量任务，结果提交给写线程"""
+        assets_by_market = {}
+        for asset in assets:
+            assets_by_market.setdefault(asset.get('market_code', default_market), []).append(asset)
+
+        markets = list(assets_by_market.keys())
+        tasks = [
+            self._call(self._source_key(market_code), self._timed, batch_func,
+                       [asset['code'] for asset in assets_by_market[market_code]], market_code)
+            for market_code in markets
+        ]
+        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        success_count = 0
+        failure_count = 0
+        failed_items = []
+        for market_code, result in zip(markets, batch_results):
+            if isinstance(result, Exception):
+                logger.error(f"批量获取 [{market_code}] 数据时出现异常: {result}")
+                values, elapsed, error = {}, None, str(result)
+            else:
+                (values, elapsed), error = result, "无法获取数据"
+
+            for asset in assets_by_market[market_code]:
+                value, date = values.get(asset['code'], (None, None))
+                if value is not None and date is not None:
+                    success_count += 1
+                    print(f"  √ {asset['name']}({asset['code']}) 获取成功: {date} {unit} {value}")
+                    self._put_value(kind, asset, date, value)
+                    self._record_outcome(kind, asset, "success", date, value, elapsed)
+                else:
+                    failure_count += 1
+                    failed_items.append(asset)
+                    print(f"  × {asset['name']}({asset['code']}) 获取失败: 无法获取数据")
+                    self._record_outcome(kind, asset, "failed", elapsed=elapsed, error=error)
+
+        return success_count, failure_count, failed_items
+
+    async def _fetch_stock_prices_async(self, db, market_code: Optional[str] = None) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取股票的最新收盘价，指定 market_code 时只获取该市场的股票"""
+        stocks = self._get_assets_to_fetch(db, "stock", market_code)
+
+        if not stocks:
+            return 0, 0, []
+
+        print(f"\n开始获取 {len(stocks)} 只股票的收盘价...")
+        logger.info(f"开始获取 {len(stocks)} 只股票的收盘价")
+        writes_before = self._writer.get_stats()
+
+        success_count, failure_count, failed_stocks = await self._fetch_batches(
+            "stock", stocks, self.data_source.get_stock_prices_batch, "SH", "收盘价")
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._report_writes, "stock", writes_before)
+
+        logger.info(f"股票获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
+        return success_count, failure_count, failed_stocks
+
+    async def _fetch_fund_navs_async(self, db) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有基金的最新净值"""
+        funds = self._get_assets_to_fetch(db, "fund")
+
+        if not funds:
+            return 0, 0, []
+
+        print(f"\n开始获取 {len(funds)} 只基金的净值...")
+        logger.info(f"开始获取 {len(funds)} 只基金的净值")
+        writes_before = self._writer.get_stats()
+
+        success_count, failure_count, failed_funds = await self._fetch_batches(
+            "fund", funds, self.data_source.get_fund_navs_batch, None, "净值")
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._report_writes, "fund", writes_before)
+
+        logger.info(f"基金获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
+        return success_count, failure_count, failed_funds
+
+    async def _fetch_exchange_rates_async(self, db) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有货币的最新汇率，批量接口失败时逐个并发获取"""
+        currencies = self._get_assets_to_fetch(db, "fx")
+
+        if not currencies:
+            return 0, 0, []
+
+        print(f"\n开始获取 {len(currencies)} 种货币的汇率...")
+        logger.info(f"开始获取 {len(currencies)} 种货币的汇率")
+        writes_before = self._writer.get_stats()
+
+        source_key = DataSourceType.AKSHARE.value
+        currency_codes = [currency['currency'] for currency in currencies]
+        elapsed_by_code: Dict[str, float] = {}
+        try:
+            rates, elapsed = await self._call(source_key, self._timed,
+                                              self.data_source.get_exchange_rates_batch, currency_codes)
+            elapsed_by_code = dict.fromkeys(currency_codes, elapsed)
+        except Exception as e:
+            logger.error(f"批量获取汇率时出现异常，回退到逐个获取: {e}")
+            rates = None
+
+        if not rates:
+            logger.warning("批量获取汇率失败，回退到逐个获取")
+            results = await asyncio.gather(
+                *(self._call(source_key, self._timed, self.data_source.get_exchange_rate, code)
+                  for code in currency_codes),
+                return_exceptions=True)
+            rates = {}
+            for code, result in zip(currency_codes, results):
+                if not isinstance(result, Exception):
+                    rates[code], elapsed_by_code[code] = result
+
+        success_count = 0
+        failure_count = 0
+        failed_currencies = []
+        for currency in currencies:
+            currency_code = currency['currency']
+            rate, date = rates.get(currency_code, (None, None))
+            if rate is not None and date is not None:
+                success_count += 1
+                print(f"  √ 获取成功 {currency_code}/CNY: {date} 汇率 {rate}")
+                self._put_value("fx", currency, date, rate)
+                self._record_outcome("fx", currency, "success", date, rate, elapsed_by_code.get(currency_code))
+            else:
+                failure_count += 1
+                failed_currencies.append(currency)
+                print(f"  × 获取失败 {currency_code}/CNY: 无法获取数据")
+                self._record_outcome("fx", currency, "failed", elapsed=elapsed_by_code.get(currency_code),
+                                     error="无法获取数据")
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._report_writes, "fx", writes_before)
+
+        logger.info(f"汇率获取完成: 成功 {success_count} 种, 失败 {failure_count} 种")
+        return success_count, failure_count, failed_currencies
+
+
+def create_data_fetcher() -> DataFetcher:
+    """按配置创建数据获取器"""
+    if FETCH_ENGINE == "async":
+        return AsyncDataFetcher()
+    return DataFetcher()
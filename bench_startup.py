@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# bench_startup.py
+"""
+启动耗时基准测试
+
+每次在新的 Python 进程中执行 main.py 进入菜单前的全部步骤（导入、依赖检查、数据库检查、
+创建菜单系统），统计耗时，并检查 akshare / yfinance / pandas 等重量级库是否被提前导入。
+
+用法: python bench_startup.py [--runs 5] [--limit 1.0]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.absolute()
+
+# 启动阶段不应导入的库
+HEAVY_MODULES = ["akshare", "yfinance", "pandas", "numpy", "requests"]
+
+# 在子进程中执行的启动步骤，结果以 JSON 输出到标准输出最后一行
+PROBE = """
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+    main.check_dependencies()
+    main.check_database()
+    from menu import MenuSystem
+    MenuSystem()
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once() -> dict:
+    """在新进程中运行一次启动步骤，返回进程内耗时、进程总耗时和已导入的重量级库"""
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", PROBE], cwd=BASE_DIR,
+                               capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["wall"] = wall
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量程序启动到菜单的耗时")
+    parser.add_argument("--runs", type=int, default=5, help="运行次数（默认: 5）")
+    parser.add_argument("--limit", type=float, default=1.0, help="进程总耗时中位数上限，单位秒（默认: 1.0）")
+    args = parser.parse_args()
+    
+    results = [run_once() for _ in range(args.runs)]
+    elapsed = [r["elapsed"] for r in results]
+    wall = [r["wall"] for r in results]
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    
+    print(f"运行 {args.runs} 次")
+    print(f"启动步骤耗时: 中位数 {statistics.median(elapsed) * 1000:.0f} ms, 最大 {max(elapsed) * 1000:.0f} ms")
+    print(f"进程总耗时:   中位数 {statistics.median(wall) * 1000:.0f} ms, 最大 {max(wall) * 1000:.0f} ms")
+    print(f"启动时导入的重量级库: {', '.join(loaded) if loaded else '无'}")
+    
+    if statistics.median(wall) > args.limit:
+        print(f"× 启动耗时超过 {args.limit} 秒")
+        return 1
+    print(f"√ 启动耗时在 {args.limit} 秒以内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -9,11 +9,33 @@ BASE_DIR = Path(__file__).parent.absolute()
 DB_FILE = BASE_DIR / "property.db"
 DB_BACKUP_DIR = BASE_DIR / "backups"
 DECIMAL_PLACES = 4
+
+# 数据库连接参数，每次连接时通过 PRAGMA 设置
+# wal: 写入时不阻塞查看数据，大范围历史查询使用内存映射
+# legacy: SQLite 默认的回滚日志模式
+DB_CONNECTION_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,   # 256MB
+        "cache_size": -65536,     # 负数单位为KB，即64MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,     # 毫秒
+    },
+    "legacy": {},
+}
+DB_CONNECTION_PROFILE = "wal"
 # 数据库配置
 
 # 数据源配置
 DATA_SOURCE = "akshare"  # 可配置为 'akshare', 'yfinance', '自定义'
 AKSHARE_TIMEOUT = 30  # 秒
+# 个别接口的超时（秒），未列出的接口使用 AKSHARE_TIMEOUT；全市场行情快照分页下载，耗时远长于单只股票
+AKSHARE_ENDPOINT_TIMEOUTS = {
+    "stock_zh_a_spot_em": 180,
+    "stock_us_spot_em": 300,
+    "fund_open_fund_daily_em": 120,
+}
 YFINANCE_TICKER_PREFIX = {
     "US": "",
     "HK": "",
@@ -21,24 +43,97 @@ YFINANCE_TICKER_PREFIX = {
     "SZ": "SZ",
     "BJ": "BJ"
 }
+YFINANCE_BATCH_CHUNK_SIZE = 100   # 批量下载时每次请求的代码数量
+YFINANCE_BATCH_PERIOD = "1mo"     # 批量下载的历史区间，取其中最后一个收盘价
+
+# 数据获取引擎配置
+FETCH_ENGINE = "async"   # 'async': AsyncDataFetcher 并发获取; 'thread': DataFetcher 线程池
+FETCH_MAX_WORKERS = 8    # 执行阻塞数据源调用的线程池大小
+
+# HTTP 连接配置（每个数据源一个共享会话，keep-alive 连接复用）
+HTTP_CONNECT_TIMEOUT = 5                # 建立连接超时（秒）
+HTTP_READ_TIMEOUT = 30                  # 读取超时（秒）
+HTTP_POOL_MAXSIZE = FETCH_MAX_WORKERS   # 每个主机最多保持的连接数，与工作线程数一致
+SOURCE_CONCURRENCY = {   # 每个数据源同时进行的请求数
+    "akshare": 2,
+    "yfinance": 2,
+    "alpha_vantage": 1,
+    "default": 2,
+}
+
+# 数据源限流配置（令牌桶），所有线程共享同一个数据源的限流器
+# rate: 每秒补充的请求数; burst: 最多可连续发出的请求数; daily_quota: 每日请求上限（None 为不限）
+RATE_LIMITS = {
+    "akshare": {"rate": 2.0, "burst": 5, "daily_quota": None},
+    "yfinance": {"rate": 1.0, "burst": 2, "daily_quota": None},
+    "alpha_vantage": {"rate": 5 / 60, "burst": 5, "daily_quota": 25},  # 免费版每分钟5次、每天25次
+    "default": {"rate": 1.0, "burst": 1, "daily_quota": None},
+}
+
+# 熔断配置：同一数据源接口连续失败达到阈值后熔断，冷却后放行一次探测请求
+CIRCUIT_FAILURE_THRESHOLD = 5    # 连续失败多少次后熔断
+CIRCUIT_RECOVERY_TIMEOUT = 60    # 熔断后多少秒再放行探测请求
+CIRCUIT_SLOW_CALL_SECONDS = 30   # 耗时超过多少秒的调用按失败计
+CIRCUIT_LATENCY_WINDOW = 50      # 保留最近多少次成功调用的耗时用于统计
+
+# 对冲请求：首选数据源超过其历史耗时的某个百分位仍未返回时，向备用数据源发出相同请求，取先返回的有效结果
+HEDGED_REQUESTS_ENABLED = False
+HEDGE_MARKETS = ["US"]           # 启用对冲请求的市场（需要有多个数据源支持）
+HEDGE_LATENCY_PERCENTILE = 95    # 等待首选数据源的时间取其最近成功调用耗时的该百分位
+HEDGE_MIN_DELAY = 0.5            # 最短等待时间（秒）
+HEDGE_DEFAULT_DELAY = 3.0        # 还没有耗时记录时的等待时间（秒）
+
+# 历史数据补齐配置
+BACKFILL_DEFAULT_DAYS = 365  # 没有任何历史数据的资产，从多少天前开始补齐
+BACKFILL_GAP_LOOKBACK_DAYS = 90  # 检查最近多少天内已存数据中间缺失的交易日（如定时任务某天没有运行）
+
+# 数据库写线程配置
+WRITER_QUEUE_SIZE = 1000     # 待写入队列容量，写入跟不上时获取线程等待
+WRITER_BATCH_SIZE = 200      # 累计多少条记录提交一次事务
+WRITER_FLUSH_INTERVAL = 2.0  # 最长多少秒提交一次事务
+
+# 年化收益率（XIRR）计算配置
+XIRR_MAX_ITERATIONS = 50     # 牛顿迭代最多次数，未收敛的持仓改用二分法
+XIRR_TOLERANCE = 1e-7        # 收益率的收敛精度
+XIRR_WORKERS = 1             # 求解进程数，大于 1 时持仓按块分给进程池并行求解
+XIRR_CHUNK_SIZE = 5000       # 进程池每个任务求解的持仓数
+
+# 多币种换算配置
+BASE_CURRENCY = "CNY"                 # 合并估值的基准货币
+FX_BACKFILL_BEFORE_FIRST_RATE = True  # 早于某货币第一条汇率的日期使用其最早的汇率（否则无法换算）
+
+# 资产配置汇总配置
+ALLOCATION_CHUNK_DATES = 250  # 每次展开 持仓 × 日期 网格的日期数（约一年的交易日），限制重算全部历史时的内存
 
 # 程序配置
 ENABLE_CACHE = True
 CACHE_DURATION = 3600  # 缓存时间（秒）
+# 实时行情接口：交易时段内下载的结果收盘后不再有效，不读写响应缓存（数据源 -> 接口名）
+REALTIME_ENDPOINTS = {
+    "akshare": ["stock_zh_a_spot_em", "stock_us_spot_em"],
+}
 LOG_LEVEL = "INFO"     # DEBUG, INFO, WARNING, ERROR
 
 # 美股配置
 US_MARKET_TZ = "US/Eastern"  # 美股时区
 US_DATA_PROVIDER = "yfinance"  # 美股数据提供者
 
-# 文件路径
+# 各市场交易时段（当地时间）和使用的交易日历，用于判断最近一个已收盘的交易日
+# calendar: CN 沪深京交易所日历; NYSE 美股休市规则; WEEKDAY 仅排除周末
+MARKET_SESSIONS = {
+    "SH": {"tz": "Asia/Shanghai", "open": "09:15", "close": "15:00", "calendar": "CN"},
+    "SZ": {"tz": "Asia/Shanghai", "open": "09:15", "close": "15:00", "calendar": "CN"},
+    "BJ": {"tz": "Asia/Shanghai", "open": "09:15", "close": "15:00", "calendar": "CN"},
+    "OF": {"tz": "Asia/Shanghai", "open": "09:30", "close": "21:00", "calendar": "CN"},  # 场外基金当日净值晚间公布
+    "HK": {"tz": "Asia/Hong_Kong", "open": "09:30", "close": "16:10", "calendar": "WEEKDAY"},
+    "US": {"tz": US_MARKET_TZ, "open": "09:30", "close": "16:00", "calendar": "NYSE"},
+    "FX": {"tz": "Asia/Shanghai", "open": "09:30", "close": "10:00", "calendar": "CN"},  # 中行折算价工作日上午公布
+}
+CALENDAR_CACHE_DURATION = 7 * 24 * 3600  # A股交易日历缓存时间（秒）
+SKIP_UP_TO_DATE_ASSETS = True  # 获取前跳过已存数据不早于最近收盘交易日的资产
+
+# 文件路径（目录在第一次写入时创建，导入配置时不做任何文件操作）
 DATA_DIR = BASE_DIR / "data"
 LOG_DIR = BASE_DIR / "logs"
-
-# 创建必要的目录
-for directory in [DATA_DIR, LOG_DIR, Path(DB_BACKUP_DIR)]:
-    directory.mkdir(exist_ok=True)
-
-# 打印配置信息（调试用）
-print(f"数据库文件路径: {DB_FILE}")
-print(f"数据库文件存在: {DB_FILE.exists()}")
\ No newline at end of file
+CACHE_DIR = DATA_DIR / "cache"  # 数据源响应缓存目录
+CACHE_MAX_SIZE = 100 * 1024 * 1024  # 响应缓存总大小上限（字节），超出时淘汰最久未使用的结果
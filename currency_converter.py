@@ -0,0 +1,167 @@
+# currency_converter.py
+"""
+多币种换算
+
+每种货币按日期排序的 (日期, 汇率) 数组缓存在内存中；换算时把 (货币ID, 日期) 合成一个整数键，
+用一次 searchsorted 为每一行找到当天或之前最近的汇率（as-of 连接）。整段历史的换算是一次
+向量化运算，不需要逐行查询数据库。
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import BASE_CURRENCY, FX_BACKFILL_BEFORE_FIRST_RATE
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# 合成键中日期占用的位数，日期按自 1970-01-01 的天数加上偏移后为非负数
+_DAY_BITS = 32
+_DAY_OFFSET = 1 << 31
+
+
+def to_days(dates: Sequence[Optional[str]]) -> np.ndarray:
+    """yyyy-mm-dd 日期转换为 datetime64[D] 数组，None 为 NaT"""
+    return np.array([str(date)[:10] if date else "NaT" for date in dates], dtype="datetime64[D]")
+
+
+def _composite_keys(keys: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """(键, 日期) 合成为可排序的整数键，按键再按日期排序"""
+    return (keys.astype(np.int64) << _DAY_BITS) + (days.astype("datetime64[D]").astype(np.int64) + _DAY_OFFSET)
+
+
+def asof_lookup(keys: np.ndarray, days: np.ndarray, values: np.ndarray, query_keys: np.ndarray,
+                query_days: np.ndarray, before_first: bool = False) -> np.ndarray:
+    """as-of 连接：为每个 (query_key, query_day) 取同一键下日期不晚于 query_day 的最近一个 values
+    
+    没有这样的记录时为 NaN；before_first 为 True 时改取该键最早的一个值。同一键同一日期有多条时取最后一条
+    """
+    result = np.full(len(query_keys), np.nan)
+    known = ~np.isnat(days)
+    if not known.any() or len(query_keys) == 0:
+        return result
+    
+    keys, days, values = keys[known], days[known], values[known]
+    order = np.lexsort((days, keys))
+    sorted_keys = keys[order].astype(np.int64)
+    composite = _composite_keys(sorted_keys, days[order])
+    values = values[order]
+    
+    query_keys = query_keys.astype(np.int64)
+    query_days = np.array(query_days, dtype="datetime64[D]")
+    dated = ~np.isnat(query_days)
+    query_days[~dated] = np.datetime64("1970-01-01")
+    positions = np.searchsorted(composite, _composite_keys(query_keys, query_days), side="right") - 1
+    clipped = np.clip(positions, 0, len(composite) - 1)
+    found = dated & (positions >= 0) & (sorted_keys[clipped] == query_keys)
+    result[found] = values[clipped[found]]
+    
+    if before_first:
+        first = np.clip(np.searchsorted(sorted_keys, query_keys, side="left"), 0, len(sorted_keys) - 1)
+        earlier = dated & ~found & (sorted_keys[first] == query_keys)
+        result[earlier] = values[first[earlier]]
+    return result
+
+
+class CurrencyConverter:
+    """按日期把金额换算为基准货币
+    
+    汇率表中的汇率为 1 单位外币折合人民币；换算到其他基准货币时除以基准货币同一日期的汇率。
+    汇率数组在第一次使用时从数据库加载并缓存，汇率更新后调用 refresh 重新加载。
+    """
+    
+    def __init__(self, db: DatabaseManager, base_currency: str = BASE_CURRENCY,
+                 before_first: bool = FX_BACKFILL_BEFORE_FIRST_RATE):
+        self.db = db
+        self.base_currency = base_currency
+        self.before_first = before_first
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._currency_ids = np.zeros(0, dtype=np.int64)
+        self._days = np.zeros(0, dtype="datetime64[D]")
+        self._rates = np.zeros(0)
+        self._cny_id: Optional[int] = None
+        self._base_id: Optional[int] = None
+    
+    def refresh(self):
+        """从数据库重新加载全部汇率"""
+        rows = self.db.get_value_series("fx")
+        cny = self.db.get_currency_by_code("CNY")
+        base = self.db.get_currency_by_code(self.base_currency)
+        if base is None:
+            raise ValueError(f"未知的基准货币: {self.base_currency}")
+        
+        with self._lock:
+            self._currency_ids = np.array([row[0] for row in rows], dtype=np.int64)
+            self._days = to_days([row[1] for row in rows])
+            self._rates = np.array([row[2] for row in rows], dtype=float)
+            self._cny_id = cny['id'] if cny else None
+            self._base_id = base['id']
+            self._loaded = True
+        logger.debug(f"已加载 {len(rows)} 条汇率，基准货币 {self.base_currency}")
+    
+    def rate_series(self, currency_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """某货币按日期排序的 (日期, 汇率) 数组"""
+        self._ensure_loaded()
+        selected = self._currency_ids == currency_id
+        order = np.argsort(self._days[selected], kind="stable")
+        return self._days[selected][order], self._rates[selected][order]
+    
+    def rates_on(self, currency_ids: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        """各行货币在对应日期折合基准货币的汇率；currency_id 小于 0（未设置）按人民币计，无汇率时为 NaN"""
+        self._ensure_loaded()
+        currency_ids = np.asarray(currency_ids, dtype=np.int64)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        with self._lock:
+            snapshot = self._currency_ids, self._days, self._rates
+        
+        def cny_rates(ids: np.ndarray) -> np.ndarray:
+            rates = asof_lookup(*snapshot, ids, dates, self.before_first)
+            return np.where((ids < 0) | (ids == self._cny_id), 1.0, rates)
+        
+        rates = cny_rates(currency_ids)
+        if self._base_id != self._cny_id:
+            rates = rates / cny_rates(np.full(len(currency_ids), self._base_id, dtype=np.int64))
+        return rates
+    
+    def convert(self, amounts: np.ndarray, currency_ids: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        """把各行金额按对应日期的汇率换算为基准货币"""
+        return np.asarray(amounts, dtype=float) * self.rates_on(currency_ids, dates)
+    
+    def convert_series(self, kind: str, start_date: Optional[str] = None) -> Dict[str, Any]:
+        """把某类资产（stock/fund）的全部历史净值换算为基准货币
+        
+        返回按资产ID和日期排序的数组：asset_id, date, currency_id, value, fx_rate, value_base
+        """
+        rows = self.db.get_value_series(kind, start_date)
+        assets = self.db.get_latest_values(kind)
+        asset_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        dates = to_days([row[1] for row in rows])
+        values = np.array([row[2] for row in rows], dtype=float)
+        
+        # 资产的币种按资产ID对齐到每一行，未设置币种或资产表中不存在的为 -1
+        asset_keys = np.array([asset['id'] for asset in assets], dtype=np.int64)
+        asset_currencies = np.array([asset.get('currency_id') or -1 for asset in assets], dtype=np.int64)
+        order = np.argsort(asset_keys)
+        positions = np.clip(np.searchsorted(asset_keys[order], asset_ids), 0, max(len(assets) - 1, 0))
+        currency_ids = np.full(len(asset_ids), -1, dtype=np.int64)
+        if len(assets):
+            found = asset_keys[order][positions] == asset_ids
+            currency_ids[found] = asset_currencies[order][positions[found]]
+        fx_rate = self.rates_on(currency_ids, dates)
+        return {
+            'asset_id': asset_ids,
+            'date': dates,
+            'currency_id': currency_ids,
+            'value': values,
+            'fx_rate': fx_rate,
+            'value_base': values * fx_rate,
+        }
+    
+    def _ensure_loaded(self):
+        """第一次使用时加载汇率"""
+        if not self._loaded:
+            self.refresh()
\ No newline at end of file
@@ -7,6 +7,9 @@
 from .base_data_source import DataSource, DataSourceType, DataSourceFactory
 from .data_source_manager import DataSourceManager, get_data_source_manager
 from .main_data_source import get_data_source
+from .rate_limiter import TokenBucket, RateLimitExceeded, get_rate_limiter
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker, get_circuit_breaker_stats
+from .http_session import HttpSessionPool, DeadlineExceeded, get_http_session, get_deadline_runner, get_http_metrics
 
 __version__ = "1.0.0"
 __author__ = "Your Name"
@@ -17,5 +20,17 @@ __all__ = [
     'DataSourceFactory',
     'DataSourceManager',
     'get_data_source_manager',
-    'get_data_source'
+    'get_data_source',
+    'TokenBucket',
+    'RateLimitExceeded',
+    'get_rate_limiter',
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'get_circuit_breaker',
+    'get_circuit_breaker_stats',
+    'HttpSessionPool',
+    'DeadlineExceeded',
+    'get_http_session',
+    'get_deadline_runner',
+    'get_http_metrics'
 ]
\ No newline at end of file
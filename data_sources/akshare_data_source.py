@@ -1,31 +1,53 @@
 # akshare_data_source.py
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, List, Dict
-import sys
+import time
 
 # 使用相对导入
+from config import AKSHARE_TIMEOUT, AKSHARE_ENDPOINT_TIMEOUTS
+
 from .base_data_source import DataSource, DataSourceType
+from .http_session import get_deadline_runner
+from .trading_calendar import get_trading_calendar
 
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_TTL = 300  # 行情快照在内存中复用的时间（秒），同一次更新中各市场共用一份
+
 
 class AkshareDataSource(DataSource):
     """Akshare 数据源实现（支持A股和美股）"""
     
-    def __init__(self, timeout: int = 30):
+    def __init__(self, timeout: int = AKSHARE_TIMEOUT):
         try:
             import akshare as ak
             self.ak = ak
             self.timeout = timeout
+            self._snapshots = {}  # 快照名称 -> (下载时间, {代码: (价格, 日期)})
+            self._snapshot_lock = threading.Lock()
             logger.info("Akshare 数据源初始化成功")
         except ImportError:
             logger.error("请先安装 akshare 库: pip install akshare")
-            sys.exit(1)
+            raise
     
     def get_name(self) -> str:
         return "Akshare (支持A股、美股、基金、汇率)"
     
+    def _invoke(self, func, *args, **kwargs):
+        """akshare 接口不接受超时参数，在截止时间执行器中调用，超时抛出 DeadlineExceeded
+        
+        超时取 AKSHARE_ENDPOINT_TIMEOUTS 中该接口的配置，未配置的接口为 timeout 秒。超时的调用只是不再等待，
+        并没有被取消：它仍在后台线程中运行到结束，期间继续占用连接
+        """
+        timeout = self._endpoint_timeout(getattr(func, '__name__', '')) or self.timeout
+        return get_deadline_runner(DataSourceType.AKSHARE.value).run(timeout, func, *args, **kwargs)
+    
+    def _endpoint_timeout(self, func_name: str) -> Optional[float]:
+        """AKSHARE_ENDPOINT_TIMEOUTS 中单独配置的接口超时"""
+        return AKSHARE_ENDPOINT_TIMEOUTS.get(func_name)
+    
     def get_data_source_type(self) -> DataSourceType:
         return DataSourceType.AKSHARE
     
@@ -42,6 +64,31 @@ class AkshareDataSource(DataSource):
             logger.warning(f"Akshare不支持市场: {market_code}")
             return None, None
     
+    def get_stock_prices_batch(self, codes: List[str], market_code: str) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取股票价格：每个市场只下载一次行情快照，快照中没有的代码再逐个获取"""
+        if market_code in ["SH", "SZ", "BJ"]:
+            snapshot = self._get_snapshot("a_stock", self._download_a_stock_snapshot)
+        elif market_code == "US":
+            snapshot = self._get_snapshot("us_stock", self._download_us_stock_snapshot)
+        else:
+            snapshot = {}
+        
+        result = {}
+        missing = []
+        for code in codes:
+            key = code.upper() if market_code == "US" else code
+            if key in snapshot:
+                result[code] = snapshot[key]
+            else:
+                missing.append(code)
+        
+        if missing:
+            logger.info(f"{market_code} 行情快照中缺少 {len(missing)} 只股票，逐个获取")
+            for code in missing:
+                result[code] = self.get_stock_price(code, market_code)
+        
+        return result
+    
     def get_fund_nav(self, code: str, market_code: str = None) -> Tuple[Optional[float], Optional[str]]:
         """获取基金净值"""
         if market_code == "US":
@@ -49,10 +96,32 @@ class AkshareDataSource(DataSource):
         else:
             return self._get_domestic_fund_nav(code)
     
+    def get_fund_navs_batch(self, codes: List[str], market_code: str = None) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取基金净值：国内基金从开放式基金每日净值表中一次获取，表中没有的基金再逐个获取"""
+        if market_code == "US":
+            return {code: self.get_fund_nav(code, market_code) for code in codes}
+        
+        snapshot = self._get_snapshot("open_fund", self._download_fund_snapshot)
+        
+        result = {}
+        missing = []
+        for code in codes:
+            if code in snapshot:
+                result[code] = snapshot[code]
+            else:
+                missing.append(code)
+        
+        if missing:
+            logger.info(f"基金每日净值表中缺少 {len(missing)} 只基金，逐个获取")
+            for code in missing:
+                result[code] = self._get_domestic_fund_nav(code)
+        
+        return result
+    
     def get_exchange_rate(self, currency: str) -> Tuple[Optional[float], Optional[str]]:
         """获取汇率"""
         try:
-            df = self.ak.currency_boc_safe()
+            df = self._fetch("currency_boc_safe", self.ak.currency_boc_safe)
             if df is not None and not df.empty:
                 latest = df.iloc[-1]
                 if currency == "USD":
@@ -75,7 +144,7 @@ class AkshareDataSource(DataSource):
     def get_exchange_rates_batch(self, currencies: List[str]) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
         """批量获取汇率数据"""
         try:
-            df = self.ak.currency_boc_safe()
+            df = self._fetch("currency_boc_safe", self.ak.currency_boc_safe)
             if df is None or df.empty:
                 logger.warning("网络问题获取不到汇率数据")
                 return {}
@@ -110,7 +179,190 @@ class AkshareDataSource(DataSource):
             logger.error(f"批量获取汇率数据时出错: {e}")
             return {}
     
+    def get_stock_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内股票每日收盘价（前复权），一次请求整个区间"""
+        try:
+            if market_code in ["SH", "SZ", "BJ"]:
+                df = self._fetch(
+                    "stock_zh_a_hist", self.ak.stock_zh_a_hist,
+                    symbol=code,
+                    period="daily",
+                    start_date=start_date.replace('-', ''),
+                    end_date=end_date.replace('-', ''),
+                    adjust="qfq"
+                )
+            elif market_code == "US":
+                df = self._fetch(
+                    "stock_us_hist", self.ak.stock_us_hist,
+                    symbol=code.upper(),
+                    period="daily",
+                    start_date=start_date.replace('-', ''),
+                    end_date=end_date.replace('-', ''),
+                    adjust="qfq"
+                )
+            else:
+                logger.warning(f"Akshare不支持市场: {market_code}")
+                return []
+            
+            return self._frame_to_history(df, '日期', '收盘', start_date, end_date)
+        except Exception as e:
+            logger.error(f"获取股票 {code} 历史数据时出错: {e}")
+            return []
+    
+    def get_fund_nav_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内基金每日净值，国内基金接口返回全部历史，按区间截取"""
+        if market_code == "US":
+            return self.get_stock_history(code, "US", start_date, end_date)
+        
+        try:
+            df = self._fetch("fund_open_fund_info_em", self.ak.fund_open_fund_info_em, symbol=code, indicator="单位净值走势")
+            return self._frame_to_history(df, '净值日期', '单位净值', start_date, end_date)
+        except Exception as e:
+            logger.error(f"获取基金 {code} 历史净值时出错: {e}")
+            return []
+    
+    def get_exchange_rate_history(self, currency: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内货币兑换人民币的每日汇率（中行折算价，每100外币）"""
+        column_name = {"USD": "美元", "HKD": "港元"}.get(currency)
+        if column_name is None:
+            logger.warning(f"不支持的币种: {currency}")
+            return []
+        
+        try:
+            df = self._fetch("currency_boc_safe", self.ak.currency_boc_safe)
+            return self._frame_to_history(df, '日期', column_name, start_date, end_date, scale=0.01)
+        except Exception as e:
+            logger.error(f"获取 {currency} 历史汇率时出错: {e}")
+            return []
+    
     # 私有方法
+    def _frame_to_history(self, df, date_column: str, value_column: str, start_date: str, end_date: str,
+                          scale: float = 1.0) -> List[Tuple[str, float]]:
+        """从日线数据中取出 [start_date, end_date] 区间的 [(日期, 数值)]，跳过无效数值"""
+        if df is None or df.empty:
+            return []
+        
+        history = []
+        for date_value, value in zip(df[date_column], df[value_column]):
+            date = date_value.strftime('%Y-%m-%d') if hasattr(date_value, 'strftime') else str(date_value)[:10]
+            if not start_date <= date <= end_date:
+                continue
+            try:
+                value = float(value) * scale
+            except (TypeError, ValueError):
+                continue
+            if value != value:  # NaN
+                continue
+            history.append((date, round(value, 4)))
+        
+        history.sort()
+        return history
+    
+    def _get_snapshot(self, name: str, download) -> Dict[str, Tuple[float, str]]:
+        """获取行情快照，SNAPSHOT_TTL 内重复调用时复用已下载的快照"""
+        with self._snapshot_lock:
+            cached = self._snapshots.get(name)
+            if cached and time.time() - cached[0] < SNAPSHOT_TTL:
+                return cached[1]
+            
+            snapshot = download()
+            if snapshot:
+                self._snapshots[name] = (time.time(), snapshot)
+            return snapshot
+    
+    def _download_a_stock_snapshot(self) -> Dict[str, Tuple[float, str]]:
+        """下载沪深京A股行情快照，返回 {代码: (收盘价, 日期)}
+        
+        交易时段内最新价不是收盘价，改用快照中的昨收价，日期为最近已收盘的交易日
+        """
+        price_column, session_date = self._snapshot_price_column("SH", "最新价", "昨收")
+        try:
+            df = self._fetch("stock_zh_a_spot_em", self.ak.stock_zh_a_spot_em)
+        except Exception as e:
+            logger.warning(f"获取A股行情快照失败: {e}")
+            return {}
+        
+        if df is None or df.empty:
+            return {}
+        if price_column not in df.columns:
+            logger.warning(f"A股行情快照中没有 {price_column} 列")
+            return {}
+        return self._index_snapshot(df['代码'], df[price_column], session_date)
+    
+    def _download_us_stock_snapshot(self) -> Dict[str, Tuple[float, str]]:
+        """下载美股行情快照，返回 {代码: (收盘价, 日期)}
+        
+        盘中最新价不是收盘价，改用快照中的昨收价，日期为最近已收盘的交易日
+        """
+        price_column, session_date = self._snapshot_price_column("US", "最新价", "昨收价")
+        try:
+            df = self._fetch("stock_us_spot_em", self.ak.stock_us_spot_em)
+        except Exception as e:
+            logger.warning(f"获取美股行情快照失败: {e}")
+            return {}
+        
+        if df is None or df.empty:
+            return {}
+        if price_column not in df.columns:
+            logger.warning(f"美股行情快照中没有 {price_column} 列")
+            return {}
+        # 代码格式为 "105.AAPL"，只保留点号后的股票代码
+        codes = [str(code).split('.')[-1].upper() for code in df['代码']]
+        return self._index_snapshot(codes, df[price_column], session_date)
+    
+    def _index_snapshot(self, codes, prices, date: str) -> Dict[str, Tuple[float, str]]:
+        """把快照的代码列和价格列整理为 {代码: (价格, 日期)}，跳过停牌等无价格的行"""
+        snapshot = {}
+        for code, price in zip(codes, prices):
+            try:
+                price = float(price)
+            except (TypeError, ValueError):
+                continue
+            if price != price or price <= 0:  # NaN 或无效价格
+                continue
+            snapshot[str(code)] = (round(price, 4), date)
+        return snapshot
+    
+    def _download_fund_snapshot(self) -> Dict[str, Tuple[float, str]]:
+        """下载开放式基金每日净值表，返回 {基金代码: (单位净值, 净值日期)}
+        
+        表中有最近两个净值日期的 "yyyy-mm-dd-单位净值" 列，优先取较新日期的净值，当日尚未公布时取前一日的
+        """
+        try:
+            df = self._fetch("fund_open_fund_daily_em", self.ak.fund_open_fund_daily_em)
+        except Exception as e:
+            logger.warning(f"获取基金每日净值表失败: {e}")
+            return {}
+        
+        if df is None or df.empty:
+            return {}
+        
+        nav_columns = sorted((str(column)[:10], column) for column in df.columns
+                             if str(column).endswith("-单位净值"))
+        if not nav_columns:
+            logger.warning("基金每日净值表中没有单位净值列")
+            return {}
+        
+        # 先放较早日期的净值，再用较新日期的覆盖
+        snapshot = {}
+        for date, column in nav_columns:
+            snapshot.update(self._index_snapshot(df['基金代码'], df[column], date))
+        return snapshot
+    
+    def _snapshot_price_column(self, market: str, latest_column: str, previous_column: str) -> Tuple[str, str]:
+        """行情快照取价的列和对应的交易日
+        
+        收盘后取最新价；交易时段内最新价还在变化，取昨收价，对应最近一个已收盘的交易日
+        """
+        calendar = get_trading_calendar()
+        session_date = calendar.snapshot_session_date(market)
+        if session_date is not None:
+            return latest_column, session_date
+        
+        previous_date = calendar.last_closed_session(market)
+        logger.info(f"{market} 当前处于交易时段，行情快照改用昨收价（{previous_date}）")
+        return previous_column, previous_date
+    
     def _get_a_stock_price(self, code: str, market_code: str) -> Tuple[Optional[float], Optional[str]]:
         """获取A股股票价格"""
         try:
@@ -146,7 +398,8 @@ class AkshareDataSource(DataSource):
 
             # 方法1: 使用 stock_us_hist
             try:
-                df = self.ak.stock_us_hist(
+                df = self._fetch(
+                    "stock_us_hist", self.ak.stock_us_hist,
                     symbol=code,
                     period="daily",
                     start_date=(datetime.now() - timedelta(days=7)).strftime('%Y%m%d'),
@@ -168,7 +421,7 @@ class AkshareDataSource(DataSource):
             
             # 方法2: 尝试其他接口
             try:
-                df = self.ak.stock_us_daily(symbol=code)
+                df = self._fetch("stock_us_daily", self.ak.stock_us_daily, symbol=code)
                 if df is not None and not df.empty:
                     latest = df.iloc[-1]
                     price = round(float(latest['close']), 4)
@@ -180,7 +433,7 @@ class AkshareDataSource(DataSource):
             
             # 方法3: 使用 stock_zh_a_spot_em 接口（有时可以获取美股）
             try:
-                df = self.ak.stock_zh_a_spot_em()
+                df = self._fetch("stock_zh_a_spot_em", self.ak.stock_zh_a_spot_em)
                 if df is not None and not df.empty:
                     # 查找美股代码（通常以.US结尾或大写字母）
                     for idx, row in df.iterrows():
@@ -199,22 +452,18 @@ class AkshareDataSource(DataSource):
             return None, None
     
     def _get_domestic_fund_nav(self, code: str) -> Tuple[Optional[float], Optional[str]]:
-        """获取国内基金净值"""
+        """获取国内基金净值（下载该基金的净值走势，取最后一行）"""
         try:
-            # 方法1: 使用 fund_em_open_fund_info
-            try:
-                df = self.ak.fund_open_fund_info_em(symbol=code, indicator="单位净值走势")
-                if df is not None and not df.empty:
-                    latest = df.iloc[-1]
-                    nav = round(float(latest['单位净值']), 4)
-                    date = str(latest['净值日期'])
-                    return nav, date
-            except Exception as e1:
-                logger.error(f"基金方法1失败: {e1}")
-           
+            df = self._fetch("fund_open_fund_info_em", self.ak.fund_open_fund_info_em, symbol=code, indicator="单位净值走势")
+            if df is not None and not df.empty:
+                latest = df.iloc[-1]
+                nav = round(float(latest['单位净值']), 4)
+                date = str(latest['净值日期'])
+                return nav, date
+            logger.warning(f"未获取到基金 {code} 的净值数据")
         except Exception as e:
             logger.error(f"获取基金 {code} 数据时出错: {e}")
-            return None, None
+        return None, None
     
     def _get_us_fund_nav(self, code: str) -> Tuple[Optional[float], Optional[str]]:
         """获取美股基金净值"""
@@ -251,7 +500,8 @@ class AkshareDataSource(DataSource):
             yesterday = (datetime.now() - timedelta(days=7)).strftime('%Y%m%d')
             today = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
             
-            df = self.ak.stock_zh_a_hist(
+            df = self._fetch(
+                "stock_zh_a_hist", self.ak.stock_zh_a_hist,
                 symbol=code, 
                 period="daily", 
                 start_date=yesterday,
@@ -272,7 +522,7 @@ class AkshareDataSource(DataSource):
     def _get_stock_price_method2(self, code: str, symbol: str) -> Tuple[Optional[float], Optional[str]]:
         """方法2: 使用 stock_zh_a_daily"""
         try:
-            df = self.ak.stock_zh_a_daily(symbol=symbol, adjust="qfq")
+            df = self._fetch("stock_zh_a_daily", self.ak.stock_zh_a_daily, symbol=symbol, adjust="qfq")
             
             if df is not None and not df.empty:
                 latest = df.iloc[-1]
@@ -4,7 +4,10 @@ import os
 from datetime import datetime
 from typing import Optional, Tuple, List
 
+from config import HTTP_CONNECT_TIMEOUT
+
 from .base_data_source import DataSource, DataSourceType
+from .http_session import get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -51,7 +54,6 @@ class AlphaVantageDataSource(DataSource):
             return None, None
         
         try:
-            import requests
             params = {
                 'function': 'CURRENCY_EXCHANGE_RATE',
                 'from_currency': currency,
@@ -59,8 +61,7 @@ class AlphaVantageDataSource(DataSource):
                 'apikey': self.api_key
             }
             
-            response = requests.get(self.base_url, params=params, timeout=self.timeout)
-            data = response.json()
+            data = self._fetch('CURRENCY_EXCHANGE_RATE', self._request_json, params)
             
             if "Realtime Currency Exchange Rate" in data:
                 exchange_data = data["Realtime Currency Exchange Rate"]
@@ -85,10 +86,23 @@ class AlphaVantageDataSource(DataSource):
             logger.warning("未设置Alpha Vantage API密钥，请在环境变量中设置ALPHA_VANTAGE_API_KEY")
         return api_key
     
+    def _request_json(self, params: dict) -> dict:
+        """请求接口并返回JSON，频率限制等提示信息作为异常抛出，避免被写入缓存
+        
+        使用数据源共享的 HTTP 会话，连接在请求之间复用
+        """
+        session = get_http_session(DataSourceType.ALPHA_VANTAGE.value)
+        response = session.get(self.base_url, params=params, timeout=(HTTP_CONNECT_TIMEOUT, self.timeout))
+        data = response.json()
+        
+        for message_key in ('Note', 'Information', 'Error Message'):
+            if message_key in data:
+                raise ValueError(f"Alpha Vantage返回提示: {data[message_key]}")
+        return data
+    
     def _get_alpha_vantage_data(self, symbol: str, function: str, data_type: str) -> Tuple[Optional[float], Optional[str]]:
         """获取Alpha Vantage数据"""
         try:
-            import requests
             params = {
                 'function': function,
                 'symbol': symbol,
@@ -96,8 +110,7 @@ class AlphaVantageDataSource(DataSource):
                 'outputsize': 'compact'
             }
             
-            response = requests.get(self.base_url, params=params, timeout=self.timeout)
-            data = response.json()
+            data = self._fetch(function, self._request_json, params)
             
             if "Time Series (Daily)" in data:
                 time_series = data["Time Series (Daily)"]
@@ -1,10 +1,11 @@
 # base_data_source.py
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Optional, Tuple, Dict, Any, List
+from typing import Optional, Tuple, Dict, Any, List, Callable
 import logging
 import sys
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -24,16 +25,45 @@ class DataSource(ABC):
         """获取股票最新收盘价和日期"""
         pass
     
+    def get_stock_prices_batch(self, codes: List[str], market_code: str) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取同一市场股票的最新收盘价和日期，返回 {代码: (价格, 日期)}
+        
+        默认逐个调用 get_stock_price，能一次获取整个市场行情的数据源应重写此方法
+        """
+        return {code: self.get_stock_price(code, market_code) for code in codes}
+    
     @abstractmethod
     def get_fund_nav(self, code: str, market_code: str = None) -> Tuple[Optional[float], Optional[str]]:
         """获取基金最新净值和日期"""
         pass
     
+    def get_fund_navs_batch(self, codes: List[str], market_code: str = None) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取同一市场基金的最新净值和日期，返回 {代码: (净值, 日期)}
+        
+        默认逐个调用 get_fund_nav，能一次获取多只基金的数据源应重写此方法
+        """
+        return {code: self.get_fund_nav(code, market_code) for code in codes}
+    
     @abstractmethod
     def get_exchange_rate(self, currency: str) -> Tuple[Optional[float], Optional[str]]:
         """获取货币兑换人民币的汇率和日期"""
         pass
     
+    def get_stock_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取 [start_date, end_date] 区间内股票每日收盘价，返回按日期排序的 [(日期, 价格)]
+        
+        日期格式均为 yyyy-mm-dd；默认不支持历史数据，返回空列表
+        """
+        return []
+    
+    def get_fund_nav_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取 [start_date, end_date] 区间内基金每日净值，返回按日期排序的 [(日期, 净值)]"""
+        return []
+    
+    def get_exchange_rate_history(self, currency: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取 [start_date, end_date] 区间内货币兑换人民币的每日汇率，返回按日期排序的 [(日期, 汇率)]"""
+        return []
+    
     @abstractmethod
     def get_data_source_type(self) -> DataSourceType:
         """获取数据源类型"""
@@ -48,6 +78,62 @@ class DataSource(ABC):
     def get_name(self) -> str:
         """获取数据源名称"""
         pass
+    
+    def _throttle(self):
+        """发出请求前从本数据源的共享限流器取得令牌，当日配额用完时抛出 RateLimitExceeded"""
+        from .rate_limiter import get_rate_limiter
+        get_rate_limiter(self.get_data_source_type().value).acquire()
+    
+    def _fetch(self, func_name: str, func: Callable, *args, **kwargs) -> Any:
+        """通过响应缓存和熔断器调用数据源接口
+        
+        以 (数据源, func_name, 参数) 为缓存键，命中时不发出请求；未命中时先检查该接口的熔断器，
+        已熔断时抛出 CircuitOpenError，否则限流后调用 func(*args, **kwargs)，非空结果写入缓存。
+        REALTIME_ENDPOINTS 中的实时行情接口每次都重新请求，结果不写入缓存
+        """
+        from config import REALTIME_ENDPOINTS
+        from .circuit_breaker import CircuitOpenError, get_circuit_breaker
+        from .response_cache import get_response_cache
+        source_name = self.get_data_source_type().value
+        cache = get_response_cache()
+        cacheable = func_name not in REALTIME_ENDPOINTS.get(source_name, ())
+        key = cache.make_key(source_name, func_name, args, kwargs)
+        if cacheable:
+            hit, value = cache.get(key)
+            if hit:
+                logger.debug(f"缓存命中: {source_name}.{func_name}")
+                return value
+        
+        breaker = get_circuit_breaker(source_name, func_name, self._endpoint_timeout(func_name))
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"数据源接口 {breaker.name} 已熔断")
+        
+        try:
+            self._throttle()
+        except Exception:
+            # 限流或配额用完不是接口故障，放弃本次请求（half_open 时交还探测机会）
+            breaker.release()
+            raise
+        
+        started = time.monotonic()
+        try:
+            value = self._invoke(func, *args, **kwargs)
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.monotonic() - started)
+        
+        if cacheable and value is not None and not (hasattr(value, 'empty') and value.empty):
+            cache.set(key, value)
+        return value
+    
+    def _invoke(self, func: Callable, *args, **kwargs) -> Any:
+        """实际发出请求，数据源可重写以加上超时控制"""
+        return func(*args, **kwargs)
+    
+    def _endpoint_timeout(self, func_name: str) -> Optional[float]:
+        """单独配置了超时的接口返回其超时（秒），熔断器按此判断慢调用；None 为使用默认值"""
+        return None
 
 
 class DataSourceFactory:
@@ -0,0 +1,157 @@
+# circuit_breaker.py
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from config import (CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT,
+                    CIRCUIT_SLOW_CALL_SECONDS, CIRCUIT_LATENCY_WINDOW)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """数据源接口已熔断，请求没有发出"""
+    pass
+
+
+class CircuitBreaker:
+    """单个数据源接口的熔断器
+    
+    - closed: 正常放行，连续失败（含超过 slow_call_seconds 的慢调用）达到 failure_threshold 次后熔断
+    - open: 直接拒绝请求，recovery_timeout 秒后转为 half_open
+    - half_open: 只放行一个探测请求，成功则恢复 closed，失败则重新熔断
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+                 slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+                 latency_window: int = CIRCUIT_LATENCY_WINDOW):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=latency_window)  # 最近成功调用的耗时（秒）
+        self._calls = 0
+        self._failures = 0
+        self._rejected = 0
+    
+    @property
+    def state(self) -> str:
+        """当前状态（冷却时间已过的 open 视为 half_open）"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allow_request(self) -> bool:
+        """是否放行本次请求；half_open 时只放行一个探测请求"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"熔断器 {self.name} 冷却结束，放行探测请求")
+            
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            
+            self._rejected += 1
+            return False
+    
+    def release(self):
+        """放行的请求最终没有发出时调用，half_open 时让出探测机会"""
+        with self._lock:
+            self._probe_in_flight = False
+    
+    def record_success(self, elapsed: float):
+        """记录一次成功调用，慢调用按失败计"""
+        if elapsed > self.slow_call_seconds:
+            logger.warning(f"数据源接口 {self.name} 调用耗时 {elapsed:.1f} 秒，按失败计")
+            self.record_failure()
+            return
+        
+        with self._lock:
+            self._calls += 1
+            self._latencies.append(elapsed)
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self._state != self.CLOSED:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复正常")
+                self._state = self.CLOSED
+    
+    def record_failure(self):
+        """记录一次失败调用，达到阈值或探测失败时熔断"""
+        with self._lock:
+            self._calls += 1
+            self._failures += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"数据源接口 {self.name} 连续失败 {self._consecutive_failures} 次，"
+                                   f"熔断 {self.recovery_timeout} 秒")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """最近成功调用耗时的百分位数（秒），样本不足时返回 None"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        state = self.state
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'state': state,
+                'calls': self._calls,
+                'failures': self._failures,
+                'rejected': self._rejected,
+                'consecutive_failures': self._consecutive_failures,
+                'avg_latency': round(sum(latencies) / len(latencies), 3) if latencies else None
+            }
+
+
+# 每个 (数据源, 接口) 一个熔断器，所有线程和数据源实例共享
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(source_name: str, endpoint: str, slow_call_seconds: Optional[float] = None) -> CircuitBreaker:
+    """获取数据源接口对应的熔断器（单例）；接口名中括号内的参数不区分，如 Ticker(AAPL).history
+    
+    slow_call_seconds 为该接口单独配置的超时，慢调用阈值取它和 CIRCUIT_SLOW_CALL_SECONDS 中较大的一个
+    """
+    name = f"{source_name}.{re.sub(r'[(].*?[)]', '', endpoint)}"
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(name)
+        if breaker is None:
+            breaker = _circuit_breakers[name] = CircuitBreaker(
+                name, slow_call_seconds=max(slow_call_seconds or 0, CIRCUIT_SLOW_CALL_SECONDS))
+        return breaker
+
+
+def get_circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有熔断器的统计信息"""
+    with _circuit_breakers_lock:
+        breakers = list(_circuit_breakers.values())
+    return {breaker.name: breaker.get_stats() for breaker in breakers}
\ No newline at end of file
@@ -1,8 +1,15 @@
 # data_source_manager.py
 import logging
-from typing import Optional, Tuple, Dict, List
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Tuple, Dict, List, Any, Iterator
 from datetime import datetime
 
+from config import (US_DATA_PROVIDER, FETCH_MAX_WORKERS, HEDGED_REQUESTS_ENABLED, HEDGE_MARKETS,
+                    HEDGE_LATENCY_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY, CIRCUIT_LATENCY_WINDOW)
+
 # 修改为相对导入
 from .base_data_source import DataSource, DataSourceType, DataSourceFactory
 
@@ -10,62 +17,66 @@ logger = logging.getLogger(__name__)
 
 
 class DataSourceManager:
-    """数据源管理器 - 智能选择和管理数据源"""
+    """数据源管理器 - 智能选择和管理数据源
+    
+    数据源在第一次使用时才创建（akshare、yfinance 等库导入很慢），创建后缓存复用；
+    创建失败的数据源记录下来，不再重复尝试。
+    """
+    
+    # 数据源的加载顺序，也是列出可用数据源时的顺序
+    SOURCE_TYPES = [DataSourceType.AKSHARE, DataSourceType.YFINANCE, DataSourceType.ALPHA_VANTAGE]
     
     def __init__(self):
-        self.data_sources = {}
+        self.data_sources = {}  # 已创建的数据源
+        self._failed_sources = set()  # 创建失败的数据源类型
+        self._sources_lock = threading.Lock()
         self.us_data_source_preference = None
-        self._init_data_sources()
+        self.interactive = True  # 非交互模式下不询问用户，美股使用 US_DATA_PROVIDER
+        self._us_source_lock = threading.Lock()  # 多个工作线程同时需要美股数据源时只询问一次
+        self.hedged_requests = HEDGED_REQUESTS_ENABLED
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_lock = threading.Lock()
+        self._hedge_stats = {'requests': 0, 'hedged': 0, 'secondary_wins': 0}
+        self._latencies: Dict[str, deque] = {}  # "数据源.方法" -> 最近取得数据的调用耗时（秒）
         logger.info("数据源管理器初始化成功")
     
-    def _init_data_sources(self):
-        """初始化所有可用的数据源"""    
-        # 尝试加载各个数据源
-        data_sources_to_try = [
-            (DataSourceType.AKSHARE, "AkshareDataSource"),
-            (DataSourceType.YFINANCE, "YFinanceDataSource"),
-            (DataSourceType.ALPHA_VANTAGE, "AlphaVantageDataSource"),
-        ]
-        
-        for source_type, class_name in data_sources_to_try:
+    def get_data_source(self, source_type: DataSourceType) -> Optional[DataSource]:
+        """获取指定类型的数据源，第一次使用时创建"""
+        with self._sources_lock:
+            data_source = self.data_sources.get(source_type)
+            if data_source is not None or source_type in self._failed_sources:
+                return data_source
+            
             try:
-                # 动态导入
-                if source_type == DataSourceType.AKSHARE:
-                    from .akshare_data_source import AkshareDataSource
-                    data_source = AkshareDataSource()
-                elif source_type == DataSourceType.YFINANCE:
-                    from .yfinance_data_source import YFinanceDataSource
-                    data_source = YFinanceDataSource()
-                elif source_type == DataSourceType.ALPHA_VANTAGE:
-                    from .alpha_vantage_data_source import AlphaVantageDataSource
-                    data_source = AlphaVantageDataSource()
-                else:
-                    continue
-                    
-                self.data_sources[source_type] = data_source
-                logger.info(f"数据源 {source_type.value} 加载成功")
+                data_source = DataSourceFactory.create_data_source(source_type)
             except ImportError as e:
                 logger.warning(f"数据源 {source_type.value} 导入失败: {e}")
             except Exception as e:
                 logger.warning(f"数据源 {source_type.value} 初始化失败: {e}")
+            
+            if data_source is None:
+                self._failed_sources.add(source_type)
+                return None
+            
+            self.data_sources[source_type] = data_source
+            logger.info(f"数据源 {source_type.value} 加载成功")
+            return data_source
     
     def get_available_data_sources(self, market_code: str = None) -> Dict[DataSourceType, DataSource]:
-        """获取可用的数据源"""
-        if not market_code:
-            return self.data_sources
-        
-        # 过滤支持指定市场的数据源
-        return {
-            source_type: source 
-            for source_type, source in self.data_sources.items()
-            if market_code in source.get_supported_markets()
-        }
+        """获取可用的数据源（会创建所有尚未创建的数据源）"""
+        available_sources = {}
+        for source_type in self.SOURCE_TYPES:
+            source = self.get_data_source(source_type)
+            # 过滤支持指定市场的数据源
+            if source is not None and (not market_code or market_code in source.get_supported_markets()):
+                available_sources[source_type] = source
+        return available_sources
     
     def get_data_source_for_market(self, market_code: str) -> Optional[DataSource]:
         """根据市场获取数据源"""
         # 国内市场使用Akshare
         if market_code in ["SH", "SZ", "BJ", "OF"]:
-            return self.data_sources.get(DataSourceType.AKSHARE)
+            return self.get_data_source(DataSourceType.AKSHARE)
         
         # 美股使用用户设置的数据源
         elif market_code == "US":
@@ -76,11 +87,40 @@ class DataSourceManager:
             return None
     
     def get_us_data_source(self) -> Optional[DataSource]:
-        """获取美股数据源，如果未设置则询问用户"""
-        if self.us_data_source_preference:
-            return self.data_sources.get(self.us_data_source_preference)
+        """获取美股数据源，如果未设置则询问用户（非交互模式下使用默认数据源）"""
+        with self._us_source_lock:
+            if self.us_data_source_preference:
+                return self.get_data_source(self.us_data_source_preference)
+            elif not self.interactive:
+                return self._select_default_us_data_source()
+            else:
+                return self._ask_for_us_data_source()
+    
+    def set_non_interactive(self, us_source: Optional[str] = None):
+        """切换到非交互模式（定时任务使用），美股数据源使用 us_source，未指定时使用 US_DATA_PROVIDER"""
+        self.interactive = False
+        with self._us_source_lock:
+            self.us_data_source_preference = None
+            self._select_default_us_data_source(us_source)
+    
+    def _select_default_us_data_source(self, us_source: Optional[str] = None) -> Optional[DataSource]:
+        """不询问用户，选择指定的美股数据源；不可用时使用第一个可用的美股数据源"""
+        available_sources = self.get_available_data_sources("US")
+        if not available_sources:
+            logger.warning("没有可用的美股数据源")
+            return None
+        
+        preferred = us_source or US_DATA_PROVIDER
+        for source_type in available_sources:
+            if source_type.value == preferred:
+                break
         else:
-            return self._ask_for_us_data_source()
+            source_type = next(iter(available_sources))
+            logger.warning(f"美股数据源 {preferred} 不可用，改用 {source_type.value}")
+        
+        self.us_data_source_preference = source_type
+        logger.info(f"使用美股数据源: {source_type.value}")
+        return available_sources[source_type]
     
     def _ask_for_us_data_source(self) -> Optional[DataSource]:
         """交互式询问用户选择美股数据源"""
@@ -125,39 +165,244 @@ class DataSourceManager:
         self.us_data_source_preference = source_type
         logger.info(f"设置美股数据源偏好为: {source_type.value}")
     
+    def _iter_market_sources(self, market_code: str) -> Iterator[DataSource]:
+        """按优先级列出能获取该市场数据的数据源：首选数据源在前，其余支持该市场的数据源作为备用（用到时才创建）"""
+        primary = self.get_data_source_for_market(market_code)
+        if primary is not None:
+            yield primary
+        for source in self.get_available_data_sources(market_code).values():
+            if source is not primary:
+                yield source
+    
+    @staticmethod
+    def _has_data(result: Any) -> bool:
+        """数据源返回的结果是否包含数据：(值, 日期) 的值不为空，批量结果至少有一项，历史数据不为空"""
+        if isinstance(result, tuple):
+            return result[0] is not None
+        if isinstance(result, dict):
+            return any(value[0] is not None for value in result.values())
+        return bool(result)
+    
+    def _call_source(self, source: DataSource, method_name: str, *args) -> Tuple[bool, Any]:
+        """调用数据源方法，返回 (是否取得数据, 结果)，抛出异常时结果为 None
+        
+        熔断只在数据源接口一级（DataSource._fetch）进行：批量方法在限流时会逐个代码请求，耗时远超单个接口，
+        这里不熔断，只记录取得数据的调用耗时，供对冲请求确定等待时间
+        """
+        name = f"{source.get_data_source_type().value}.{method_name}"
+        started = time.monotonic()
+        try:
+            result = getattr(source, method_name)(*args)
+        except Exception as e:
+            logger.warning(f"{name} 调用失败: {e}")
+            return False, None
+        
+        if self._has_data(result):
+            self._record_latency(name, time.monotonic() - started)
+            return True, result
+        return False, result
+    
+    def _record_latency(self, name: str, elapsed: float):
+        """记录一次取得数据的调用耗时"""
+        with self._hedge_lock:
+            latencies = self._latencies.get(name)
+            if latencies is None:
+                latencies = self._latencies[name] = deque(maxlen=CIRCUIT_LATENCY_WINDOW)
+            latencies.append(elapsed)
+    
+    def _latency_percentile(self, name: str, percentile: float) -> Optional[float]:
+        """最近取得数据的调用耗时的百分位数（秒），没有记录时返回 None"""
+        with self._hedge_lock:
+            latencies = sorted(self._latencies.get(name, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+    
+    def _route(self, market_code: str, method_name: str, *args, default: Any = None) -> Any:
+        """把请求发给该市场的数据源；首选数据源抛出异常或没有返回数据时依次改用下一个可用的数据源
+        
+        批量方法（default 为 {代码: (None, None)}）只把还没有取得数据的代码交给下一个数据源，返回合并后的结果。
+        所有数据源都没有数据时返回最后一个空结果（没有数据源返回结果时为 default）
+        """
+        sources = self._iter_market_sources(market_code)
+        batch = isinstance(default, dict)
+        collected = {}
+        
+        def complete(result: Any) -> bool:
+            """合并取得数据的结果，返回是否已经全部取得；批量方法的参数换成还缺少的代码"""
+            nonlocal args
+            if not batch:
+                return True
+            collected.update((code, value) for code, value in result.items() if value[0] is not None)
+            missing = [code for code in args[0] if code not in collected]
+            args = (missing, *args[1:])
+            return not missing
+        
+        def merged(result: Any) -> Any:
+            return {code: collected.get(code, (None, None)) for code in default} if batch else result
+        
+        if self.hedged_requests and market_code in HEDGE_MARKETS:
+            result = self._hedged_call(sources, method_name, *args)
+            if result is not None and complete(result):
+                return merged(result)
+        
+        empty_result = None
+        for source in sources:
+            has_data, result = self._call_source(source, method_name, *args)
+            if has_data:
+                if complete(result):
+                    return merged(result)
+                logger.info(f"数据源 {source.get_data_source_type().value} 缺少 {len(args[0])} 个代码的数据，"
+                            f"交给下一个数据源")
+                continue
+            if result is not None:
+                empty_result = result
+            logger.info(f"数据源 {source.get_data_source_type().value} 没有返回数据，尝试下一个数据源")
+        
+        if collected:
+            logger.warning(f"市场 {market_code} 的所有数据源都没有返回 {len(args[0])} 个代码的数据")
+            return merged(None)
+        if empty_result is not None:
+            logger.warning(f"市场 {market_code} 的所有数据源都没有返回数据")
+            return empty_result
+        logger.warning(f"没有找到适合市场 {market_code} 的可用数据源")
+        return default
+    
+    def _hedged_call(self, sources: Iterator[DataSource], method_name: str, *args) -> Any:
+        """对冲请求：首选数据源在其耗时百分位内没有返回时，向下一个数据源发出相同请求，取先返回的有效结果
+        
+        没有取得数据（包括数据源返回空结果）时返回 None，由调用方继续尝试剩余的数据源
+        """
+        primary = next(sources, None)
+        if primary is None:
+            return None
+        
+        name = f"{primary.get_data_source_type().value}.{method_name}"
+        delay = self._latency_percentile(name, HEDGE_LATENCY_PERCENTILE)
+        delay = HEDGE_DEFAULT_DELAY if delay is None else max(delay, HEDGE_MIN_DELAY)
+        
+        executor = self._get_hedge_executor()
+        primary_future = executor.submit(self._call_source, primary, method_name, *args)
+        self._count_hedge('requests')
+        done, _ = wait([primary_future], timeout=delay)
+        secondary = None if done else next(sources, None)
+        if secondary is None:
+            has_data, result = primary_future.result()
+            return result if has_data else None
+        
+        logger.info(f"{name} 超过 {delay:.2f} 秒未返回，同时请求 {secondary.get_data_source_type().value}")
+        self._count_hedge('hedged')
+        secondary_future = executor.submit(self._call_source, secondary, method_name, *args)
+        pending = {primary_future, secondary_future}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                has_data, result = future.result()
+                if has_data:
+                    # 较慢的请求继续在后台完成，结果只用于耗时统计
+                    if future is secondary_future:
+                        self._count_hedge('secondary_wins')
+                    return result
+        return None
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        """对冲请求使用的线程池，第一次使用时创建"""
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS * 2,
+                                                          thread_name_prefix="HedgedRequest")
+            return self._hedge_executor
+    
+    def _count_hedge(self, key: str):
+        """累加对冲请求统计"""
+        with self._hedge_lock:
+            self._hedge_stats[key] += 1
+    
+    def get_hedge_stats(self) -> Dict[str, int]:
+        """获取对冲请求统计：经对冲路由的请求数、发出备用请求的次数、备用数据源先返回的次数"""
+        with self._hedge_lock:
+            return dict(self._hedge_stats)
+    
     def get_stock_price(self, code: str, market_code: str) -> Tuple[Optional[float], Optional[str]]:
         """获取股票价格"""
-        data_source = self.get_data_source_for_market(market_code)
-        if data_source:
-            return data_source.get_stock_price(code, market_code)
-        
-        logger.warning(f"没有找到适合市场 {market_code} 的数据源")
-        return None, None
+        return self._route(market_code, "get_stock_price", code, market_code, default=(None, None))
     
+    def get_stock_prices_batch(self, codes: List[str], market_code: str) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取同一市场的股票价格"""
+        return self._route(market_code, "get_stock_prices_batch", codes, market_code,
+                           default={code: (None, None) for code in codes})
+
     def get_fund_nav(self, code: str, market_code: str = None) -> Tuple[Optional[float], Optional[str]]:
         """获取基金净值"""
         if not market_code:
             market_code = self._guess_market_from_code(code)
         
-        data_source = self.get_data_source_for_market(market_code)
-        if data_source:
-            return data_source.get_fund_nav(code, market_code)
-        
-        logger.warning(f"没有找到适合市场 {market_code} 的数据源")
-        return None, None
+        return self._route(market_code, "get_fund_nav", code, market_code, default=(None, None))
     
+    def get_fund_navs_batch(self, codes: List[str], market_code: str = None) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取同一市场的基金净值"""
+        if not market_code:
+            # 未指定市场时按代码猜测市场后分组获取
+            codes_by_market = {}
+            for code in codes:
+                codes_by_market.setdefault(self._guess_market_from_code(code), []).append(code)
+
+            result = {}
+            for guessed_market, market_codes in codes_by_market.items():
+                result.update(self.get_fund_navs_batch(market_codes, guessed_market))
+            return result
+
+        return self._route(market_code, "get_fund_navs_batch", codes, market_code,
+                           default={code: (None, None) for code in codes})
+
+    def get_stock_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内股票每日收盘价"""
+        return self._route(market_code, "get_stock_history", code, market_code, start_date, end_date, default=[])
+
+    def get_fund_nav_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内基金每日净值"""
+        if not market_code:
+            market_code = self._guess_market_from_code(code)
+
+        return self._route(market_code, "get_fund_nav_history", code, market_code, start_date, end_date, default=[])
+
+    def get_exchange_rate_history(self, currency: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内每日汇率"""
+        for source_type in [DataSourceType.AKSHARE, DataSourceType.ALPHA_VANTAGE]:
+            data_source = self.get_data_source(source_type)
+            if not data_source:
+                continue
+            has_data, history = self._call_source(data_source, "get_exchange_rate_history", currency, start_date, end_date)
+            if has_data:
+                return history
+
+        logger.warning(f"没有数据源能获取 {currency} 的历史汇率")
+        return []
+
+    def get_exchange_rate(self, currency: str) -> Tuple[Optional[float], Optional[str]]:
+        """获取单个货币汇率"""
+        # 汇率数据优先使用Akshare，其次是其他提供汇率的数据源
+        for source_type in [DataSourceType.AKSHARE, DataSourceType.ALPHA_VANTAGE]:
+            data_source = self.get_data_source(source_type)
+            if not data_source:
+                continue
+            has_data, result = self._call_source(data_source, "get_exchange_rate", currency)
+            if has_data and result[1] is not None:
+                return result
+
+        logger.warning(f"没有数据源能获取 {currency} 的汇率")
+        return None, None
+
     def get_exchange_rates_batch(self, currencies: List[str]) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
         """批量获取汇率"""
         # 优先使用Akshare批量获取
-        akshare_source = self.data_sources.get(DataSourceType.AKSHARE)
+        akshare_source = self.get_data_source(DataSourceType.AKSHARE)
         if akshare_source and hasattr(akshare_source, 'get_exchange_rates_batch'):
-            try:
-                result = akshare_source.get_exchange_rates_batch(currencies)
-                # 检查是否所有币种都获取成功
-                if result and any(rate[0] is not None for rate in result.values()):
-                    return result
-            except Exception as e:
-                logger.warning(f"Akshare批量获取汇率失败: {e}")
+            # 至少有一种货币获取成功时使用批量结果
+            has_data, result = self._call_source(akshare_source, "get_exchange_rates_batch", currencies)
+            if has_data and result:
+                return result
+            logger.warning("Akshare批量获取汇率失败")
         
         # 如果批量获取失败，回退到逐个获取
         result = {}
@@ -195,7 +440,7 @@ class DataSourceManager:
     def get_data_source_info(self) -> Dict[str, List[str]]:
         """获取所有数据源信息"""
         info = {}
-        for source_type, source in self.data_sources.items():
+        for source_type, source in self.get_available_data_sources().items():
             info[source.get_name()] = {
                 'type': source_type.value,
                 'supported_markets': source.get_supported_markets()
@@ -244,7 +489,7 @@ class DataSourceManager:
     def get_current_us_data_source_info(self) -> str:
         """获取当前美股数据源信息"""
         if self.us_data_source_preference:
-            data_source = self.data_sources.get(self.us_data_source_preference)
+            data_source = self.get_data_source(self.us_data_source_preference)
             if data_source:
                 return f"当前美股数据源: {data_source.get_name()}"
         return "当前未设置美股数据源"
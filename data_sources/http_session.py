@@ -0,0 +1,192 @@
+# http_session.py
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_MAXSIZE
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """数据源调用超过了截止时间"""
+    pass
+
+
+class HttpSessionPool:
+    """单个数据源共享的 HTTP 会话
+
+    所有线程共用一个 requests.Session，keep-alive 连接保存在连接池中复用；每个主机最多
+    pool_maxsize 个连接，连接都在使用中时请求排队等待。每个请求都带 (连接, 读取) 超时。
+    requests 在第一次请求时才导入。
+    """
+
+    def __init__(self, name: str, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT):
+        self.name = name
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._requests = 0
+        self._errors = 0
+        self._timeouts = 0
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            timeout: Optional[Tuple[float, float]] = None, **kwargs):
+        """发送 GET 请求，未指定 timeout 时使用 (connect_timeout, read_timeout)"""
+        import requests
+
+        session = self._get_session()
+        with self._lock:
+            self._requests += 1
+        try:
+            return session.get(url, params=params, timeout=timeout or (self.connect_timeout, self.read_timeout), **kwargs)
+        except requests.Timeout:
+            with self._lock:
+                self._timeouts += 1
+            raise
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息：请求数、超时数、其他错误数、新建连接数和复用连接的请求数"""
+        connections = 0
+        pooled_requests = 0
+        with self._lock:
+            if self._adapter is not None:
+                pools = self._adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        pooled_requests += pool.num_requests
+            return {
+                'requests': self._requests,
+                'timeouts': self._timeouts,
+                'errors': self._errors,
+                'connections_created': connections,
+                'connections_reused': max(0, pooled_requests - connections),
+            }
+
+    def close(self):
+        """关闭会话和连接池中的连接"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+                self._adapter = None
+
+    def _get_session(self):
+        """第一次使用时创建会话"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize, pool_block=True)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session, self._adapter = session, adapter
+                logger.debug(f"数据源 {self.name} 的 HTTP 会话已创建，连接池大小 {self.pool_maxsize}")
+            return self._session
+
+
+class DeadlineRunner:
+    """给不能传入超时参数的阻塞调用（如 akshare 接口）加上截止时间
+
+    调用在守护线程中执行，超过截止时间后抛出 DeadlineExceeded，工作线程不再等待；
+    超时的调用只是被放弃而不是被取消，仍在后台运行直至自行结束（期间继续占用连接），不会阻止程序退出。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._timeouts = 0
+        self._abandoned = 0  # 已超时但还没结束的调用数
+
+    def run(self, timeout: float, func: Callable, *args, **kwargs) -> Any:
+        """执行 func(*args, **kwargs)，超过 timeout 秒时抛出 DeadlineExceeded"""
+        outcome = {}
+        finished = threading.Event()
+
+        def target():
+            try:
+                outcome['value'] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                with self._lock:
+                    finished.set()
+                    if outcome.get('abandoned'):
+                        self._abandoned -= 1
+
+        with self._lock:
+            self._calls += 1
+        threading.Thread(target=target, name=f"{self.name}-deadline", daemon=True).start()
+
+        if not finished.wait(timeout):
+            with self._lock:
+                # 与 target 的 finally 竞争：已经结束的调用不算被放弃
+                if not finished.is_set():
+                    outcome['abandoned'] = True
+                    self._abandoned += 1
+                    self._timeouts += 1
+            if outcome.get('abandoned'):
+                raise DeadlineExceeded(f"数据源 {self.name} 调用 {getattr(func, '__name__', func)} 超过 {timeout} 秒未返回")
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['value']
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取统计信息：调用数、超时数、超时后仍在运行的调用数"""
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'timeouts': self._timeouts,
+                'abandoned_running': self._abandoned,
+            }
+
+
+# 每个数据源一个会话和一个截止时间执行器，所有线程和数据源实例共享
+_sessions: Dict[str, HttpSessionPool] = {}
+_deadline_runners: Dict[str, DeadlineRunner] = {}
+_registry_lock = threading.Lock()
+
+
+def get_http_session(source_name: str) -> HttpSessionPool:
+    """获取数据源对应的 HTTP 会话（单例）"""
+    with _registry_lock:
+        session = _sessions.get(source_name)
+        if session is None:
+            session = _sessions[source_name] = HttpSessionPool(source_name)
+        return session
+
+
+def get_deadline_runner(source_name: str) -> DeadlineRunner:
+    """获取数据源对应的截止时间执行器（单例）"""
+    with _registry_lock:
+        runner = _deadline_runners.get(source_name)
+        if runner is None:
+            runner = _deadline_runners[source_name] = DeadlineRunner(source_name)
+        return runner
+
+
+def get_http_metrics() -> Dict[str, Dict[str, Any]]:
+    """获取所有数据源的连接池和超时统计"""
+    with _registry_lock:
+        sessions = dict(_sessions)
+        runners = dict(_deadline_runners)
+    metrics = {}
+    for name, session in sessions.items():
+        metrics.setdefault(name, {})['http'] = session.get_stats()
+    for name, runner in runners.items():
+        metrics.setdefault(name, {})['deadline'] = runner.get_stats()
+    return metrics
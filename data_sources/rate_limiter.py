@@ -0,0 +1,83 @@
+# rate_limiter.py
+import logging
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from config import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """数据源当日请求配额已用完"""
+    pass
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器
+
+    令牌按 rate 个/秒补充，最多积攒 burst 个；取不到令牌时预占令牌并在锁外等待，
+    多个线程按到达顺序依次放行。可选的 daily_quota 限制每个自然日的请求总数。
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = 1, daily_quota: Optional[int] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._quota_date = date.today()
+        self._used_today = 0
+
+    def acquire(self, tokens: int = 1) -> float:
+        """取得令牌，必要时等待；返回等待的秒数。当日配额用完时抛出 RateLimitExceeded"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+
+            if self.daily_quota is not None:
+                today = date.today()
+                if today != self._quota_date:
+                    self._quota_date = today
+                    self._used_today = 0
+                if self._used_today + tokens > self.daily_quota:
+                    raise RateLimitExceeded(f"数据源 {self.name} 今日请求配额 {self.daily_quota} 次已用完")
+                self._used_today += tokens
+
+            # 预占令牌，令牌为负时表示排在前面的请求还需等待的量
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            logger.debug(f"数据源 {self.name} 请求限流，等待 {wait:.2f} 秒")
+            time.sleep(wait)
+        return wait
+
+    def get_remaining_quota(self) -> Optional[int]:
+        """获取当日剩余配额，不限配额时返回 None"""
+        if self.daily_quota is None:
+            return None
+        with self._lock:
+            if date.today() != self._quota_date:
+                return self.daily_quota
+            return self.daily_quota - self._used_today
+
+
+# 每个数据源一个限流器，所有线程和数据源实例共享
+_rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(source_name: str) -> TokenBucket:
+    """获取数据源对应的限流器（按 DataSourceType 的值区分，单例）"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(source_name)
+        if limiter is None:
+            limits = RATE_LIMITS.get(source_name, RATE_LIMITS["default"])
+            limiter = _rate_limiters[source_name] = TokenBucket(source_name, **limits)
+        return limiter
@@ -0,0 +1,145 @@
+# response_cache.py
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import ENABLE_CACHE, CACHE_DURATION, CACHE_DIR, CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """数据源接口返回结果的磁盘缓存
+
+    每条结果连同写入时间以 pickle 文件保存在 cache_dir 下，文件名为 (数据源, 接口, 参数)
+    的 sha256；超过 ttl 秒的结果视为过期。读取命中时刷新文件修改时间，总大小超过 max_size 时
+    按修改时间淘汰最久未使用的文件。写入先写临时文件再改名，中断时不会留下半个文件。
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, ttl: int = CACHE_DURATION,
+                 max_size: int = CACHE_MAX_SIZE, enabled: bool = ENABLE_CACHE):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(source: str, func_name: str, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> str:
+        """根据数据源、接口名和参数生成缓存键"""
+        kwargs = kwargs or {}
+        raw = repr((source, func_name, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, ttl: Optional[int] = None) -> Tuple[bool, Any]:
+        """读取缓存，返回 (是否命中, 结果)"""
+        if not self.enabled:
+            return False, None
+
+        path = self._path(key)
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            with open(path, "rb") as f:
+                written_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            logger.warning(f"读取缓存文件 {path.name} 失败: {e}")
+            return False, None
+
+        # 以写入时间判断是否过期，文件修改时间只用于淘汰顺序
+        if time.time() - written_at > ttl:
+            return False, None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, value
+
+    def set(self, key: str, value: Any):
+        """写入缓存（先写临时文件再原子改名）"""
+        if not self.enabled:
+            return
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".pkl")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((time.time(), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"写入缓存失败: {e}")
+            return
+
+        self._evict()
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的文件数"""
+        removed = 0
+        for path in self.cache_dir.glob("*.pkl"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _path(self, key: str) -> Path:
+        """缓存键对应的文件路径"""
+        return self.cache_dir / f"{key}.pkl"
+
+    def _evict(self):
+        """总大小超过上限时，按修改时间删除最久未使用的文件"""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for path in self.cache_dir.glob("*.pkl"):
+                if path.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            if total <= self.max_size:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except FileNotFoundError:
+                    total -= size
+                except OSError as e:
+                    logger.warning(f"删除缓存文件 {path.name} 失败: {e}")
+            logger.debug(f"缓存淘汰完成，当前大小 {total} 字节")
+
+
+# 全局响应缓存实例
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取响应缓存实例（单例模式）"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,230 @@
+# trading_calendar.py
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from config import MARKET_SESSIONS, CALENDAR_CACHE_DURATION, AKSHARE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# 资产类别对应的默认市场（资产没有市场代码时使用）
+DEFAULT_MARKETS = {"stock": "SH", "fund": "OF", "fx": "FX"}
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """某月第 n 个星期几（n 为 -1 时表示最后一个）"""
+    if n > 0:
+        day = date(year, month, 1)
+        day += timedelta(days=(weekday - day.weekday()) % 7)
+        return day + timedelta(weeks=n - 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    day = next_month - timedelta(days=1)
+    return day - timedelta(days=(day.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """复活节日期（公历，Anonymous Gregorian 算法）"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    """节日逢周六提前到周五、逢周日顺延到周一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year: int) -> Set[date]:
+    """纽约证券交易所全天休市日（按规则计算）"""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),          # 马丁·路德·金纪念日
+        _nth_weekday(year, 2, 0, 3),          # 总统日
+        _easter(year) - timedelta(days=2),    # 耶稣受难日
+        _nth_weekday(year, 5, 0, -1),         # 阵亡将士纪念日
+        _observed(date(year, 7, 4)),          # 独立日
+        _nth_weekday(year, 9, 0, 1),          # 劳动节
+        _nth_weekday(year, 11, 3, 4),         # 感恩节
+        _observed(date(year, 12, 25)),        # 圣诞节
+    }
+    # 元旦逢周六时不在前一年的12月31日补休
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # 六月节
+    return holidays
+
+
+class TradingCalendar:
+    """各市场交易日历
+
+    - CN: 沪深京交易所日历（新浪交易日历，经响应缓存长期保存），场外基金和汇率也按此日历
+    - NYSE: 美股按规则计算的休市日
+    - WEEKDAY: 只排除周末（港股假期按农历确定，暂按工作日估算）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cn_dates: Optional[Set[str]] = None
+        self._nyse_holidays: Dict[int, Set[date]] = {}
+
+    def is_trading_day(self, market: str, day: date) -> bool:
+        """是否为该市场的交易日"""
+        calendar = self._session(market)["calendar"]
+        if day.weekday() >= 5:
+            return False
+        if calendar == "NYSE":
+            holidays = self._nyse_holidays.get(day.year)
+            if holidays is None:
+                holidays = self._nyse_holidays[day.year] = nyse_holidays(day.year)
+            return day not in holidays
+        if calendar == "CN":
+            cn_dates = self._get_cn_dates()
+            # 日历获取失败或超出日历范围时按工作日估算
+            if cn_dates and min(cn_dates) <= day.isoformat() <= max(cn_dates):
+                return day.isoformat() in cn_dates
+        return True
+
+    def previous_trading_day(self, market: str, day: date) -> date:
+        """day 之前（不含）最近的交易日"""
+        day -= timedelta(days=1)
+        while not self.is_trading_day(market, day):
+            day -= timedelta(days=1)
+        return day
+
+    def trading_days(self, market: str, start: date, end: date) -> List[str]:
+        """start 到 end（均含）之间该市场的交易日（yyyy-mm-dd），按日期排序"""
+        days = []
+        day = start
+        while day <= end:
+            if self.is_trading_day(market, day):
+                days.append(day.isoformat())
+            day += timedelta(days=1)
+        return days
+    
+    def last_closed_session(self, market: str, now: Optional[datetime] = None) -> str:
+        """最近一个已经收盘的交易日（yyyy-mm-dd），该日的数据不会再变化"""
+        session = self._session(market)
+        now = self._local_now(market, now)
+        today = now.date()
+        if self.is_trading_day(market, today) and now.time() >= session["close"]:
+            return today.isoformat()
+        return self.previous_trading_day(market, today).isoformat()
+
+    def snapshot_session_date(self, market: str, now: Optional[datetime] = None) -> Optional[str]:
+        """行情快照对应的交易日：交易时段内快照不是收盘价，返回 None；其余时间为最近已收盘的交易日"""
+        session = self._session(market)
+        now = self._local_now(market, now)
+        if self.is_trading_day(market, now.date()) and session["open"] <= now.time() < session["close"]:
+            return None
+        return self.last_closed_session(market, now)
+
+    def _session(self, market: str) -> Dict[str, Any]:
+        """市场交易时段配置，开收盘时间解析为 time"""
+        config = MARKET_SESSIONS.get(market)
+        if config is None:
+            raise ValueError(f"未配置交易时段的市场: {market}")
+        return {
+            "tz": config["tz"],
+            "calendar": config["calendar"],
+            "open": time.fromisoformat(config["open"]),
+            "close": time.fromisoformat(config["close"]),
+        }
+
+    def _local_now(self, market: str, now: Optional[datetime]) -> datetime:
+        """转换为市场当地时间"""
+        tz = ZoneInfo(MARKET_SESSIONS[market]["tz"])
+        return now.astimezone(tz) if now is not None else datetime.now(tz)
+
+    def _get_cn_dates(self) -> Optional[Set[str]]:
+        """沪深京交易日集合，首次使用时加载"""
+        with self._lock:
+            if self._cn_dates is None:
+                self._cn_dates = self._load_cn_dates()
+            return self._cn_dates
+
+    def _load_cn_dates(self) -> Set[str]:
+        """从新浪交易日历加载交易日；与 Akshare 数据源共用同一个缓存键，CALENDAR_CACHE_DURATION 内不重复下载"""
+        from .http_session import get_deadline_runner
+        from .rate_limiter import get_rate_limiter
+        from .response_cache import get_response_cache
+
+        cache = get_response_cache()
+        key = cache.make_key("akshare", "tool_trade_date_hist_sina", (), {})
+        hit, df = cache.get(key, ttl=CALENDAR_CACHE_DURATION)
+        if not hit:
+            try:
+                import akshare as ak
+                get_rate_limiter("akshare").acquire()
+                df = get_deadline_runner("akshare").run(AKSHARE_TIMEOUT, ak.tool_trade_date_hist_sina)
+            except Exception as e:
+                logger.warning(f"获取A股交易日历失败，按工作日估算: {e}")
+                return set()
+            if df is not None and not df.empty:
+                cache.set(key, df)
+
+        if df is None or df.empty:
+            return set()
+        return {str(d)[:10] for d in df['trade_date']}
+
+
+def asset_market(kind: str, asset: Dict[str, Any]) -> str:
+    """资产所在的市场：汇率按 FX，没有市场代码的资产使用该类别的默认市场"""
+    return DEFAULT_MARKETS[kind] if kind == "fx" else asset.get('market_code') or DEFAULT_MARKETS[kind]
+
+
+def plan_stale_assets(kind: str, assets: List[Dict[str, Any]], now: Optional[datetime] = None,
+                      calendar: Optional["TradingCalendar"] = None,
+                      provisional: Optional[Dict[int, str]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """按市场最近已收盘的交易日划分资产，返回 (需要获取的资产, 已是最新的资产)
+
+    assets 为 get_latest_values 的结果（含 market_code 和最新已存 date）；
+    已存日期不早于该市场最近已收盘交易日的资产，再次请求也不会得到新数据。provisional 为最新数值还是盘中
+    临时数值的资产 {资产ID: 日期}，这些资产不跳过，重新获取收盘值覆盖临时数值
+    """
+    provisional = provisional or {}
+    calendar = calendar or get_trading_calendar()
+    expected: Dict[str, str] = {}
+    stale, up_to_date = [], []
+
+    for asset in assets:
+        market = asset_market(kind, asset)
+        latest_date = asset.get('date')
+        if not latest_date or market not in MARKET_SESSIONS or asset.get('id') in provisional:
+            stale.append(asset)
+            continue
+
+        if market not in expected:
+            expected[market] = calendar.last_closed_session(market, now)
+        if str(latest_date)[:10] >= expected[market]:
+            up_to_date.append(asset)
+        else:
+            stale.append(asset)
+
+    return stale, up_to_date
+
+
+# 全局交易日历实例
+_trading_calendar: Optional[TradingCalendar] = None
+
+
+def get_trading_calendar() -> TradingCalendar:
+    """获取交易日历实例（单例模式）"""
+    global _trading_calendar
+    if _trading_calendar is None:
+        _trading_calendar = TradingCalendar()
+    return _trading_calendar
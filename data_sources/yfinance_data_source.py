@@ -2,10 +2,15 @@
 import logging
 import time
 from datetime import datetime, timedelta
-from typing import Optional, Tuple, List
-import pandas as pd
+from typing import Optional, Tuple, List, Dict, TYPE_CHECKING
+
+from config import YFINANCE_BATCH_CHUNK_SIZE, YFINANCE_BATCH_PERIOD, HTTP_READ_TIMEOUT
 
 from .base_data_source import DataSource, DataSourceType
+from .circuit_breaker import CircuitOpenError
+
+if TYPE_CHECKING:
+    import pandas as pd  # 只用于类型注解，pandas 随 yfinance 在使用时才导入
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +24,6 @@ class YFinanceDataSource(DataSource):
             self.yf = yf
             self.max_retries = max_retries
             self.retry_delay = retry_delay
-            self.request_delay = 1
-            self.last_request_time = 0
             logger.info("YFinance 数据源初始化成功")
         except ImportError:
             logger.error("请先安装 yfinance 库: pip install yfinance")
@@ -29,6 +32,11 @@ class YFinanceDataSource(DataSource):
     def get_name(self) -> str:
         return "YFinance (专业美股数据)"
     
+    def _invoke(self, func, *args, **kwargs):
+        """yfinance 的 download 和 history 都接受 timeout 参数，默认使用 HTTP_READ_TIMEOUT"""
+        kwargs.setdefault('timeout', HTTP_READ_TIMEOUT)
+        return func(*args, **kwargs)
+    
     def get_data_source_type(self) -> DataSourceType:
         return DataSourceType.YFINANCE
     
@@ -51,6 +59,38 @@ class YFinanceDataSource(DataSource):
         
         return self._get_us_security_price(code, "基金")
     
+    def get_stock_prices_batch(self, codes: List[str], market_code: str) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取股票价格（仅支持美股）"""
+        if market_code != "US":
+            logger.warning(f"YFinance仅支持美股，不支持市场: {market_code}")
+            return {code: (None, None) for code in codes}
+        
+        return self._get_us_security_prices_batch(codes, "股票")
+    
+    def get_fund_navs_batch(self, codes: List[str], market_code: str = None) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """批量获取基金净值（仅支持美股ETF）"""
+        if market_code != "US":
+            logger.warning(f"YFinance仅支持美股基金，不支持市场: {market_code}")
+            return {code: (None, None) for code in codes}
+        
+        return self._get_us_security_prices_batch(codes, "基金")
+    
+    def get_stock_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内股票每日收盘价（仅支持美股）"""
+        if market_code != "US":
+            logger.warning(f"YFinance仅支持美股，不支持市场: {market_code}")
+            return []
+        
+        return self._get_us_security_history(code, start_date, end_date)
+    
+    def get_fund_nav_history(self, code: str, market_code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """获取区间内基金每日净值（仅支持美股ETF）"""
+        if market_code != "US":
+            logger.warning(f"YFinance仅支持美股基金，不支持市场: {market_code}")
+            return []
+        
+        return self._get_us_security_history(code, start_date, end_date)
+    
     def get_exchange_rate(self, currency: str) -> Tuple[Optional[float], Optional[str]]:
         """获取汇率（YFinance不提供汇率数据）"""
         logger.warning("YFinance不提供汇率数据，请使用其他数据源")
@@ -64,20 +104,21 @@ class YFinanceDataSource(DataSource):
                 if self.yf is None:
                     return None, None
                 
-                # 请求限流
-                self._throttle_request()
-                
                 ticker = self.yf.Ticker(code)
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=30)
+                # 起止日期取到天，同一天内的重复请求可以命中缓存；结束日期不含当天，故取明天
+                end_date = datetime.now() + timedelta(days=1)
+                start_date = end_date - timedelta(days=31)
                 
-                hist = ticker.history(start=start_date, end=end_date, auto_adjust=False)
+                hist = self._fetch(f"Ticker({code}).history", ticker.history,
+                                   start=start_date.strftime('%Y-%m-%d'), end=end_date.strftime('%Y-%m-%d'),
+                                   auto_adjust=False)
                 
                 if hist.empty:
                     logger.warning(f"未找到 {code} 的历史数据")
-                    start_date = end_date - timedelta(days=365)
-                    self._throttle_request()
-                    hist = ticker.history(start=start_date, end=end_date, auto_adjust=False)
+                    start_date = end_date - timedelta(days=366)
+                    hist = self._fetch(f"Ticker({code}).history", ticker.history,
+                                       start=start_date.strftime('%Y-%m-%d'), end=end_date.strftime('%Y-%m-%d'),
+                                       auto_adjust=False)
                 
                 if not hist.empty:
                     latest = hist.iloc[-1]
@@ -94,20 +135,17 @@ class YFinanceDataSource(DataSource):
                         else:
                             return None, None
                     
-                    date_index = hist.index[-1]
-                    if isinstance(date_index, pd.Timestamp):
-                        date = date_index.strftime('%Y-%m-%d')
-                    elif hasattr(date_index, 'strftime'):
-                        date = date_index.strftime('%Y-%m-%d')
-                    else:
-                        date_str = str(date_index)
-                        date = date_str.split()[0] if ' ' in date_str else date_str
+                    date = self._format_date(hist.index[-1])
                     
                     logger.info(f"通过YFinance获取{security_type} {code} 成功: {date} 价格 ${price}")
                     return price, date
                 else:
                     return None, None
                     
+            except CircuitOpenError as e:
+                # 接口已熔断，重试只会白白等待
+                logger.warning(f"获取 {code} 数据跳过: {e}")
+                return None, None
             except Exception as e:
                 error_msg = str(e).lower()
                 
@@ -129,14 +167,108 @@ class YFinanceDataSource(DataSource):
         
         return None, None
     
-    def _throttle_request(self):
-        """请求限流"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+    def _get_us_security_history(self, code: str, start_date: str, end_date: str) -> List[Tuple[str, float]]:
+        """一次请求下载区间内的日线，返回 [(日期, 收盘价)]"""
+        if self.yf is None:
+            return []
+        
+        try:
+            # history 的结束日期不包含当天，故多取一天
+            end = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            ticker = self.yf.Ticker(code)
+            hist = self._fetch(f"Ticker({code}).history", ticker.history,
+                               start=start_date, end=end, auto_adjust=False)
+        except Exception as e:
+            logger.error(f"获取 {code} 历史数据时出错: {e}")
+            return []
+        
+        if hist is None or hist.empty or 'Close' not in hist.columns:
+            return []
+        
+        history = []
+        for date_index, price in hist['Close'].dropna().items():
+            date = self._format_date(date_index)
+            if start_date <= date <= end_date:
+                history.append((date, round(float(price), 4)))
+        return history
+    
+    def _get_us_security_prices_batch(self, codes: List[str], security_type: str) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """分块批量下载美股证券价格，批量结果中缺失的代码再逐个获取"""
+        result = {}
+        if self.yf is None:
+            return {code: (None, None) for code in codes}
+        
+        for start in range(0, len(codes), YFINANCE_BATCH_CHUNK_SIZE):
+            chunk = codes[start:start + YFINANCE_BATCH_CHUNK_SIZE]
+            result.update(self._download_prices_chunk(chunk, security_type))
         
-        if time_since_last < self.request_delay:
-            sleep_time = self.request_delay - time_since_last
-            logger.debug(f"请求限流，等待 {sleep_time:.2f} 秒")
-            time.sleep(sleep_time)
+        missing = [code for code in codes if code not in result]
+        if missing:
+            logger.info(f"批量下载中缺少 {len(missing)} 只{security_type}，逐个获取")
+            for code in missing:
+                result[code] = self._get_us_security_price(code, security_type)
         
-        self.last_request_time = time.time()
\ No newline at end of file
+        return result
+    
+    def _download_prices_chunk(self, chunk: List[str], security_type: str) -> Dict[str, Tuple[float, str]]:
+        """一次请求下载一组代码的日线，从合并的结果中取出每个代码最后一个收盘价"""
+        try:
+            df = self._fetch(
+                "download", self.yf.download,
+                tickers=chunk,
+                period=YFINANCE_BATCH_PERIOD,
+                interval="1d",
+                group_by="ticker",
+                auto_adjust=False,
+                threads=True,
+                progress=False
+            )
+        except Exception as e:
+            logger.warning(f"批量下载 {len(chunk)} 只{security_type}失败: {e}")
+            return {}
+        
+        if df is None or df.empty:
+            return {}
+        
+        result = {}
+        for code in chunk:
+            close = self._extract_close_series(df, code, len(chunk))
+            if close is None:
+                continue
+            close = close.dropna()
+            if close.empty:
+                continue
+            
+            price = round(float(close.iloc[-1]), 4)
+            date = self._format_date(close.index[-1])
+            result[code] = (price, date)
+            logger.info(f"通过YFinance批量获取{security_type} {code} 成功: {date} 价格 ${price}")
+        
+        return result
+    
+    def _extract_close_series(self, df: "pd.DataFrame", code: str, chunk_size: int) -> Optional["pd.Series"]:
+        """从批量下载的结果中取出指定代码的收盘价序列"""
+        if df.columns.nlevels > 1:
+            for level in range(df.columns.nlevels):
+                if code in df.columns.get_level_values(level):
+                    frame = df.xs(code, axis=1, level=level)
+                    break
+            else:
+                return None
+        elif chunk_size == 1:
+            frame = df
+        else:
+            return None
+        
+        for price_field in ['Close', 'close', 'Adj Close']:
+            if price_field in frame.columns:
+                return frame[price_field]
+        return None
+    
+    def _format_date(self, date_index) -> str:
+        """把行索引格式化为 yyyy-mm-dd"""
+        if hasattr(date_index, 'strftime'):  # pd.Timestamp / datetime
+            return date_index.strftime('%Y-%m-%d')
+        else:
+            date_str = str(date_index)
+            return date_str.split()[0] if ' ' in date_str else date_str
\ No newline at end of file
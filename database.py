@@ -1,36 +1,336 @@
 # database.py
 import sqlite3
 import logging
-from typing import List, Dict, Any, Optional
+import math
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime
 import os
 from pathlib import Path
 
-from config import DB_FILE, DECIMAL_PLACES
+from config import DB_FILE, DECIMAL_PLACES, DB_CONNECTION_PROFILES, DB_CONNECTION_PROFILE
 
 logger = logging.getLogger(__name__)
 
+# 时间序列表: 表名 -> (资产ID列, 数值列)
+TIME_SERIES_TABLES = {
+    "stock_net_asset_value": ("stock_id", "nav"),
+    "fund_net_asset_value": ("fund_id", "nav"),
+    "foreign_exchange_rate": ("currency_id", "rate"),
+}
+
+# 资产类别: kind -> (资产列表查询, 时间序列表)，kind 与数据库写线程的记录类型一致
+ASSET_KINDS = {
+    "stock": ("""
+        SELECT s.id, s.code, s.name, s.currency_id, s.class_assets_id, s.type_assets_id, s.four_type_money_id,
+               m.code as market_code, m.name as market_name
+        FROM stock s
+        LEFT JOIN market m ON s.market_id = m.id
+        """, "stock_net_asset_value"),
+    "fund": ("""
+        SELECT f.id, f.code, f.name, f.currency_id, f.class_assets_id, f.type_assets_id, f.four_type_money_id,
+               m.code as market_code
+        FROM fund f
+        LEFT JOIN market m ON f.market_id = m.id
+        """, "fund_net_asset_value"),
+    "fx": ("""
+        SELECT id, currency
+        FROM foreign_exchange
+        WHERE currency != 'CNY'
+        """, "foreign_exchange_rate"),
+}
+
+# 时间序列表名 -> 资产类别，latest_quote 表的 kind 列取此值
+TIME_SERIES_KINDS = {table: kind for kind, (_, table) in ASSET_KINDS.items()}
+
+# 持仓类别: kind -> (交易表, 资产ID列, 持仓表)
+POSITION_TABLES = {
+    "stock": ("stock_transactions", "stock_id", "stock_position_holding"),
+    "fund": ("fund_transactions", "fund_id", "fund_position_holding"),
+}
+
+# 资产配置汇总维度: 维度 -> (维度表, 名称列)；asset_class 为 class_assets 中按代码前两位归并的顶层大类
+ALLOCATION_DIMENSIONS = {
+    "account": ("account", "name"),
+    "asset_class": ("class_assets", "name"),
+    "class_assets": ("class_assets", "name"),
+    "type_assets": ("type_assets", "name"),
+    "four_type_money": ("four_type_money", "name"),
+    "currency": ("foreign_exchange", "currency"),
+}
+
+# 影响资产配置汇总的表: 表名 -> 日期列，按自增ID记录高水位
+ALLOCATION_SOURCES = {
+    "stock_transactions": "transaction_date",
+    "fund_transactions": "transaction_date",
+    "stock_net_asset_value": "date",
+    "fund_net_asset_value": "date",
+    "foreign_exchange_rate": "date",
+}
+
 
 class DatabaseManager:
     """数据库操作管理类"""
     
-    def __init__(self, db_file: str = DB_FILE):
+    def __init__(self, db_file: str = DB_FILE, read_only: bool = False,
+                 profile: str = DB_CONNECTION_PROFILE):
         self.db_file = db_file
+        self.read_only = read_only  # 只读连接用于查看数据，不会阻塞写入
+        self.profile = profile
         self.conn = None
         self.cursor = None
     
     def connect(self) -> bool:
         """连接数据库"""
         try:
-            self.conn = sqlite3.connect(self.db_file)
+            if self.read_only:
+                uri = f"{Path(self.db_file).absolute().as_uri()}?mode=ro"
+                self.conn = sqlite3.connect(uri, uri=True)
+            else:
+                self.conn = sqlite3.connect(self.db_file)
             self.conn.row_factory =  sqlite3.Row  # 返回字典格式  #self._dict_factory
             self.cursor = self.conn.cursor()
-            logger.info(f"数据库连接成功: {self.db_file}")
+            self._apply_connection_profile()
+            if not self.read_only:
+                self.migrate_schema()
+            logger.info(f"数据库连接成功: {self.db_file}{' (只读)' if self.read_only else ''}")
             return True
         except sqlite3.Error as e:
             logger.error(f"连接数据库失败: {e}")
             return False
+    
+    def _apply_connection_profile(self):
+        """按配置的连接参数设置 PRAGMA"""
+        pragmas = DB_CONNECTION_PROFILES.get(self.profile)
+        if pragmas is None:
+            logger.warning(f"未知的数据库连接配置: {self.profile}，使用SQLite默认设置")
+            return
+        
+        for name, value in pragmas.items():
+            # 只读连接不能切换日志模式，日志模式由写连接设置并保存在数据库文件中
+            if self.read_only and name == "journal_mode":
+                continue
+            self.conn.execute(f"PRAGMA {name} = {value}")
+    
+    def migrate_schema(self):
+        """按 PRAGMA user_version 依次执行尚未应用的结构迁移"""
+        current_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        
+        for version, migration in self._schema_migrations():
+            if version <= current_version:
+                continue
+            # 每个迁移步骤与版本号更新在同一个事务中完成
+            with self.conn:
+                migration()
+                self.conn.execute(f"PRAGMA user_version = {version}")
+            logger.info(f"数据库结构已迁移到版本 {version}")
+    
+    def _schema_migrations(self) -> List[Tuple[int, Any]]:
+        """结构迁移列表: (版本号, 迁移函数)"""
+        return [
+            (1, self._migrate_unique_date_indexes),
+            (2, self._migrate_latest_quote),
+            (3, self._migrate_position_holding_keys),
+            (4, self._migrate_position_state),
+            (5, self._migrate_allocation_snapshot),
+            (6, self._migrate_provisional_quote),
+            (7, self._migrate_fund_holding_key),
+        ]
+    
+    def _migrate_unique_date_indexes(self):
+        """迁移1: 去重后为时间序列表创建 (资产ID, 日期) 唯一索引"""
+        for table, (id_column, _) in TIME_SERIES_TABLES.items():
+            # 同一资产同一日期只保留最早插入的一条
+            deleted = self.conn.execute(f"""
+            DELETE FROM {table}
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM {table} GROUP BY {id_column}, date
+            )
+            """).rowcount
+            if deleted:
+                logger.warning(f"{table} 删除重复数据 {deleted} 条")
+            
+            self.conn.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{id_column}_date
+            ON {table} ({id_column}, date)
+            """)
+    
+    def _migrate_latest_quote(self):
+        """迁移2: 创建每个资产最新数值的汇总表 latest_quote，由触发器随时间序列表的写入维护"""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS latest_quote (
+            kind TEXT NOT NULL,
+            asset_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            value NUMERIC,
+            PRIMARY KEY (kind, asset_id)
+        ) WITHOUT ROWID
+        """)
+        
+        for table, (id_column, value_column) in TIME_SERIES_TABLES.items():
+            kind = TIME_SERIES_KINDS[table]
+            # 新增数据的日期不早于已记录的日期时更新汇总
+            self.conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_latest_insert
+            AFTER INSERT ON {table}
+            WHEN NEW.date IS NOT NULL
+            BEGIN
+                INSERT INTO latest_quote (kind, asset_id, date, value)
+                VALUES ('{kind}', NEW.{id_column}, NEW.date, NEW.{value_column})
+                ON CONFLICT (kind, asset_id) DO UPDATE SET date = excluded.date, value = excluded.value
+                WHERE excluded.date >= latest_quote.date;
+            END
+            """)
+            # 修改或删除数据时按索引重新取该资产的最新一条
+            for event, ids in (("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+                statements = "".join(f"""
+                DELETE FROM latest_quote WHERE kind = '{kind}' AND asset_id = {row}.{id_column};
+                INSERT INTO latest_quote (kind, asset_id, date, value)
+                SELECT '{kind}', {id_column}, date, {value_column} FROM {table}
+                WHERE {id_column} = {row}.{id_column} AND date IS NOT NULL
+                ORDER BY date DESC LIMIT 1;""" for row in ids)
+                self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_latest_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN{statements}
+                END
+                """)
+        
+        self._rebuild_latest_quote()
+    
+    def _migrate_position_holding_keys(self):
+        """迁移3: 去重后为持仓表创建唯一索引，股票每只一行，基金每只每个日期一行，估值结果按索引 UPSERT
         
+        持仓表可能有手工录入的数据，删除的重复行先复制到 {表名}_duplicates 备份表，可以从中恢复
+        """
+        for table, key_columns in (("stock_position_holding", "stock_id"),
+                                   ("fund_position_holding", "fund_id, date")):
+            self._unique_holding_key(table, key_columns)
+    
+    def _unique_holding_key(self, table: str, key_columns: str):
+        """同一持仓只保留最后写入的一条，其余的先复制到 {表名}_duplicates 备份表再删除，然后创建唯一索引"""
+        duplicates = f"""
+        SELECT * FROM {table}
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM {table} GROUP BY {key_columns}
+        )
+        """
+        if self.conn.execute(f"SELECT EXISTS ({duplicates})").fetchone()[0]:
+            backup_table = f"{table}_duplicates"
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {backup_table} AS SELECT * FROM {table} WHERE 0")
+            backed_up = self.conn.execute(f"INSERT INTO {backup_table} {duplicates}").rowcount
+            self.conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {backup_table})")
+            logger.warning(f"{table} 有 {backed_up} 条重复数据，已移到备份表 {backup_table}")
+        
+        self.conn.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{key_columns.replace(', ', '_')}
+        ON {table} ({key_columns})
+        """)
+    
+    def _migrate_position_state(self):
+        """迁移4: 创建增量估值使用的持仓累计表 position_state 和高水位表 valuation_watermark、valuation_quote_date"""
+        # 每个 (类别, 资产, 账户) 的累计持仓；cost 为净投入（-Σ 发生额），cost_basis 为移动加权平均法下剩余持仓的成本
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS position_state (
+            kind TEXT NOT NULL,
+            asset_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            cost_basis REAL NOT NULL DEFAULT 0,
+            realized_pnl REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, asset_id, account_id)
+        ) WITHOUT ROWID
+        """)
+        # 已计入 position_state 的最大交易ID
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS valuation_watermark (
+            kind TEXT PRIMARY KEY,
+            transaction_id INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """)
+        # 每个资产上次估值使用的净值日期，latest_quote 中日期更新的资产需要重新估值
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS valuation_quote_date (
+            kind TEXT NOT NULL,
+            asset_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (kind, asset_id)
+        ) WITHOUT ROWID
+        """)
+    
+    def _migrate_allocation_snapshot(self):
+        """迁移5: 创建资产配置汇总表 allocation_snapshot 和其高水位表 allocation_watermark"""
+        # 每个日期、每个维度成员的基准货币市值和占当日总市值的比例，member_id 为 0 表示未分类
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS allocation_snapshot (
+            date TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            member_id INTEGER NOT NULL,
+            market_value REAL NOT NULL,
+            weight REAL,
+            PRIMARY KEY (dimension, date, member_id)
+        ) WITHOUT ROWID
+        """)
+        # 已计入汇总的各来源表最大ID
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS allocation_watermark (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """)
+    
+    def _migrate_provisional_quote(self):
+        """迁移6: 创建临时数值表 provisional_quote，记录由盘中行情写入、还不是收盘值的最新数据"""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS provisional_quote (
+            kind TEXT NOT NULL,
+            asset_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (kind, asset_id)
+        ) WITHOUT ROWID
+        """)
+    
+    def _migrate_fund_holding_key(self):
+        """迁移7: 基金持仓改为与股票相同的每只基金一行（date 为估值所用的净值日期），不再每个净值日期新增一行
+        
+        迁移3 按日期保存的历史行移到 fund_position_holding_duplicates 备份表，只保留每只基金最后写入的一条
+        """
+        self.conn.execute("DROP INDEX IF EXISTS idx_fund_position_holding_fund_id_date")
+        self._unique_holding_key("fund_position_holding", "fund_id")
+    
+    def rebuild_latest_quote(self) -> int:
+        """根据时间序列表重建 latest_quote 汇总表，返回汇总的资产数"""
+        try:
+            with self.conn:
+                count = self._rebuild_latest_quote()
+            logger.info(f"最新数值汇总表重建完成，共 {count} 个资产")
+            return count
+        except sqlite3.Error as e:
+            logger.error(f"重建最新数值汇总表失败: {e}")
+            return 0
+    
+    def _rebuild_latest_quote(self) -> int:
+        """清空并重新填充 latest_quote（在调用方的事务中执行）"""
+        self.conn.execute("DELETE FROM latest_quote")
+        count = 0
+        for table, (id_column, value_column) in TIME_SERIES_TABLES.items():
+            count += self.conn.execute(f"""
+            INSERT INTO latest_quote (kind, asset_id, date, value)
+            SELECT '{TIME_SERIES_KINDS[table]}', v.{id_column}, v.date, v.{value_column}
+            FROM (
+                SELECT {id_column}, MAX(date) AS date
+                FROM {table}
+                GROUP BY {id_column}
+            ) latest
+            JOIN {table} v ON v.{id_column} = latest.{id_column} AND v.date = latest.date
+            WHERE v.{id_column} IS NOT NULL
+            """).rowcount
+        return count
+    
+    def _has_latest_quote(self) -> bool:
+        """latest_quote 是否可用（只读连接不执行迁移，旧数据库可能还没有此表）"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0] >= 2
+    
     def _dict_factory(self, cursor, row):
         """自定义行工厂函数，将行转换为字典，处理列名问题"""
         d = {}
@@ -191,22 +491,17 @@ class DatabaseManager:
     def insert_stock_nav(self, stock_id: int, date: str, nav: float) -> bool:
         """插入股票净值数据"""
         try:
-            # 检查是否已存在该日期的数据
-            check_query = """
-            SELECT id FROM stock_net_asset_value 
-            WHERE stock_id = ? AND date = ?
-            """
-            self.cursor.execute(check_query, (stock_id, date))
-            if self.cursor.fetchone():
-                logger.info(f"股票 {stock_id} 在 {date} 的数据已存在，跳过")
-                return False
-            
+            # 依靠 (stock_id, date) 唯一索引判断重复
             insert_query = """
             INSERT INTO stock_net_asset_value (stock_id, date, nav)
             VALUES (?, ?, ?)
+            ON CONFLICT (stock_id, date) DO NOTHING
             """
             self.cursor.execute(insert_query, (stock_id, date, round(nav, DECIMAL_PLACES)))
             self.conn.commit()
+            if self.cursor.rowcount == 0:
+                logger.info(f"股票 {stock_id} 在 {date} 的数据已存在，跳过")
+                return False
             logger.debug(f"插入股票净值数据成功: stock_id={stock_id}, date={date}, nav={nav}")
             return True
         except sqlite3.Error as e:
@@ -216,22 +511,17 @@ class DatabaseManager:
     def insert_fund_nav(self, fund_id: int, date: str, nav: float) -> bool:
         """插入基金净值数据"""
         try:
-            # 检查是否已存在该日期的数据
-            check_query = """
-            SELECT id FROM fund_net_asset_value 
-            WHERE fund_id = ? AND date = ?
-            """
-            self.cursor.execute(check_query, (fund_id, date))
-            if self.cursor.fetchone():
-                logger.debug(f"基金 {fund_id} 在 {date} 的数据已存在，跳过")
-                return False
-            
+            # 依靠 (fund_id, date) 唯一索引判断重复
             insert_query = """
             INSERT INTO fund_net_asset_value (fund_id, date, nav)
             VALUES (?, ?, ?)
+            ON CONFLICT (fund_id, date) DO NOTHING
             """
             self.cursor.execute(insert_query, (fund_id, date, round(nav, DECIMAL_PLACES)))
             self.conn.commit()
+            if self.cursor.rowcount == 0:
+                logger.debug(f"基金 {fund_id} 在 {date} 的数据已存在，跳过")
+                return False
             logger.debug(f"插入基金净值数据成功: fund_id={fund_id}, date={date}, nav={nav}")
             return True
         except sqlite3.Error as e:
@@ -241,28 +531,326 @@ class DatabaseManager:
     def insert_exchange_rate(self, currency_id: int, rate: float, date: str) -> bool:
         """插入汇率数据"""
         try:
-            # 检查是否已存在该日期的数据
-            check_query = """
-            SELECT id FROM foreign_exchange_rate 
-            WHERE currency_id = ? AND date = ?
-            """
-            self.cursor.execute(check_query, (currency_id, date))
-            if self.cursor.fetchone():
-                logger.debug(f"货币 {currency_id} 在 {date} 的汇率数据已存在，跳过")
-                return False
-            
+            # 依靠 (currency_id, date) 唯一索引判断重复
             insert_query = """
             INSERT INTO foreign_exchange_rate (currency_id, rate, date)
             VALUES (?, ?, ?)
+            ON CONFLICT (currency_id, date) DO NOTHING
             """
             self.cursor.execute(insert_query, (currency_id, round(rate, DECIMAL_PLACES), date))
             self.conn.commit()
+            if self.cursor.rowcount == 0:
+                logger.debug(f"货币 {currency_id} 在 {date} 的汇率数据已存在，跳过")
+                return False
             logger.debug(f"插入汇率数据成功: currency_id={currency_id}, date={date}, rate={rate}")
             return True
         except sqlite3.Error as e:
             logger.error(f"插入汇率数据失败: {e}")
             return False
     
+    def insert_stock_navs_bulk(self, rows: List[Tuple[int, str, float]],
+                               overwrite: bool = False, provisional: bool = False) -> Tuple[int, int]:
+        """批量插入股票净值数据，rows 为 (stock_id, date, nav)，返回 (写入条数, 跳过条数)"""
+        return self._insert_values_bulk("stock_net_asset_value", rows, overwrite, provisional)
+    
+    def insert_fund_navs_bulk(self, rows: List[Tuple[int, str, float]],
+                              overwrite: bool = False, provisional: bool = False) -> Tuple[int, int]:
+        """批量插入基金净值数据，rows 为 (fund_id, date, nav)，返回 (写入条数, 跳过条数)"""
+        return self._insert_values_bulk("fund_net_asset_value", rows, overwrite, provisional)
+    
+    def insert_exchange_rates_bulk(self, rows: List[Tuple[int, str, float]],
+                                   overwrite: bool = False, provisional: bool = False) -> Tuple[int, int]:
+        """批量插入汇率数据，rows 为 (currency_id, date, rate)，返回 (写入条数, 跳过条数)"""
+        return self._insert_values_bulk("foreign_exchange_rate", rows, overwrite, provisional)
+    
+    def _insert_values_bulk(self, table: str, rows: List[Tuple[int, str, float]],
+                            overwrite: bool = False, provisional: bool = False) -> Tuple[int, int]:
+        """通用方法：在单个事务中批量 UPSERT (id, date, value)
+        
+        overwrite 为 False 时已存在的日期跳过，为 True 时覆盖数值不同的记录。provisional 为 True 表示数值来自
+        盘中行情、还不是收盘值：覆盖已有记录并记入 provisional_quote；之后写入的收盘值覆盖同一日期的临时数值
+        """
+        if not rows:
+            return 0, 0
+        
+        id_column, value_column = TIME_SERIES_TABLES[table]
+        if overwrite or provisional:
+            conflict_action = f"""DO UPDATE SET {value_column} = excluded.{value_column}
+            WHERE {value_column} IS NOT excluded.{value_column}"""
+        else:
+            conflict_action = "DO NOTHING"
+        
+        insert_query = f"""
+        INSERT INTO {table} ({id_column}, date, {value_column})
+        VALUES (?, ?, ?)
+        ON CONFLICT ({id_column}, date) {conflict_action}
+        """
+        
+        try:
+            params = []
+            for record_id, date, value in rows:
+                try:
+                    number = float(value)
+                    if not math.isfinite(number):
+                        raise ValueError(value)
+                    params.append((record_id, date, round(number, DECIMAL_PLACES)))
+                except (TypeError, ValueError):
+                    logger.warning(f"跳过{table}中数值无效的记录: id={record_id}, date={date}, value={value!r}")
+            
+            # 整批数据在一个事务中提交，只产生一次落盘
+            with self.conn:
+                self.cursor.executemany(insert_query, params)
+                written = self.cursor.rowcount if params else 0
+                if provisional:
+                    self.cursor.executemany("""
+                    INSERT INTO provisional_quote (kind, asset_id, date)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (kind, asset_id) DO UPDATE SET date = excluded.date
+                    WHERE excluded.date >= provisional_quote.date
+                    """, [(TIME_SERIES_KINDS[table], record_id, date) for record_id, date, _ in params])
+                else:
+                    written += self._settle_provisional(table, params)
+        except sqlite3.Error as e:
+            logger.error(f"批量插入{table}数据失败: {e}")
+            return 0, len(rows)
+        
+        skipped = len(rows) - written
+        logger.info(f"批量写入{table}完成: 写入 {written} 条, 跳过 {skipped} 条")
+        return written, skipped
+    
+    def _settle_provisional(self, table: str, params: List[Tuple[int, str, float]]) -> int:
+        """收盘值覆盖同一日期的临时数值，并清除已有收盘值的资产的临时记录（在调用方的事务中执行），返回覆盖的条数"""
+        id_column, value_column = TIME_SERIES_TABLES[table]
+        kind = TIME_SERIES_KINDS[table]
+        pending = {row[0]: row[1] for row in
+                   self.conn.execute("SELECT asset_id, date FROM provisional_quote WHERE kind = ?", (kind,))}
+        settled = [(record_id, date, value) for record_id, date, value in params
+                   if record_id in pending and str(date)[:10] >= pending[record_id][:10]]
+        if not settled:
+            return 0
+        
+        updated = self.conn.executemany(f"""
+        UPDATE {table} SET {value_column} = ?
+        WHERE {id_column} = ? AND date = ? AND {value_column} IS NOT ?
+        """, [(value, record_id, date, value) for record_id, date, value in settled if date == pending[record_id]]).rowcount
+        for record_id in {record_id for record_id, date, _ in settled if date != pending[record_id]}:
+            logger.warning(f"{table} 资产 {record_id} 的临时数值 {pending[record_id]} 没有取得同一日期的收盘值")
+        self.conn.executemany("DELETE FROM provisional_quote WHERE kind = ? AND asset_id = ?",
+                              [(kind, record_id) for record_id in {row[0] for row in settled}])
+        return max(updated, 0)
+    
+    def get_provisional_quotes(self, kind: str) -> Dict[int, str]:
+        """某类资产（stock/fund/fx）最新数值还是盘中临时数值的资产: {资产ID: 日期}"""
+        try:
+            rows = self.conn.execute("SELECT asset_id, date FROM provisional_quote WHERE kind = ?", (kind,)).fetchall()
+            return {row[0]: row[1] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"查询临时数值失败: {e}")
+            return {}
+    
+    def get_transaction_rows(self, kind: str, after_id: int = 0,
+                             asset_ids: Optional[List[int]] = None) -> List[Tuple]:
+        """获取某类持仓（stock/fund）交易ID大于 after_id 的交易记录，按交易ID排序；asset_ids 不为 None 时只取这些资产
+        
+        返回元组 (交易ID, 资产ID, 账户ID, 交易类型ID, 交易日期, 数量, 发生额)，供估值模块批量转换为数组
+        """
+        if kind not in POSITION_TABLES:
+            raise ValueError(f"不支持的持仓类别: {kind}")
+        
+        table, id_column, _ = POSITION_TABLES[kind]
+        query = f"""
+        SELECT id, {id_column}, account_id, type_transction_id, transaction_date,
+               quantity, transaction_amount
+        FROM {table}
+        WHERE {id_column} IS NOT NULL AND id > ?{{}}
+        ORDER BY id
+        """
+        
+        try:
+            if asset_ids is None:
+                return [tuple(row) for row in self.conn.execute(query.format(""), (after_id,)).fetchall()]
+            rows = []
+            for start in range(0, len(asset_ids), 500):
+                batch = asset_ids[start:start + 500]
+                condition = f" AND {id_column} IN ({', '.join('?' * len(batch))})"
+                rows.extend(tuple(row) for row in self.conn.execute(query.format(condition), (after_id, *batch)))
+            return sorted(rows)
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}交易记录失败: {e}")
+            return []
+    
+    def upsert_position_holdings(self, kind: str,
+                                 rows: List[Tuple[int, str, float, float, Optional[float], Optional[float],
+                                                  Optional[float]]]) -> int:
+        """在单个事务中批量写入持仓估值，返回写入条数
+        
+        rows 为 (资产ID, 日期, 持仓数量, 持仓成本, 浮动盈亏, 浮动盈亏百分比, 年化收益率)；每个资产一行，
+        股票持仓表没有日期列，日期忽略；基金持仓的日期更新为估值所用的净值日期
+        """
+        if kind not in POSITION_TABLES:
+            raise ValueError(f"不支持的持仓类别: {kind}")
+        if not rows:
+            return 0
+        
+        _, id_column, table = POSITION_TABLES[kind]
+        has_date = kind == "fund"
+        columns = f"{id_column}, {'date, ' if has_date else ''}position_quantity, cost_price, " \
+                  "floating_profit_loss, profit_loss_percentage, annualized_return"
+        insert_query = f"""
+        INSERT INTO {table} ({columns})
+        VALUES ({', '.join('?' * (7 if has_date else 6))})
+        ON CONFLICT ({id_column}) DO UPDATE SET{' date = excluded.date,' if has_date else ''}
+            position_quantity = excluded.position_quantity,
+            cost_price = excluded.cost_price,
+            floating_profit_loss = excluded.floating_profit_loss,
+            profit_loss_percentage = excluded.profit_loss_percentage,
+            annualized_return = excluded.annualized_return
+        """
+        params = [
+            (asset_id, *((date,) if has_date else ()),
+             *(None if value is None else round(value, DECIMAL_PLACES) for value in values))
+            for asset_id, date, *values in rows
+        ]
+        
+        try:
+            with self.conn:
+                self.cursor.executemany(insert_query, params)
+                written = self.cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"批量写入{table}失败: {e}")
+            return 0
+        
+        logger.info(f"批量写入{table}完成: 写入 {written} 条")
+        return written
+    
+    def get_last_transaction_id(self, kind: str) -> int:
+        """某类持仓交易表中的最大交易ID，没有交易时为 0"""
+        table = POSITION_TABLES[kind][0]
+        try:
+            row = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}最大交易ID失败: {e}")
+            return 0
+    
+    def get_valuation_watermark(self, kind: str) -> int:
+        """增量估值的交易高水位：已计入 position_state 的最大交易ID，没有记录时为 0"""
+        try:
+            row = self.conn.execute(
+                "SELECT transaction_id FROM valuation_watermark WHERE kind = ?", (kind,)
+            ).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.error(f"查询估值高水位失败: {e}")
+            return 0
+    
+    def get_repriced_assets(self, kind: str) -> List[int]:
+        """有持仓累计数据、且 latest_quote 中的净值日期比上次估值时更新的资产ID"""
+        try:
+            rows = self.conn.execute("""
+            SELECT q.asset_id
+            FROM latest_quote q
+            LEFT JOIN valuation_quote_date v ON v.kind = q.kind AND v.asset_id = q.asset_id
+            WHERE q.kind = ? AND (v.date IS NULL OR q.date > v.date)
+              AND q.asset_id IN (SELECT asset_id FROM position_state WHERE kind = ?)
+            ORDER BY q.asset_id
+            """, (kind, kind)).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"查询净值已更新的资产失败: {e}")
+            return []
+    
+    def set_valuation_quote_dates(self, kind: str, rows: List[Tuple[int, str]]) -> bool:
+        """记录各资产本次估值使用的净值日期，rows 为 (资产ID, 日期)"""
+        try:
+            with self.conn:
+                self.conn.executemany("""
+                INSERT INTO valuation_quote_date (kind, asset_id, date) VALUES (?, ?, ?)
+                ON CONFLICT (kind, asset_id) DO UPDATE SET date = excluded.date
+                """, [(kind, asset_id, date) for asset_id, date in rows])
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"记录估值净值日期失败: {e}")
+            return False
+    
+    def get_position_states(self, kind: str, asset_ids: List[int]) -> Dict[Tuple[int, int], List[float]]:
+        """获取资产在各账户的累计持仓，返回 {(资产ID, 账户ID): [数量, 净投入, 剩余成本, 已实现盈亏]}"""
+        states = {}
+        try:
+            # 分批查询，避免超过 SQLite 的参数个数上限
+            for start in range(0, len(asset_ids), 500):
+                batch = asset_ids[start:start + 500]
+                rows = self.conn.execute(f"""
+                SELECT asset_id, account_id, quantity, cost, cost_basis, realized_pnl
+                FROM position_state
+                WHERE kind = ? AND asset_id IN ({', '.join('?' * len(batch))})
+                """, (kind, *batch)).fetchall()
+                for row in rows:
+                    states[(row[0], row[1])] = list(row[2:])
+            return states
+        except sqlite3.Error as e:
+            logger.error(f"查询持仓累计数据失败: {e}")
+            return {}
+    
+    def save_position_states(self, kind: str, states: Dict[Tuple[int, int], List[float]],
+                             last_transaction_id: int) -> bool:
+        """写入累计持仓并把交易高水位推进到 last_transaction_id，两者在同一个事务中提交"""
+        params = [(kind, asset_id, account_id, *values) for (asset_id, account_id), values in states.items()]
+        try:
+            with self.conn:
+                self.conn.executemany("""
+                INSERT INTO position_state (kind, asset_id, account_id, quantity, cost, cost_basis, realized_pnl)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, asset_id, account_id) DO UPDATE SET
+                    quantity = excluded.quantity,
+                    cost = excluded.cost,
+                    cost_basis = excluded.cost_basis,
+                    realized_pnl = excluded.realized_pnl
+                """, params)
+                self.conn.execute("""
+                INSERT INTO valuation_watermark (kind, transaction_id) VALUES (?, ?)
+                ON CONFLICT (kind) DO UPDATE SET transaction_id = excluded.transaction_id
+                """, (kind, last_transaction_id))
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"写入持仓累计数据失败: {e}")
+            return False
+    
+    def get_position_totals(self, kind: str, asset_ids: Optional[List[int]] = None) -> List[Tuple]:
+        """按资产汇总各账户的累计持仓，返回 (资产ID, 数量, 净投入, 已实现盈亏)；asset_ids 为 None 时返回全部资产"""
+        query = """
+        SELECT asset_id, SUM(quantity), SUM(cost), SUM(realized_pnl)
+        FROM position_state
+        WHERE kind = ?{}
+        GROUP BY asset_id
+        ORDER BY asset_id
+        """
+        try:
+            if asset_ids is None:
+                return [tuple(row) for row in self.conn.execute(query.format(""), (kind,)).fetchall()]
+            totals = []
+            for start in range(0, len(asset_ids), 500):
+                batch = asset_ids[start:start + 500]
+                condition = f" AND asset_id IN ({', '.join('?' * len(batch))})"
+                totals.extend(tuple(row) for row in self.conn.execute(query.format(condition), (kind, *batch)))
+            return totals
+        except sqlite3.Error as e:
+            logger.error(f"汇总持仓累计数据失败: {e}")
+            return []
+    
+    def reset_position_state(self, kind: str) -> bool:
+        """清空某类持仓的累计数据和高水位，下次增量估值从全部交易重新累计"""
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM position_state WHERE kind = ?", (kind,))
+                self.conn.execute("DELETE FROM valuation_watermark WHERE kind = ?", (kind,))
+                self.conn.execute("DELETE FROM valuation_quote_date WHERE kind = ?", (kind,))
+            logger.info(f"{kind} 持仓累计数据已清空")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"清空持仓累计数据失败: {e}")
+            return False
+    
     def update_us_stock_info(self, stock_id: int, info: Dict[str, Any]) -> bool:
         """更新美股详细信息"""
         try:
@@ -319,14 +907,14 @@ class DatabaseManager:
         except sqlite3.Error as e:
             logger.error(f"查询股票净值失败: {e}")
             return None
-        
+    
     def get_latest_fund_nav(self, fund_id: int) -> Optional[Dict[str, Any]]:
         """获取基金最新净值"""
         query = """SELECT * FROM fund_net_asset_value WHERE fund_id = ?
         ORDER BY date DESC
         LIMIT 1
         """
-
+        
         try:
             self.cursor.execute(query, (fund_id,))
             row = self.cursor.fetchone()
@@ -383,7 +971,7 @@ class DatabaseManager:
         except sqlite3.Error as e:
             logger.error(f"查询货币失败: {e}")
             return None
-        
+    
     # 确保这些方法存在且命名正确
     def get_latest_fund_nav(self, fund_id: int) -> Optional[Dict[str, Any]]:
         """获取基金最新净值"""
@@ -398,8 +986,19 @@ class DatabaseManager:
         return self._get_latest_record("stock_net_asset_value", "stock_id", stock_id)
     
     def _get_latest_record(self, table: str, id_column: str, record_id: int) -> Optional[Dict[str, Any]]:
-        """通用方法：获取表中指定ID的最新记录"""
+        """通用方法：获取表中指定ID的最新记录（优先从 latest_quote 汇总表读取）"""
         try:
+            if self._has_latest_quote():
+                value_column = TIME_SERIES_TABLES[table][1]
+                query = f"""
+                SELECT asset_id AS {id_column}, date, value AS {value_column}
+                FROM latest_quote
+                WHERE kind = ? AND asset_id = ?
+                """
+                self.cursor.execute(query, (TIME_SERIES_KINDS[table], record_id))
+                row = self.cursor.fetchone()
+                return dict(row) if row else None
+            
             query = f"""
             SELECT * FROM {table}
             WHERE {id_column} = ?
@@ -413,6 +1012,84 @@ class DatabaseManager:
             logger.error(f"查询{table}最新记录失败: {e}")
             return None
     
+    def get_latest_values(self, kind: str) -> List[Dict[str, Any]]:
+        """一次查询获取某类资产（stock/fund/fx）的全部记录及各自的最新净值或汇率
+        
+        从 latest_quote 汇总表按主键取每个资产的最新数值；汇总表不可用时，由
+        (资产ID, date) 唯一索引分组得到最新日期，再按索引取回该日的数值。
+        没有数据的资产 date 和数值列为 None
+        """
+        if kind not in ASSET_KINDS:
+            raise ValueError(f"不支持的资产类别: {kind}")
+        
+        asset_query, table = ASSET_KINDS[kind]
+        id_column, value_column = TIME_SERIES_TABLES[table]
+        if self._has_latest_quote():
+            query = f"""
+            SELECT a.*, q.date, q.value AS {value_column}
+            FROM ({asset_query}) a
+            LEFT JOIN latest_quote q ON q.kind = '{kind}' AND q.asset_id = a.id
+            ORDER BY a.id
+            """
+        else:
+            query = f"""
+            SELECT a.*, v.date, v.{value_column}
+            FROM ({asset_query}) a
+            LEFT JOIN (
+                SELECT {id_column}, MAX(date) AS date
+                FROM {table}
+                GROUP BY {id_column}
+            ) latest ON latest.{id_column} = a.id
+            LEFT JOIN {table} v ON v.{id_column} = latest.{id_column} AND v.date = latest.date
+            ORDER BY a.id
+            """
+        
+        try:
+            self.cursor.execute(query)
+            rows = [dict(row) for row in self.cursor.fetchall()]
+            logger.debug(f"获取到 {len(rows)} 条{kind}最新数据")
+            return rows
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}最新数据失败: {e}")
+            return []
+    
+    def get_value_series(self, kind: str, start_date: Optional[str] = None,
+                         include_previous: bool = False) -> List[Tuple[int, str, float]]:
+        """获取某类资产（stock/fund/fx）的全部历史数值 (资产ID, 日期, 净值或汇率)，按资产ID和日期排序
+        
+        start_date 不为 None 时只取该日期（含）之后的数据；include_previous 为 True 时另外带上
+        每个资产在 start_date 之前的最后一条，供按日期向前取值（as-of）使用
+        """
+        if kind not in ASSET_KINDS:
+            raise ValueError(f"不支持的资产类别: {kind}")
+        
+        table = ASSET_KINDS[kind][1]
+        id_column, value_column = TIME_SERIES_TABLES[table]
+        query = f"""
+        SELECT {id_column}, date, {value_column}
+        FROM {table}
+        WHERE {id_column} IS NOT NULL AND date IS NOT NULL AND date >= :start
+        """
+        if start_date and include_previous:
+            query += f"""
+            UNION ALL
+            SELECT v.{id_column}, v.date, v.{value_column}
+            FROM (
+                SELECT {id_column}, MAX(date) AS date
+                FROM {table}
+                WHERE {id_column} IS NOT NULL AND date < :start
+                GROUP BY {id_column}
+            ) previous
+            JOIN {table} v ON v.{id_column} = previous.{id_column} AND v.date = previous.date
+            """
+        query += "ORDER BY 1, 2"
+        
+        try:
+            return [tuple(row) for row in self.conn.execute(query, {"start": start_date or ""}).fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}历史数据失败: {e}")
+            return []
+    
     def get_fund_by_code(self, code: str) -> Optional[Dict[str, Any]]:
         """根据代码获取基金信息"""
         query = """
@@ -445,6 +1122,127 @@ class DatabaseManager:
             logger.error(f"查询货币失败: {e}")
             return None
     
+    def get_dimension_names(self, dimension: str) -> Dict[int, str]:
+        """资产配置维度的成员名称 {成员ID: 名称}"""
+        if dimension not in ALLOCATION_DIMENSIONS:
+            raise ValueError(f"不支持的汇总维度: {dimension}")
+        
+        table, name_column = ALLOCATION_DIMENSIONS[dimension]
+        try:
+            rows = self.conn.execute(f"SELECT id, {name_column} FROM {table}").fetchall()
+            return {row[0]: str(row[1]) for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}失败: {e}")
+            return {}
+    
+    def get_class_asset_codes(self) -> Dict[int, str]:
+        """资产类别的代码 {类别ID: 代码}，代码前两位相同的类别属于同一个顶层大类"""
+        try:
+            return {row[0]: row[1] for row in self.conn.execute("SELECT id, code FROM class_assets").fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"查询资产类别失败: {e}")
+            return {}
+    
+    def get_changes_since(self, table: str, after_id: int) -> Tuple[int, Optional[str]]:
+        """影响资产配置汇总的表中 (当前最大ID, ID大于 after_id 的记录的最早日期)，没有新记录时日期为 None"""
+        date_column = ALLOCATION_SOURCES[table]
+        try:
+            row = self.conn.execute(f"""
+            SELECT COALESCE(MAX(id), 0),
+                   (SELECT MIN({date_column}) FROM {table} WHERE id > ?)
+            FROM {table}
+            """, (after_id,)).fetchone()
+            return row[0], row[1]
+        except sqlite3.Error as e:
+            logger.error(f"查询{table}新增记录失败: {e}")
+            return after_id, None
+    
+    def get_currencies_with_earlier_first_rate(self, after_id: int) -> List[int]:
+        """ID大于 after_id 的汇率中有早于该货币原有全部汇率的日期（含新增的货币），返回这些货币ID"""
+        try:
+            rows = self.conn.execute("""
+            SELECT currency_id
+            FROM foreign_exchange_rate
+            GROUP BY currency_id
+            HAVING MIN(CASE WHEN id > ? THEN date END) < COALESCE(MIN(CASE WHEN id <= ? THEN date END), '9999')
+            """, (after_id, after_id)).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"查询最早汇率变化失败: {e}")
+            return []
+    
+    def get_first_position_date(self, currency_ids: List[int]) -> Optional[str]:
+        """以这些货币计价的股票和基金的最早交易日期，没有交易时返回 None"""
+        if not currency_ids:
+            return None
+        
+        placeholders = ", ".join("?" * len(currency_ids))
+        dates = []
+        try:
+            for kind, (table, id_column, _) in POSITION_TABLES.items():
+                row = self.conn.execute(f"""
+                SELECT MIN(t.transaction_date)
+                FROM {table} t
+                JOIN {kind} a ON a.id = t.{id_column}
+                WHERE a.currency_id IN ({placeholders})
+                """, currency_ids).fetchone()
+                if row[0]:
+                    dates.append(str(row[0])[:10])
+        except sqlite3.Error as e:
+            logger.error(f"查询最早交易日期失败: {e}")
+            return None
+        return min(dates) if dates else None
+    
+    def get_allocation_watermarks(self) -> Dict[str, int]:
+        """资产配置汇总已计入的各来源表最大ID"""
+        try:
+            return {row[0]: row[1] for row in self.conn.execute(
+                "SELECT source, last_id FROM allocation_watermark").fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"查询资产配置高水位失败: {e}")
+            return {}
+    
+    def replace_allocation_snapshots(self, start_date: Optional[str],
+                                     rows: Iterable[Tuple[str, str, int, float, Optional[float]]],
+                                     watermarks: Dict[str, int]) -> bool:
+        """在单个事务中替换 start_date（含）之后的资产配置汇总并更新高水位，start_date 为 None 时替换全部
+        
+        rows 为 (日期, 维度, 成员ID, 市值, 占比)，可以是逐段生成的迭代器
+        """
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM allocation_snapshot WHERE date >= ?", (start_date or "",))
+                inserted = self.conn.executemany("""
+                INSERT INTO allocation_snapshot (date, dimension, member_id, market_value, weight)
+                VALUES (?, ?, ?, ?, ?)
+                """, rows).rowcount
+                self.conn.executemany("""
+                INSERT INTO allocation_watermark (source, last_id) VALUES (?, ?)
+                ON CONFLICT (source) DO UPDATE SET last_id = excluded.last_id
+                """, list(watermarks.items()))
+            logger.info(f"资产配置汇总已更新: {start_date or '全部日期'} 起 {inserted} 条")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"写入资产配置汇总失败: {e}")
+            return False
+    
+    def get_allocation(self, dimension: str, date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """某维度在某日期（默认最新日期）的资产配置，按市值从大到小排序"""
+        query = """
+        SELECT date, member_id, market_value, weight
+        FROM allocation_snapshot
+        WHERE dimension = :dimension AND date = COALESCE(
+            :date, (SELECT MAX(date) FROM allocation_snapshot WHERE dimension = :dimension)
+        )
+        ORDER BY market_value DESC
+        """
+        try:
+            rows = self.conn.execute(query, {"dimension": dimension, "date": date}).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"查询资产配置失败: {e}")
+            return []
+    
     def get_stock_by_id(self, stock_id: int) -> Optional[Dict[str, Any]]:
         """根据ID获取股票信息"""
         query = """
@@ -465,6 +1263,10 @@ class DatabaseManager:
 # 全局数据库实例
 _db_instance = None
 
+def get_read_only_database() -> DatabaseManager:
+    """获取只读数据库实例（每次新建，供查看数据使用）"""
+    return DatabaseManager(read_only=True)
+
 def get_database() -> DatabaseManager:
     """获取数据库实例（单例模式）"""
     global _db_instance
@@ -0,0 +1,151 @@
+# db_writer.py
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import DB_FILE, WRITER_QUEUE_SIZE, WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# 队列中的控制标记
+_FLUSH = object()
+_STOP = object()
+
+
+class DatabaseWriter:
+    """单写线程：从有界队列中消费 (kind, asset_id, date, value) 记录，按批次写入数据库
+
+    kind 取值 stock / fund / fx，value 为净值或汇率；provisional 标记盘中行情的临时数值，收盘值写入时被覆盖
+
+    所有写入都在写线程自己的连接上完成，满足 SQLite 单写者的约束；
+    队列有界，写入跟不上时获取线程会在 put() 处等待。
+    """
+
+    KINDS = ("stock", "fund", "fx")
+
+    def __init__(self, db_file: str = DB_FILE, queue_size: int = WRITER_QUEUE_SIZE,
+                 batch_size: int = WRITER_BATCH_SIZE, flush_interval: float = WRITER_FLUSH_INTERVAL):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, List[int]] = {kind: [0, 0] for kind in self.KINDS}
+
+    def __enter__(self) -> "DatabaseWriter":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """启动写线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+        self._thread.start()
+        logger.debug("数据库写线程已启动")
+
+    def put(self, kind: str, asset_id: int, date: Optional[str], value: Any, provisional: bool = False):
+        """提交一条待写入记录（队列满时阻塞）"""
+        if kind not in self.KINDS:
+            raise ValueError(f"不支持的数据类型: {kind}")
+        self._queue.put((kind, asset_id, date, value, provisional))
+
+    def flush(self):
+        """立即写入已提交的记录，并等待写入完成"""
+        if self._thread is None:
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """写入剩余记录并停止写线程"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        logger.debug("数据库写线程已停止")
+
+    def get_stats(self) -> Dict[str, Tuple[int, int]]:
+        """获取各类数据累计的 (写入条数, 跳过条数)"""
+        with self._stats_lock:
+            return {kind: (written, skipped) for kind, (written, skipped) in self._stats.items()}
+
+    def _run(self):
+        """写线程主循环：按数量或时间分批提交事务"""
+        db = DatabaseManager(self.db_file)
+        if not db.connect():
+            logger.error("数据库写线程无法连接数据库，提交的记录将被丢弃")
+            db = None
+
+        pending: Dict[str, List[Tuple[int, Optional[str], Any, bool]]] = {kind: [] for kind in self.KINDS}
+        pending_count = 0  # 已取出但尚未写入的记录数（含控制标记）
+        last_flush = time.monotonic()
+
+        try:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                stop = item is _STOP
+                if item is not None:
+                    pending_count += 1
+                    if item is not _FLUSH and not stop:
+                        kind, asset_id, date, value, provisional = item
+                        pending[kind].append((asset_id, date, value, provisional))
+
+                batch_size = sum(len(rows) for rows in pending.values())
+                if (item is _FLUSH or stop or batch_size >= self.batch_size
+                        or time.monotonic() - last_flush >= self.flush_interval):
+                    try:
+                        self._write_batch(db, pending)
+                    finally:
+                        # 写入出错也要确认已取出的记录，否则 flush() 会一直等待
+                        for _ in range(pending_count):
+                            self._queue.task_done()
+                        pending_count = 0
+                        last_flush = time.monotonic()
+
+                if stop:
+                    break
+        finally:
+            if db is not None:
+                db.close()
+
+    def _write_batch(self, db: Optional[DatabaseManager], pending: Dict[str, List[Tuple[int, Optional[str], Any, bool]]]):
+        """把各类待写入记录分别在一个事务中写入（收盘值和临时数值各一个），并清空待写入列表"""
+        for kind, rows in pending.items():
+            if not rows:
+                continue
+
+            try:
+                if db is None:
+                    written, skipped = 0, len(rows)
+                else:
+                    insert = {"stock": db.insert_stock_navs_bulk, "fund": db.insert_fund_navs_bulk,
+                              "fx": db.insert_exchange_rates_bulk}[kind]
+                    written, skipped = 0, 0
+                    for provisional in (False, True):
+                        values = [(asset_id, date, value) for asset_id, date, value, flag in rows if flag == provisional]
+                        if values:
+                            counts = insert(values, provisional=provisional)
+                            written += counts[0]
+                            skipped += counts[1]
+            except Exception as e:
+                logger.error(f"写入{kind}数据失败，{len(rows)} 条记录被跳过: {e}")
+                written, skipped = 0, len(rows)
+
+            with self._stats_lock:
+                self._stats[kind][0] += written
+                self._stats[kind][1] += skipped
+            rows.clear()
@@ -1,13 +1,23 @@
 # fetcher.py
+import argparse
 import logging
+import sys
+import threading
 import time
-from typing import Tuple, List, Dict, Any, Optional  # 添加了 Optional
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Tuple, List, Dict, Any, Optional, Iterator  # 添加了 Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 #from data_source import get_data_source, HybridDataSource
-from database import get_database
-from config import DECIMAL_PLACES
-from data_sources import get_data_source 
+from database import DatabaseManager
+from db_writer import DatabaseWriter
+from config import (DECIMAL_PLACES, BACKFILL_DEFAULT_DAYS, BACKFILL_GAP_LOOKBACK_DAYS, SKIP_UP_TO_DATE_ASSETS, LOG_LEVEL,
+                    FETCH_ENGINE, FETCH_MAX_WORKERS, US_DATA_PROVIDER, MARKET_SESSIONS)
+from data_sources import (get_data_source, get_data_source_manager, get_circuit_breaker_stats, get_http_metrics,
+                          DataSourceType)
+from utils import setup_logging, save_to_json
+from data_sources.trading_calendar import asset_market, get_trading_calendar, plan_stale_assets
 
 
 logger = logging.getLogger(__name__)
@@ -16,312 +26,332 @@ logger = logging.getLogger(__name__)
 class DataFetcher:
     """数据获取功能类"""
     
-    def __init__(self, max_workers: int = 1):
+    def __init__(self, max_workers: int = 1, skip_up_to_date: bool = SKIP_UP_TO_DATE_ASSETS):
         self.data_source = get_data_source()  # 获取数据源管理器
         self.max_workers = max_workers
+        self.skip_up_to_date = skip_up_to_date  # 跳过数据已不早于最近收盘交易日的资产
+        self._db: Optional[DatabaseManager] = None  # 当前获取过程独占的数据库连接（只读取）
+        self._writer: Optional[DatabaseWriter] = None  # 当前获取过程的单写线程
+        self.outcomes: List[Dict[str, Any]] = []  # 每个资产的获取结果和耗时
+        self._outcomes_lock = threading.Lock()
         logger.info(f"数据获取器初始化成功，最大线程数: {max_workers}")
     
-    def fetch_stock_prices(self) -> Tuple[int, int, List[Dict[str, Any]]]:
-        """获取所有股票的最新收盘价"""
-        # 在主线程中获取数据
-        db = get_database()
+    @contextmanager
+    def _run_connection(self) -> Iterator[Optional[DatabaseManager]]:
+        """一次获取过程独占一个读取连接和一个单写线程
+        
+        获取线程把结果直接提交给写线程，网络请求与数据库写入并行进行；
+        不使用全局单例，避免与菜单持有的连接互相覆盖。嵌套调用时复用外层的
+        连接和写线程，连接无法建立时返回 None，退出时写入剩余记录
+        """
+        if self._db is not None:
+            yield self._db
+            return
+        
+        db = DatabaseManager()
         if not db.connect():
             logger.error("无法连接数据库")
-            return 0, 0, []
+            yield None
+            return
         
+        self._db = db
+        self._writer = DatabaseWriter(db.db_file)
+        self._writer.start()
         try:
-            stocks = db.get_all_stocks()
+            yield db
         finally:
+            self._writer.close()
+            self._writer = None
+            self._db = None
             db.close()
+    
+    def fetch_stock_prices(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """获取所有股票的最新收盘价"""
+        with self._run_connection() as db:
+            if db is None:
+                return 0, 0, []
             
-        if not stocks:
-            logger.warning("未找到任何股票信息")
-            return 0, 0, []
-        
-        success_count = 0
-        failure_count = 0
-        failed_stocks = []
-        
-        print(f"\n开始获取 {len(stocks)} 只股票的收盘价...")
-        logger.info(f"开始获取 {len(stocks)} 只股票的收盘价")
-        
-        # 使用线程池并行获取数据，但每个线程使用独立的数据库连接
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
+            stocks = self._get_assets_to_fetch(db, "stock")
+            
+            if not stocks:
+                return 0, 0, []
+            
+            success_count = 0
+            failure_count = 0
+            failed_stocks = []
+            
+            print(f"\n开始获取 {len(stocks)} 只股票的收盘价...")
+            logger.info(f"开始获取 {len(stocks)} 只股票的收盘价")
+            writes_before = self._writer.get_stats()
+            
+            # 按市场分组，每个市场批量获取一次
+            stocks_by_market = {}
             for stock in stocks:
-                future = executor.submit(self._fetch_single_stock_price_thread, stock)
-                futures[future] = stock
-            
-            for future in as_completed(futures):
-                stock = futures[future]
-                try:
-                    success, price, date = future.result()
-                    if success:
-                        success_count += 1
-                        # 在主线程中保存数据
-                        self._save_stock_data_thread_safe(
-                            stock['id'], 
-                            price, 
-                            date, 
-                            stock.get('market_code', 'SH'), #默认SH
-                            stock['code']  # 添加股票代码参数 - 这是更新部分
-                        )
-                    else:
-                        failure_count += 1
-                        failed_stocks.append(stock)
-                except Exception as e:
-                    logger.error(f"获取股票 {stock.get('code')} 数据时出现异常: {e}")
-                    failure_count += 1
-                    failed_stocks.append(stock)
-        
-        logger.info(f"股票获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
-        return success_count, failure_count, failed_stocks
+                stocks_by_market.setdefault(stock.get('market_code', 'SH'), []).append(stock)
+            
+            # 使用线程池并行获取各市场数据，获取结果由工作线程直接提交给写线程
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {}
+                for market_code, market_stocks in stocks_by_market.items():
+                    future = executor.submit(self._fetch_market_stock_prices_thread, market_code, market_stocks)
+                    futures[future] = market_stocks
+                
+                for future in as_completed(futures):
+                    market_stocks = futures[future]
+                    try:
+                        succeeded_ids = future.result()
+                    except Exception as e:
+                        logger.error(f"批量获取股票数据时出现异常: {e}")
+                        succeeded_ids = set()
+                        for stock in market_stocks:
+                            self._record_outcome("stock", stock, "failed", error=str(e))
+                    
+                    for stock in market_stocks:
+                        if stock['id'] in succeeded_ids:
+                            success_count += 1
+                        else:
+                            failure_count += 1
+                            failed_stocks.append(stock)
+
+            # 等待写线程写完本次获取的结果
+            self._report_writes("stock", writes_before)
+            
+            logger.info(f"股票获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
+            return success_count, failure_count, failed_stocks
     
-    def _fetch_single_stock_price_thread(self, stock: Dict[str, Any]) -> Tuple[bool, Optional[float], Optional[str]]:
-        """在线程中获取单只股票价格"""
-        code = stock['code']
-        name = stock['name']
-        market_code = stock.get('market_code', 'SH')
-        
-        print(f"正在获取 {name}({code}) [{market_code}] 的收盘价...")
-        
-        # 获取股票价格 - 使用数据源管理器
-        price, date = self.data_source.get_stock_price(code, market_code)
-        
-        if price is not None and date is not None:
-            print(f"  √ 获取成功: {date} 收盘价 {price}")
-            return True, price, date
-        else:
-            print(f"  × 获取失败: 无法获取数据")
-            return False, None, None
+    def _get_assets_to_fetch(self, db: DatabaseManager, kind: str, market_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """取出需要获取的资产：按交易日历，已存数据不早于所在市场最近已收盘交易日的资产不再请求
+        
+        没有需要获取的资产时在这里记录原因：没有配置任何资产，或者全部已是最新
+        """
+        labels = {"stock": "美股" if market_code == "US" else "股票", "fund": "基金", "fx": "货币"}
+        assets = db.get_latest_values(kind)
+        if market_code:
+            assets = [asset for asset in assets if asset.get('market_code') == market_code]
+        if not assets:
+            logger.warning(f"未找到任何{labels[kind]}信息")
+            return []
+        if not self.skip_up_to_date:
+            return assets
+        
+        stale, up_to_date = plan_stale_assets(kind, assets, provisional=db.get_provisional_quotes(kind))
+        for asset in up_to_date:
+            self._record_outcome(kind, asset, "skipped", asset.get('date'))
+        if up_to_date:
+            print(f"\n{len(up_to_date)} 项数据已是最近收盘交易日的数据，跳过获取")
+            logger.info(f"{kind} 跳过 {len(up_to_date)} 项已是最新的数据，需要获取 {len(stale)} 项")
+        if not stale:
+            logger.info(f"所有{labels[kind]}数据已是最新，无需获取")
+        return stale
     
-    def _save_stock_data_thread_safe(self, stock_id: int, price: float, date: str, market_code: str, code: str):
-        """在主线程中安全保存股票数据"""
-        db = get_database()
-        if not db.connect():
-            logger.error(f"保存股票 {stock_id}， {code} 数据时无法连接数据库")
-            return False
-        
-        try:
-            if db.insert_stock_nav(stock_id, date, price):
-                # 如果是美股，获取详细信息
-                # if market_code == "US":
-                #     info = self.data_source.get_us_stock_info(code)
-                #     if info:
-                #         db.update_us_stock_info(stock_id, info)
-                #         logger.debug(f"美股 {code} 详细信息已更新")
-                return True
+    def _record_outcome(self, kind: str, asset: Dict[str, Any], status: str, date: Optional[str] = None,
+                        value: Any = None, elapsed: Optional[float] = None, error: Optional[str] = None):
+        """记录单个资产的获取结果: status 为 success / failed / skipped / no_data，elapsed 为所在请求的耗时（秒）"""
+        outcome = {
+            'kind': kind,
+            'id': asset.get('id'),
+            'code': asset.get('code', asset.get('currency')),
+            'market_code': asset.get('market_code'),
+            'status': status,
+            'date': date,
+            'value': value,
+            'elapsed_ms': round(elapsed * 1000, 1) if elapsed is not None else None,
+            'error': error
+        }
+        with self._outcomes_lock:
+            self.outcomes.append(outcome)
+    
+    def _fetch_market_stock_prices_thread(self, market_code: str, stocks: List[Dict[str, Any]]) -> set:
+        """在线程中批量获取同一市场的股票价格，返回获取成功的股票ID"""
+        print(f"正在批量获取 [{market_code}] 市场 {len(stocks)} 只股票的收盘价...")
+        
+        # 获取股票价格 - 使用数据源管理器，每个市场一次批量请求
+        codes = [stock['code'] for stock in stocks]
+        started = time.perf_counter()
+        prices = self.data_source.get_stock_prices_batch(codes, market_code)
+        elapsed = time.perf_counter() - started
+        
+        succeeded_ids = set()
+        for stock in stocks:
+            price, date = prices.get(stock['code'], (None, None))
+            if price is not None and date is not None:
+                print(f"  √ {stock['name']}({stock['code']}) 获取成功: {date} 收盘价 {price}")
+                self._put_value("stock", stock, date, price)
+                self._record_outcome("stock", stock, "success", date, price, elapsed)
+                succeeded_ids.add(stock['id'])
             else:
-                logger.error(f"保存股票 {stock_id}， {code} 数据失败")
-                return False
-        finally:
-            db.close()
+                print(f"  × {stock['name']}({stock['code']}) 获取失败: 无法获取数据")
+                self._record_outcome("stock", stock, "failed", elapsed=elapsed, error="无法获取数据")
+        
+        return succeeded_ids
+
+    def _put_value(self, kind: str, asset: Dict[str, Any], date: str, value: Any):
+        """把获取到的数值提交给写线程；日期晚于所在市场最近已收盘交易日的是盘中行情，作为临时数值写入"""
+        market = asset_market(kind, asset)
+        provisional = (market in MARKET_SESSIONS
+                       and str(date)[:10] > get_trading_calendar().last_closed_session(market))
+        self._writer.put(kind, asset['id'], date, value, provisional)
+    
+    def _report_writes(self, kind: str, writes_before: Dict[str, Tuple[int, int]]) -> Tuple[int, int]:
+        """等待写线程写完已提交的记录，打印本次获取写入和跳过的条数"""
+        self._writer.flush()
+        written, skipped = self._writer.get_stats()[kind]
+        written -= writes_before[kind][0]
+        skipped -= writes_before[kind][1]
+        
+        print(f"写入数据库: 新增 {written} 条, 已存在跳过 {skipped} 条")
+        return written, skipped
     
     def fetch_us_stocks_only(self) -> Tuple[int, int, List[Dict[str, Any]]]:
         """仅获取美股数据"""
-        # 在主线程中获取数据
-        db = get_database()
-        if not db.connect():
-            logger.error("无法连接数据库")
-            return 0, 0, []
-        
-        try:
-            us_stocks = db.get_us_stocks()
-        finally:
-            db.close()
+        with self._run_connection() as db:
+            if db is None:
+                return 0, 0, []
+            
+            us_stocks = self._get_assets_to_fetch(db, "stock", "US")
+            
+            if not us_stocks:
+                return 0, 0, []
+            
+            success_count = 0
+            failure_count = 0
+            failed_stocks = []
+            
+            print(f"\n开始获取 {len(us_stocks)} 只美股的收盘价...")
+            logger.info(f"开始获取 {len(us_stocks)} 只美股的收盘价")
+            writes_before = self._writer.get_stats()
+            
+            # 美股一次批量获取
+            try:
+                succeeded_ids = self._fetch_market_stock_prices_thread("US", us_stocks)
+            except Exception as e:
+                logger.error(f"批量获取美股数据时出现异常: {e}")
+                succeeded_ids = set()
+                for stock in us_stocks:
+                    self._record_outcome("stock", stock, "failed", error=str(e))
             
-        if not us_stocks:
-            logger.warning("未找到任何美股信息")
-            return 0, 0, []
-        
-        success_count = 0
-        failure_count = 0
-        failed_stocks = []
-        
-        print(f"\n开始获取 {len(us_stocks)} 只美股的收盘价...")
-        logger.info(f"开始获取 {len(us_stocks)} 只美股的收盘价")
-        
-        # 使用线程池并行获取数据
-        with ThreadPoolExecutor(max_workers=min(2, self.max_workers)) as executor:  # 美股最多使用2个线程
-            futures = {}
             for stock in us_stocks:
-                future = executor.submit(self._fetch_single_us_stock_price_thread, stock)
-                futures[future] = stock
-            
-            for future in as_completed(futures):
-                stock = futures[future]
-                try:
-                    success, price, date = future.result()
-                    if success:
-                        success_count += 1
-                        # 在主线程中保存数据
-                        self._save_us_stock_data_thread_safe(stock['id'], price, date, stock['code'])
-                    else:
-                        failure_count += 1
-                        failed_stocks.append(stock)
-                except Exception as e:
-                    logger.error(f"获取美股 {stock.get('code')} 数据时出现异常: {e}")
+                if stock['id'] in succeeded_ids:
+                    success_count += 1
+                else:
                     failure_count += 1
                     failed_stocks.append(stock)
+
+            self._report_writes("stock", writes_before)
         
-        logger.info(f"美股获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
-        return success_count, failure_count, failed_stocks
-    
-    def _fetch_single_us_stock_price_thread(self, stock: Dict[str, Any]) -> Tuple[bool, Optional[float], Optional[str]]:
-        """在线程中获取单只美股价格"""
-        code = stock['code']
-        name = stock['name']
-        
-        print(f"正在获取美股 {name}({code}) 的收盘价...")
-        
-        # 获取美股价格
-        price, date = self.data_source.get_stock_price(code, "US")
-        
-        if price is not None and date is not None:
-            print(f"  √ 获取成功: {date} 收盘价 ${price}")
-            return True, price, date
-        else:
-            print(f"  × 获取失败: 无法获取数据")
-            return False, None, None
-    
-    def _save_us_stock_data_thread_safe(self, stock_id: int, price: float, date: str, code: str):
-        """在主线程中安全保存美股数据"""
-        db = get_database()
-        if not db.connect():
-            logger.error(f"保存美股 {stock_id} 数据时无法连接数据库")
-            return False
-        
-        try:
-            if db.insert_stock_nav(stock_id, date, price):
-                # 获取美股详细信息
-                info = self.data_source.get_us_stock_info(code)
-                if info:
-                    db.update_us_stock_info(stock_id, info)
-                    logger.debug(f"美股 {code} 详细信息已更新")
-                return True
-            else:
-                logger.error(f"保存美股 {stock_id} 数据失败")
-                return False
-        finally:
-            db.close()
+            logger.info(f"美股获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
+            return success_count, failure_count, failed_stocks
     
     # fetch_exchange_rates也需要类似修改
     
     def fetch_fund_navs(self) -> Tuple[int, int, List[Dict[str, Any]]]:
         """获取所有基金的最新净值"""
-        # 在主线程中获取数据
-        db = get_database()
-        if not db.connect():
-            logger.error("无法连接数据库")
-            return 0, 0, []
-        
-        try:
-            funds = db.get_all_funds()
-        finally:
-            db.close()
+        with self._run_connection() as db:
+            if db is None:
+                return 0, 0, []
             
-        if not funds:
-            logger.warning("未找到任何基金信息")
-            return 0, 0, []
-        
-        success_count = 0
-        failure_count = 0
-        failed_funds = []
-        
-        print(f"\n开始获取 {len(funds)} 只基金的净值...")
-        logger.info(f"开始获取 {len(funds)} 只基金的净值")
-        
-        # 使用线程池并行获取数据
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
+            funds = self._get_assets_to_fetch(db, "fund")
+            
+            if not funds:
+                return 0, 0, []
+            
+            success_count = 0
+            failure_count = 0
+            failed_funds = []
+            
+            print(f"\n开始获取 {len(funds)} 只基金的净值...")
+            logger.info(f"开始获取 {len(funds)} 只基金的净值")
+            writes_before = self._writer.get_stats()
+            
+            # 按市场分组，每个市场批量获取一次
+            funds_by_market = {}
             for fund in funds:
-                future = executor.submit(self._fetch_single_fund_nav_thread, fund)
-                futures[future] = fund
-            
-            for future in as_completed(futures):
-                fund = futures[future]
-                try:
-                    success, nav, date = future.result()
-                    if success:
-                        success_count += 1
-                        # 在主线程中保存数据
-                        self._save_fund_data_thread_safe(fund['id'], nav, date)
-                    else:
-                        failure_count += 1
-                        failed_funds.append(fund)
-                except Exception as e:
-                    logger.error(f"获取基金 {fund.get('code')} 数据时出现异常: {e}")
-                    failure_count += 1
-                    failed_funds.append(fund)
-        
-        logger.info(f"基金获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
-        return success_count, failure_count, failed_funds
-    
-    def _fetch_single_fund_nav_thread(self, fund: Dict[str, Any]) -> Tuple[bool, Optional[float], Optional[str]]:
-        """在线程中获取单只基金净值"""
-        code = fund['code']
-        name = fund['name']
-        market_code = fund.get('market_code', None)  # 获取市场代码
-        
-        print(f"正在获取 {name}({code}) 的净值...")
-        
-        # 获取基金净值 - 传递市场代码
-        nav, date = self.data_source.get_fund_nav(code, market_code)
-        
-        if nav is not None and date is not None:
-            print(f"  √ 获取成功: {date} 净值 {nav}")
-            return True, nav, date
-        else:
-            print(f"  × 获取失败: 无法获取数据")
-            return False, None, None
+                funds_by_market.setdefault(fund.get('market_code', None), []).append(fund)
+            
+            # 使用线程池并行获取各市场数据
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {}
+                for market_code, market_funds in funds_by_market.items():
+                    future = executor.submit(self._fetch_market_fund_navs_thread, market_code, market_funds)
+                    futures[future] = market_funds
+                
+                for future in as_completed(futures):
+                    market_funds = futures[future]
+                    try:
+                        succeeded_ids = future.result()
+                    except Exception as e:
+                        logger.error(f"批量获取基金数据时出现异常: {e}")
+                        succeeded_ids = set()
+                        for fund in market_funds:
+                            self._record_outcome("fund", fund, "failed", error=str(e))
+                    
+                    for fund in market_funds:
+                        if fund['id'] in succeeded_ids:
+                            success_count += 1
+                        else:
+                            failure_count += 1
+                            failed_funds.append(fund)
+
+            self._report_writes("fund", writes_before)
+            
+            logger.info(f"基金获取完成: 成功 {success_count} 只, 失败 {failure_count} 只")
+            return success_count, failure_count, failed_funds
     
-    def _save_fund_data_thread_safe(self, fund_id: int, nav: float, date: str):
-        """在主线程中安全保存基金数据"""
-        db = get_database()
-        if not db.connect():
-            logger.error(f"保存基金 {fund_id} 数据时无法连接数据库")
-            return False
-        
-        try:
-            if db.insert_fund_nav(fund_id, date, nav):
-                return True
+    def _fetch_market_fund_navs_thread(self, market_code: Optional[str], funds: List[Dict[str, Any]]) -> set:
+        """在线程中批量获取同一市场的基金净值，返回获取成功的基金ID"""
+        print(f"正在批量获取 [{market_code or '未知市场'}] {len(funds)} 只基金的净值...")
+        
+        # 获取基金净值 - 传递市场代码，每个市场一次批量请求
+        codes = [fund['code'] for fund in funds]
+        started = time.perf_counter()
+        navs = self.data_source.get_fund_navs_batch(codes, market_code)
+        elapsed = time.perf_counter() - started
+        
+        succeeded_ids = set()
+        for fund in funds:
+            nav, date = navs.get(fund['code'], (None, None))
+            if nav is not None and date is not None:
+                print(f"  √ {fund['name']}({fund['code']}) 获取成功: {date} 净值 {nav}")
+                self._put_value("fund", fund, date, nav)
+                self._record_outcome("fund", fund, "success", date, nav, elapsed)
+                succeeded_ids.add(fund['id'])
             else:
-                logger.error(f"保存基金 {fund_id} 数据失败")
-                return False
-        finally:
-            db.close()
-    
+                print(f"  × {fund['name']}({fund['code']}) 获取失败: 无法获取数据")
+                self._record_outcome("fund", fund, "failed", elapsed=elapsed, error="无法获取数据")
+        
+        return succeeded_ids
+
     def fetch_exchange_rates(self) -> Tuple[int, int, List[Dict[str, Any]]]:
         """获取所有货币的最新汇率"""
-        # 在主线程中获取数据
-        db = get_database()
-        if not db.connect():
-            logger.error("无法连接数据库")
-            return 0, 0, []
-        
-        try:
-            currencies = db.get_all_currencies()
-        finally:
-            db.close()
+        with self._run_connection() as db:
+            if db is None:
+                return 0, 0, []
             
-        if not currencies:
-            logger.warning("未找到任何货币信息")
-            return 0, 0, []
-        
-        success_count = 0
-        failure_count = 0
-        failed_currencies = []
-        
-        print(f"\n开始获取 {len(currencies)} 种货币的汇率...")
-        logger.info(f"开始获取 {len(currencies)} 种货币的汇率")
-        
-       # 获取币种列表
-        currency_codes = [currency['currency'] for currency in currencies]
-        
-        # 批量获取汇率数据
-        try:
-            print("批量获取汇率数据中...")
-            batch_results = self.data_source.get_exchange_rates_batch(currency_codes)
+            currencies = self._get_assets_to_fetch(db, "fx")
+            
+            if not currencies:
+                return 0, 0, []
+            
+            success_count = 0
+            failure_count = 0
+            failed_currencies = []
+            
+            print(f"\n开始获取 {len(currencies)} 种货币的汇率...")
+            logger.info(f"开始获取 {len(currencies)} 种货币的汇率")
+            writes_before = self._writer.get_stats()
+            
+           # 获取币种列表
+            currency_codes = [currency['currency'] for currency in currencies]
+            
+            # 批量获取汇率数据，只包住接口调用：处理结果时出错不能再回退逐个获取，否则已记录的币种会重复计数
+            try:
+                print("批量获取汇率数据中...")
+                started = time.perf_counter()
+                batch_results = self.data_source.get_exchange_rates_batch(currency_codes)
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                logger.error(f"批量获取汇率时出现异常，回退到逐个获取: {e}")
+                batch_results = None
             
             if not batch_results:
                 logger.warning("批量获取汇率失败，回退到逐个获取")
@@ -338,43 +368,205 @@ class DataFetcher:
                     if rate is not None and date is not None:
                         success_count += 1
                         print(f"  √ 获取成功 {currency_code}/CNY: {date} 汇率 {rate}")
-                        # 在主线程中保存数据
-                        self._save_exchange_data_thread_safe(currency['id'], rate, date)
+                        self._put_value("fx", currency, date, rate)
+                        self._record_outcome("fx", currency, "success", date, rate, elapsed)
                     else:
                         failure_count += 1
                         failed_currencies.append(currency)
                         print(f"  × 获取失败 {currency_code}/CNY: 无法获取数据")
+                        self._record_outcome("fx", currency, "failed", elapsed=elapsed, error="无法获取数据")
                 else:
                     failure_count += 1
                     failed_currencies.append(currency)
                     print(f"  × 获取失败 {currency_code}/CNY: 数据源未返回该币种")
-                    
-        except Exception as e:
-            logger.error(f"批量获取汇率时出现异常，回退到逐个获取: {e}")
-            # 如果批量获取失败，使用原来的逐个获取方式
-            return self._fetch_exchange_rates_individually(currencies)
-
+                    self._record_outcome("fx", currency, "failed", elapsed=elapsed, error="数据源未返回该币种")
+            
+            self._report_writes("fx", writes_before)
+            
+            logger.info(f"汇率获取完成: 成功 {success_count} 种, 失败 {failure_count} 种")
+            return success_count, failure_count, failed_currencies
+    
+    def _fetch_exchange_rates_individually(self, currencies: List[Dict[str, Any]]) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """逐个获取汇率（批量接口失败时的回退方式）"""
+        success_count = 0
+        failure_count = 0
+        failed_currencies = []
+        writes_before = self._writer.get_stats()
+        
+        for currency in currencies:
+            currency_code = currency['currency']
+            error = "无法获取数据"
+            started = time.perf_counter()
+            try:
+                rate, date = self.data_source.get_exchange_rate(currency_code)
+            except Exception as e:
+                logger.error(f"获取 {currency_code} 汇率时出现异常: {e}")
+                rate, date = None, None
+                error = str(e)
+            elapsed = time.perf_counter() - started
+            
+            if rate is not None and date is not None:
+                success_count += 1
+                print(f"  √ 获取成功 {currency_code}/CNY: {date} 汇率 {rate}")
+                self._put_value("fx", currency, date, rate)
+                self._record_outcome("fx", currency, "success", date, rate, elapsed)
+            else:
+                failure_count += 1
+                failed_currencies.append(currency)
+                print(f"  × 获取失败 {currency_code}/CNY: 无法获取数据")
+                self._record_outcome("fx", currency, "failed", elapsed=elapsed, error=error)
+        
+        self._report_writes("fx", writes_before)
+        
         logger.info(f"汇率获取完成: 成功 {success_count} 种, 失败 {failure_count} 种")
         return success_count, failure_count, failed_currencies
     
-    def _save_exchange_data_thread_safe(self, currency_id: int, rate: float, date: str):
-        """在主线程中安全保存汇率数据"""
-        db = get_database()
-        if not db.connect():
-            logger.error(f"保存货币 {currency_id} 数据时无法连接数据库")
-            return False
+    def backfill(self, kinds: Tuple[str, ...] = ("stock", "fund", "fx"),
+                 default_days: int = BACKFILL_DEFAULT_DAYS) -> Dict[str, Dict[str, Any]]:
+        """补齐历史数据：每个资产从最早缺失的交易日请求到今天，一次请求整个区间
+        
+        缺失的交易日包括最新已存日期之后的，以及最近 BACKFILL_GAP_LOOKBACK_DAYS 天内已存数据中间的
+        （如定时任务某天没有运行）；区间内已存的数据由写线程跳过。请求出错的资产计为失败；请求成功却没有
+        取得任何数据的资产单独计为无数据（交易日历只按工作日估算的市场，缺失的"交易日"可能是休市日）
+        """
+        labels = {"stock": "股票", "fund": "基金", "fx": "货币"}
+        results = {}
         
-        try:
-            if db.insert_exchange_rate(currency_id, rate, date):
-                return True
-            else:
-                logger.error(f"保存货币 {currency_id} 数据失败")
-                return False
-        finally:
-            db.close()
+        with self._run_connection() as db:
+            if db is None:
+                return results
+            
+            end_date = datetime.now().strftime('%Y-%m-%d')
+            for kind in kinds:
+                assets = db.get_latest_values(kind)
+                gaps = self._plan_backfill(db, kind, assets, end_date, default_days)
+                
+                print(f"\n开始补齐 {len(gaps)} 个{labels[kind]}的历史数据（其余 {len(assets) - len(gaps)} 个已是最新）...")
+                logger.info(f"开始补齐 {len(gaps)} 个{labels[kind]}的历史数据")
+                writes_before = self._writer.get_stats()
+                
+                success_count = 0
+                failure_count = 0
+                failed_items = []
+                no_data_items = []
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {
+                        executor.submit(self._backfill_asset_thread, kind, asset, start_date, end_date): asset
+                        for asset, start_date in gaps
+                    }
+                    
+                    for future in as_completed(futures):
+                        asset = futures[future]
+                        code = asset.get('code', asset.get('currency'))
+                        try:
+                            rows = future.result()
+                            error = None
+                        except Exception as e:
+                            logger.error(f"补齐 {code} 历史数据时出现异常: {e}")
+                            rows, error = 0, str(e)
+                        
+                        if error is None and rows:
+                            success_count += 1
+                            self._record_outcome(kind, asset, "success", value=rows)
+                        elif error is None:
+                            logger.info(f"补齐 {code} 历史数据: 缺失区间内没有取得任何数据")
+                            no_data_items.append(asset)
+                            self._record_outcome(kind, asset, "no_data", error="缺失区间内没有取得任何数据")
+                        else:
+                            logger.warning(f"补齐 {code} 历史数据失败: {error}")
+                            failure_count += 1
+                            failed_items.append(asset)
+                            self._record_outcome(kind, asset, "failed", error=error)
+                
+                written, skipped = self._report_writes(kind, writes_before)
+                results[kind] = {
+                    'success': success_count,
+                    'failure': failure_count,
+                    'no_data': len(no_data_items),
+                    'failed_items': failed_items,
+                    'no_data_items': no_data_items,
+                    'rows': written
+                }
+                logger.info(f"{labels[kind]}历史数据补齐完成: 成功 {success_count} 个, 失败 {failure_count} 个, "
+                            f"无数据 {len(no_data_items)} 个, 新增 {written} 条")
+        
+        return results
+    
+    def _plan_backfill(self, db: DatabaseManager, kind: str, assets: List[Dict[str, Any]], end_date: str,
+                       default_days: int) -> List[Tuple[Dict[str, Any], str]]:
+        """找出有缺失数据的资产，返回 (资产, 最早缺失的交易日)
+        
+        按所在市场的交易日历，检查最近 BACKFILL_GAP_LOOKBACK_DAYS 天内从第一条已存数据到最近已收盘
+        交易日之间没有数据的交易日；没有数据的资产从 default_days 天前开始，未配置交易时段的市场
+        和最新已存日期早于窗口的资产从最新已存日期的下一天开始
+        """
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        window_start = (end - timedelta(days=BACKFILL_GAP_LOOKBACK_DAYS)).isoformat()
+        
+        # 一次查询取回窗口内（含窗口前最后一条）的已存日期
+        stored_dates: Dict[int, set] = {}
+        first_dates: Dict[int, str] = {}
+        for asset_id, date, _ in db.get_value_series(kind, window_start, include_previous=True):
+            stored_dates.setdefault(asset_id, set()).add(str(date)[:10])
+            first_dates.setdefault(asset_id, str(date)[:10])
+        
+        calendar = get_trading_calendar()
+        sessions: Dict[str, List[str]] = {}
+        gaps = []
+        for asset in assets:
+            latest_date = asset.get('date')
+            market = asset_market(kind, asset)
+            if not latest_date:
+                gaps.append((asset, (end - timedelta(days=default_days)).isoformat()))
+                continue
+            next_date = (datetime.strptime(str(latest_date)[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            # 最新已存日期早于检查窗口时，窗口之前的部分也缺失
+            if market not in MARKET_SESSIONS or next_date < window_start:
+                if next_date <= end_date:
+                    gaps.append((asset, next_date))
+                continue
+            
+            if market not in sessions:
+                last_closed = datetime.strptime(calendar.last_closed_session(market), '%Y-%m-%d').date()
+                sessions[market] = calendar.trading_days(
+                    market, datetime.strptime(window_start, '%Y-%m-%d').date(), last_closed)
+            stored = stored_dates.get(asset['id'], set())
+            begin = max(first_dates.get(asset['id'], window_start), window_start)
+            missing = next((day for day in sessions[market] if day >= begin and day not in stored), None)
+            if missing is not None:
+                gaps.append((asset, missing))
+        return gaps
+    
+    def _backfill_asset_thread(self, kind: str, asset: Dict[str, Any], start_date: str, end_date: str) -> int:
+        """在线程中获取单个资产缺失区间的历史数据并提交给写线程，返回获取的条数"""
+        if kind == "stock":
+            name = f"{asset['name']}({asset['code']})"
+            history = self.data_source.get_stock_history(asset['code'], asset.get('market_code', 'SH'), start_date, end_date)
+        elif kind == "fund":
+            name = f"{asset['name']}({asset['code']})"
+            history = self.data_source.get_fund_nav_history(asset['code'], asset.get('market_code'), start_date, end_date)
+        else:
+            name = f"{asset['currency']}/CNY"
+            history = self.data_source.get_exchange_rate_history(asset['currency'], start_date, end_date)
+        
+        if not history:
+            print(f"  - {name} {start_date} ~ {end_date}: 没有取得数据（可能是休市日）")
+            return 0
+        
+        for date, value in history:
+            self._put_value(kind, asset, date, value)
+        
+        print(f"  √ {name} {start_date} ~ {end_date}: 获取 {len(history)} 条")
+        return len(history)
     
     def fetch_all_data(self) -> Dict[str, Any]:
         """一键获取所有数据"""
+        # 整个一键更新过程共用一个数据库连接
+        with self._run_connection() as db:
+            return self._fetch_all_data(db)
+    
+    def _fetch_all_data(self, db: Optional[DatabaseManager]) -> Dict[str, Any]:
+        """一键获取所有数据（在本次获取过程的连接上执行）"""
         results = {}
         
         print("\n" + "="*60)
@@ -383,13 +575,11 @@ class DataFetcher:
         
         # 1. 备份数据库
         print("\n1. 备份数据库...")
-        db = get_database()
-        if db.connect():
+        if db is not None:
             if db.backup():
                 print("  √ 数据库备份成功")
             else:
                 print("  × 数据库备份失败，继续执行...")
-            db.close()
         else:
             print("  × 无法连接数据库，跳过备份...")
         
@@ -438,4 +628,91 @@ class DataFetcher:
         print(f"总计: 成功 {total_success} 项, 失败 {total_failure} 项")
         print("="*60)
         
-        return results
\ No newline at end of file
+        return results
+
+
+# 命令行可获取的数据种类: 名称 -> 获取方法
+CLI_KINDS = {
+    "stocks": "fetch_stock_prices",
+    "us_stocks": "fetch_us_stocks_only",
+    "funds": "fetch_fund_navs",
+    "fx": "fetch_exchange_rates",
+}
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(prog="python -m fetcher", description="无交互地获取最新行情数据（供定时任务使用）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    run_parser = subparsers.add_parser("run", help="获取数据")
+    run_parser.add_argument("--kinds", default="stocks,funds,fx",
+                            help=f"要获取的数据种类，逗号分隔，可选: {','.join(CLI_KINDS)}（默认: stocks,funds,fx）")
+    run_parser.add_argument("--workers", type=int, default=FETCH_MAX_WORKERS,
+                            help=f"并发工作线程数（默认: {FETCH_MAX_WORKERS}）")
+    run_parser.add_argument("--engine", choices=["async", "thread"], default=FETCH_ENGINE,
+                            help=f"获取引擎（默认: {FETCH_ENGINE}）")
+    run_parser.add_argument("--us-source", choices=[source_type.value for source_type in DataSourceType],
+                            default=US_DATA_PROVIDER, help=f"美股数据源（默认: {US_DATA_PROVIDER}）")
+    run_parser.add_argument("--force", action="store_true", help="不跳过已是最新的资产")
+    run_parser.add_argument("--hedge", action="store_true", help="启用对冲请求（首选数据源响应慢时同时请求备用数据源）")
+    run_parser.add_argument("--json", metavar="PATH", help="把每个资产的结果和耗时写入 JSON 文件")
+    
+    args = parser.parse_args(argv)
+    args.kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    unknown = [kind for kind in args.kinds if kind not in CLI_KINDS]
+    if unknown or not args.kinds:
+        parser.error(f"未知的数据种类: {','.join(unknown)}，可选: {','.join(CLI_KINDS)}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口：python -m fetcher run --kinds stocks,funds,fx --workers 16 --us-source yfinance --json out.json
+    
+    全程不询问用户，与菜单使用相同的获取引擎；有资产获取失败时返回 1
+    """
+    args = _parse_args(argv)
+    setup_logging(LOG_LEVEL)
+    
+    data_source_manager = get_data_source_manager()
+    data_source_manager.set_non_interactive(args.us_source)
+    if args.hedge:
+        data_source_manager.hedged_requests = True
+    skip_up_to_date = SKIP_UP_TO_DATE_ASSETS and not args.force
+    if args.engine == "async":
+        from async_fetcher import AsyncDataFetcher
+        fetcher = AsyncDataFetcher(args.workers, skip_up_to_date)
+    else:
+        fetcher = DataFetcher(args.workers, skip_up_to_date)
+    
+    started_at = datetime.now()
+    started = time.perf_counter()
+    summary = {}
+    for kind in args.kinds:
+        outcomes_before = len(fetcher.outcomes)
+        success, failure, _ = getattr(fetcher, CLI_KINDS[kind])()
+        skipped = sum(1 for outcome in fetcher.outcomes[outcomes_before:] if outcome['status'] == "skipped")
+        summary[kind] = {'success': success, 'failure': failure, 'skipped': skipped}
+        logger.info(f"{kind} 获取完成: 成功 {success}, 失败 {failure}, 跳过 {skipped}")
+    
+    total_failure = sum(result['failure'] for result in summary.values())
+    if args.json:
+        save_to_json({
+            'started_at': started_at.isoformat(timespec="seconds"),
+            'finished_at': datetime.now().isoformat(timespec="seconds"),
+            'elapsed_seconds': round(time.perf_counter() - started, 3),
+            'engine': args.engine,
+            'workers': args.workers,
+            'us_source': args.us_source,
+            'summary': summary,
+            'circuit_breakers': get_circuit_breaker_stats(),
+            'hedged_requests': data_source_manager.get_hedge_stats(),
+            'http': get_http_metrics(),
+            'assets': fetcher.outcomes
+        }, args.json)
+    
+    return 1 if total_failure else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
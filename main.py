@@ -7,6 +7,7 @@
 import sys
 import os
 import logging
+from importlib.util import find_spec
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -22,25 +23,22 @@ from menu import MenuSystem
 
 
 def check_dependencies():
-    """检查依赖"""
-    try:
-        import akshare
+    """检查依赖（只查找模块是否安装，不导入；数据源在第一次使用时才导入这些库）"""
+    if find_spec("akshare") is not None:
         print_success("✓ akshare 已安装")
-    except ImportError:
+    else:
         print_error("✗ akshare 未安装，请运行: pip install akshare")
         return False
     
-    try:
-        import yfinance
+    if find_spec("yfinance") is not None:
         print_success("✓ yfinance 已安装")
-    except ImportError:
+    else:
         print_warning("⚠ yfinance 未安装，美股功能可能受限")
         print_info("  如需完整功能，请运行: pip install yfinance")
     
-    try:
-        import pandas
+    if find_spec("pandas") is not None:
         print_success("✓ pandas 已安装")
-    except ImportError:
+    else:
         print_error("✗ pandas 未安装，请运行: pip install pandas")
         return False
     
@@ -11,7 +11,8 @@ from database import get_database
 from menu_functions import (
     fetch_stock_prices, fetch_fund_navs, fetch_exchange_rates,
     fetch_us_stocks, fetch_all_data, view_stock_info,
-    view_fund_info, view_exchange_info, database_management
+    view_fund_info, view_exchange_info, database_management,
+    backfill_history, portfolio_valuation, asset_allocation
 )
 from data_sources.data_source_manager import get_data_source_manager
 
@@ -50,6 +51,7 @@ class MenuSystem:
         print("3. 获取最新汇率")
         print("4. 获取美股数据")
         print("5. 一键更新所有数据")
+        print("6. 补齐历史数据")
         print("0. 返回主菜单")
         
         print("\n" + "-" * 40)
@@ -63,6 +65,8 @@ class MenuSystem:
         print("1. 查看股票信息")
         print("2. 查看基金信息")
         print("3. 查看汇率信息")
+        print("4. 持仓估值")
+        print("5. 资产配置")
         print("0. 返回主菜单")
         
         print("\n" + "-" * 40)
@@ -122,6 +126,10 @@ class MenuSystem:
             # 一键更新所有数据前先询问美股数据源
             if self.ask_for_us_data_source("一键更新所有数据"):
                 fetch_all_data.main(self.db)
+        elif choice == "6":
+            # 补齐历史数据前先询问美股数据源
+            if self.ask_for_us_data_source("补齐历史数据"):
+                backfill_history.main(self.db)
         elif choice == "0":
             self.current_menu = "main"
         else:
@@ -130,12 +138,19 @@ class MenuSystem:
     
     def handle_query_menu_choice(self, choice: str):
         """处理查询数据菜单选择"""
+        # 查看数据使用各自的只读连接
         if choice == "1":
-            view_stock_info.main(self.db)
+            view_stock_info.main()
         elif choice == "2":
-            view_fund_info.main(self.db)
+            view_fund_info.main()
         elif choice == "3":
-            view_exchange_info.main(self.db)
+            view_exchange_info.main()
+        elif choice == "4":
+            # 估值结果要写回持仓表，使用读写连接
+            portfolio_valuation.main(self.db)
+        elif choice == "5":
+            # 资产配置汇总要写回汇总表，使用读写连接
+            asset_allocation.main(self.db)
         elif choice == "0":
             self.current_menu = "main"
         else:
@@ -198,14 +213,14 @@ class MenuSystem:
                 if self.current_menu == "main":
                     choice = input("请选择功能 (0-3): ").strip()
                 elif self.current_menu == "update":
-                    choice = input("请选择更新选项 (0-5): ").strip()
+                    choice = input("请选择更新选项 (0-6): ").strip()
                 elif self.current_menu == "query":
-                    choice = input("请选择查询选项 (0-3): ").strip()
+                    choice = input("请选择查询选项 (0-5): ").strip()
                 elif self.current_menu == "settings":
                     choice = input("请选择设置选项 (0-1): ").strip()
                 
                 self.handle_choice(choice)
-                
+        
         except KeyboardInterrupt:
             print("\n\n程序被用户中断")
         except Exception as e:
@@ -0,0 +1,74 @@
+# menu_functions/asset_allocation.py
+import logging
+from database import get_database
+from utils import (
+    print_header, print_warning, print_error,
+    safe_format, format_percentage, print_table
+)
+
+logger = logging.getLogger(__name__)
+
+# 各汇总维度的显示名称
+DIMENSION_LABELS = {
+    "asset_class": "资产大类",
+    "class_assets": "资产类别",
+    "type_assets": "资产类型",
+    "four_type_money": "四笔钱",
+    "account": "账户",
+    "currency": "币种",
+}
+
+
+def asset_allocation_function(db):
+    """更新并查看最新日期的资产配置"""
+    # numpy 只在使用资产配置功能时导入，不拖慢程序启动
+    from allocation import get_allocation_report, update_allocation
+    
+    print_header("资产配置")
+    
+    # 汇总表只重算有新交易、净值或汇率的日期，查看时直接读取
+    update_allocation(db)
+    report = get_allocation_report(db)
+    if not any(report.values()):
+        print_warning("没有可汇总的持仓市值")
+        input("\n按回车键返回...")
+        return
+    
+    for dimension, label in DIMENSION_LABELS.items():
+        rows = report.get(dimension) or []
+        if not rows:
+            continue
+        print(f"\n按{label} ({rows[0]['date']}):")
+        headers = [label, "市值(人民币)", "占比"]
+        table = [[row['name'], safe_format(row['market_value'], "{:,.2f}"), format_percentage(row['weight'])]
+                 for row in rows]
+        print_table(headers, table)
+    
+    total = sum(row['market_value'] for row in report.get("account") or [])
+    print("\n" + "-" * 40)
+    print(f"总市值: {total:,.2f} 元")
+    
+    input("\n按回车键返回...")
+
+
+def main(db=None):
+    """主函数，可以独立运行"""
+    if db is None:
+        db = get_database()
+    if not db.connect():
+        print_error("无法连接数据库，请检查数据库文件")
+        return
+    close_db = True
+    
+    try:
+        asset_allocation_function(db)
+    except Exception as e:
+        logger.error(f"资产配置汇总失败: {e}")
+        print_error(f"资产配置汇总失败: {e}")
+    finally:
+        if close_db:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,58 @@
+# menu_functions/backfill_history.py
+import logging
+from database import get_database
+from async_fetcher import create_data_fetcher
+from utils import print_header, confirm_action, print_error
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_history_function(db, fetcher):
+    """补齐历史数据"""
+    print_header("补齐历史数据")
+    
+    print("\n按交易日历只获取每个资产缺失的数据（包括最近几个月中间漏掉的交易日），已有的数据不会重复写入")
+    if confirm_action("确定要补齐股票、基金和汇率的历史数据吗？这可能需要几分钟"):
+        results = fetcher.backfill()
+        
+        labels = {"stock": "股票", "fund": "基金", "fx": "货币"}
+        print("\n" + "-" * 40)
+        for kind, result in results.items():
+            print(f"{labels[kind]}: 成功 {result['success']} 个, 失败 {result['failure']} 个, "
+                  f"无数据 {result['no_data']} 个, 新增 {result['rows']} 条")
+        
+        for kind, result in results.items():
+            if result['failed_items']:
+                print(f"\n失败的{labels[kind]}:")
+                for item in result['failed_items']:
+                    print(f"  {item.get('name', item.get('currency'))}({item.get('code', '')})")
+            if result['no_data_items']:
+                print(f"\n缺失区间内没有数据的{labels[kind]}（可能是休市日）:")
+                for item in result['no_data_items']:
+                    print(f"  {item.get('name', item.get('currency'))}({item.get('code', '')})")
+    
+    input("\n按回车键返回主菜单...")
+
+
+def main(db=None):
+    """主函数，可以独立运行"""
+    if db is None:
+        db = get_database()
+    if not db.connect():
+            print_error("无法连接数据库，请检查数据库文件")
+            return
+    close_db = True
+    
+    try:
+        fetcher = create_data_fetcher()
+        backfill_history_function(db, fetcher)
+    except Exception as e:
+        logger.error(f"补齐历史数据失败: {e}")
+        print_error(f"补齐历史数据失败: {e}")
+    finally:
+        if close_db:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -23,7 +23,7 @@ def _show_database_status(db):
         # 主要表数据量
         tables_to_check = [
             'stock', 'fund', 'stock_net_asset_value', 
-            'fund_net_asset_value', 'foreign_exchange_rate'
+            'fund_net_asset_value', 'foreign_exchange_rate', 'latest_quote'
         ]
         
         print("\n表数据统计:")
@@ -52,9 +52,10 @@ def database_management_function(db):
     print("\n请选择操作:")
     print("1. 备份数据库")
     print("2. 查看数据库状态")
-    print("3. 返回")
+    print("3. 重建最新数值汇总表")
+    print("4. 返回")
     
-    choice = input("\n请选择 (1-3): ").strip()
+    choice = input("\n请选择 (1-4): ").strip()
     
     if choice == "1":
         if confirm_action("确定要备份数据库吗？"):
@@ -66,6 +67,14 @@ def database_management_function(db):
     elif choice == "2":
         _show_database_status(db)
     elif choice == "3":
+        if confirm_action("确定要根据历史数据重建最新数值汇总表吗？"):
+            count = db.rebuild_latest_quote()
+            if count:
+                print_success(f"最新数值汇总表重建完成，共 {count} 个资产")
+            else:
+                print_warning("最新数值汇总表为空或重建失败，请查看日志")
+        input("\n按回车键继续...")
+    elif choice == "4":
         return
     else:
         print_error("无效选择")
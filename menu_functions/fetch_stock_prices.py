@@ -1,7 +1,7 @@
 # menu_functions/fetch_stock_prices.py
 import logging
 from database import get_database
-from fetcher import DataFetcher
+from async_fetcher import create_data_fetcher
 from utils import print_header, confirm_action, print_error, print_warning, print_info
 
 logger = logging.getLogger(__name__)
@@ -36,7 +36,7 @@ def main(db=None):
     close_db = True
     
     try:
-        fetcher = DataFetcher()
+        fetcher = create_data_fetcher()
         fetch_stock_prices_function(db, fetcher)
     except Exception as e:
         logger.error(f"获取股票价格失败: {e}")
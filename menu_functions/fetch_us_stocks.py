@@ -1,7 +1,7 @@
 # menu_functions/fetch_us_stocks.py
 import logging
 from database import get_database
-from fetcher import DataFetcher
+from async_fetcher import create_data_fetcher
 from utils import print_header, confirm_action, print_error
 
 logger = logging.getLogger(__name__)
@@ -35,7 +35,7 @@ def main(db=None):
     close_db = True
     
     try:
-        fetcher = DataFetcher()
+        fetcher = create_data_fetcher()
         fetch_us_stocks_function(db, fetcher)
     except Exception as e:
         logger.error(f"获取美股数据失败: {e}")
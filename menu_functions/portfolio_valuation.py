@@ -0,0 +1,93 @@
+# menu_functions/portfolio_valuation.py
+import logging
+from database import get_database
+from utils import (
+    print_header, print_warning, print_error,
+    safe_format, format_percentage, print_table
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    """缺少价格或汇率的估值为 NaN，显示为 N/A"""
+    return None if value != value else value
+
+
+def portfolio_valuation_function(db):
+    """重新计算并查看持仓估值"""
+    # numpy 只在使用估值功能时导入，不拖慢程序启动
+    from valuation import revalue_all, summarize, update_holdings
+    
+    print_header("持仓估值")
+    
+    # 持仓表只增量更新有新交易或新净值的持仓，显示用的估值在内存中全量计算
+    updated = sum(update_holdings(db, kind)['positions'] for kind in ("stock", "fund"))
+    results = revalue_all(db, write=False)
+    labels = {"stock": "股票", "fund": "基金"}
+    total_value = total_cost = total_profit_loss = 0.0
+    
+    for kind, result in results.items():
+        summary = summarize(result)
+        if not summary['positions']:
+            print_warning(f"没有{labels[kind]}交易记录")
+            continue
+        
+        print(f"\n{labels[kind]}持仓 ({summary['positions']} 个):")
+        headers = ["代码", "名称", "持仓数量", "最新价", "市值(人民币)", "浮动盈亏(人民币)", "盈亏比例", "年化收益率"]
+        rows = []
+        for i in range(summary['positions']):
+            # 已清仓的持仓不显示
+            if abs(result['quantity'][i]) < 1e-6:
+                continue
+            name = result['name'][i] or 'N/A'
+            if len(name) > 18:
+                name = name[:15] + "..."
+            rows.append([
+                result['code'][i] or 'N/A',
+                name,
+                safe_format(result['quantity'][i], "{:,.2f}"),
+                safe_format(_number(result['price'][i]), "{:.4f}", "N/A"),
+                safe_format(_number(result['market_value_cny'][i]), "{:,.2f}", "N/A"),
+                safe_format(_number(result['profit_loss_cny'][i]), "{:,.2f}", "N/A"),
+                format_percentage(_number(result['profit_loss_percentage'][i])),
+                format_percentage(_number(result['annualized_return'][i]))
+            ])
+        print_table(headers, rows)
+        print(f"市值 {summary['market_value_cny']:,.2f}, 成本 {summary['cost_cny']:,.2f}, "
+              f"浮动盈亏 {summary['profit_loss_cny']:,.2f} (人民币，已计价 {summary['priced']} 个)")
+        
+        total_value += summary['market_value_cny']
+        total_cost += summary['cost_cny']
+        total_profit_loss += summary['profit_loss_cny']
+    
+    print("\n" + "-" * 40)
+    print(f"总市值: {total_value:,.2f} 元")
+    print(f"总成本: {total_cost:,.2f} 元")
+    print(f"总浮动盈亏: {total_profit_loss:,.2f} 元")
+    print(f"持仓表已增量更新 {updated} 个有新交易或新净值的持仓")
+    
+    input("\n按回车键返回...")
+
+
+def main(db=None):
+    """主函数，可以独立运行"""
+    if db is None:
+        db = get_database()
+    if not db.connect():
+            print_error("无法连接数据库，请检查数据库文件")
+            return
+    close_db = True
+    
+    try:
+        portfolio_valuation_function(db)
+    except Exception as e:
+        logger.error(f"持仓估值失败: {e}")
+        print_error(f"持仓估值失败: {e}")
+    finally:
+        if close_db:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,6 +1,6 @@
 # menu_functions/view_exchange_info.py
 import logging
-from database import get_database
+from database import get_read_only_database
 from utils import (
     print_header, print_warning, print_error, 
     safe_format, print_table, clear_screen
@@ -39,7 +39,8 @@ def view_exchange_info_function(db):
     """查看汇率信息"""
     print_header("查看汇率信息")
     
-    currencies = db.get_all_currencies()
+    # 一次查询取回所有货币及其最新汇率
+    currencies = db.get_latest_values("fx")
     
     if not currencies:
         print_warning("未找到货币信息")
@@ -55,12 +56,8 @@ def view_exchange_info_function(db):
     
     for currency in currencies:
         currency_code = currency.get('currency', 'N/A')
-        currency_id = currency.get('id')
-        
-        # 获取最新汇率
-        latest_rate = db.get_latest_exchange_rate(currency_id)
-        rate = latest_rate.get('rate') if latest_rate else None
-        date = latest_rate.get('date') if latest_rate else None
+        rate = currency.get('rate')
+        date = currency.get('date')
         
         rows.append([
             currency_code,
@@ -105,7 +102,8 @@ def view_exchange_info_function(db):
 def main(db=None):
     """主函数，可以独立运行"""
     if db is None:
-        db = get_database()
+        # 查看数据使用只读连接，不阻塞正在进行的数据更新
+        db = get_read_only_database()
     if not db.connect():
             print_error("无法连接数据库，请检查数据库文件")
             return
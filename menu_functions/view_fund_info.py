@@ -1,6 +1,6 @@
 # menu_functions/view_fund_info.py
 import logging
-from database import get_database
+from database import get_read_only_database
 from utils import (
     print_header, print_warning, print_error, 
     safe_format, print_table, clear_screen
@@ -43,7 +43,8 @@ def view_fund_info_function(db):
     """查看基金信息"""
     print_header("查看基金信息")
     
-    funds = db.get_all_funds()
+    # 一次查询取回所有基金及其最新净值
+    funds = db.get_latest_values("fund")
     
     if not funds:
         print_warning("未找到基金信息")
@@ -60,12 +61,8 @@ def view_fund_info_function(db):
     for fund in funds:
         code = fund.get('code', 'N/A')
         name = fund.get('name', 'N/A')
-        fund_id = fund.get('id')
-        
-        # 获取最新净值
-        latest_nav = db.get_latest_fund_nav(fund_id)
-        nav = latest_nav.get('nav') if latest_nav else None
-        date = latest_nav.get('date') if latest_nav else None
+        nav = fund.get('nav')
+        date = fund.get('date')
         
         # 限制名称长度
         display_name = name
@@ -116,7 +113,8 @@ def view_fund_info_function(db):
 def main(db=None):
     """主函数，可以独立运行"""
     if db is None:
-        db = get_database()
+        # 查看数据使用只读连接，不阻塞正在进行的数据更新
+        db = get_read_only_database()
     if not db.connect():
             print_error("无法连接数据库，请检查数据库文件")
             return
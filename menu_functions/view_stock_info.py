@@ -1,6 +1,6 @@
 # menu_functions/view_stock_info.py
 import logging
-from database import get_database
+from database import get_read_only_database
 from utils import (
     print_header, print_warning, print_error, 
     safe_format, print_table, clear_screen
@@ -43,7 +43,8 @@ def view_stock_info_function(db):
     """查看股票信息"""
     print_header("查看股票信息")
     
-    stocks = db.get_all_stocks()
+    # 一次查询取回所有股票及其最新净值
+    stocks = db.get_latest_values("stock")
     
     if not stocks:
         print_warning("未找到股票信息")
@@ -61,12 +62,8 @@ def view_stock_info_function(db):
         code = stock.get('code', 'N/A')
         name = stock.get('name', 'N/A')
         market = stock.get('market_code', 'N/A')
-        stock_id = stock.get('id')
-        
-        # 获取最新净值
-        latest_nav = db.get_latest_stock_nav(stock_id)
-        nav = latest_nav.get('nav') if latest_nav else None
-        date = latest_nav.get('date') if latest_nav else None
+        nav = stock.get('nav')
+        date = stock.get('date')
         
         # 使用安全格式化
         nav_str = safe_format(nav, "{:.4f}", "N/A")
@@ -112,7 +109,8 @@ def view_stock_info_function(db):
 def main(db=None):
     """主函数，可以独立运行"""
     if db is None:
-        db = get_database()
+        # 查看数据使用只读连接，不阻塞正在进行的数据更新
+        db = get_read_only_database()
     if not db.connect():
             print_error("无法连接数据库，请检查数据库文件")
             return
@@ -0,0 +1,61 @@
+# tests/fixtures.py
+"""测试用数据库：把 property.db 复制到临时目录，在副本上迁移和写入，不改动原数据库"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Dict
+
+from config import DB_FILE
+from database import DatabaseManager
+
+TRANSACTION_TABLES = {"stock": "stock_transactions", "fund": "fund_transactions"}
+VALUE_TABLES = {"stock": ("stock_net_asset_value", "stock_id", "nav"), "fund": ("fund_net_asset_value", "fund_id", "nav")}
+
+
+class FixtureDatabaseTestCase(unittest.TestCase):
+    """每个测试使用一份新的数据库副本"""
+    
+    def setUp(self):
+        if not Path(DB_FILE).exists():
+            self.skipTest(f"没有找到数据库 {DB_FILE}")
+        self._tmpdir = tempfile.TemporaryDirectory()
+        db_file = Path(self._tmpdir.name) / "fixture.db"
+        shutil.copy(DB_FILE, db_file)
+        self.db = DatabaseManager(str(db_file))
+        self.assertTrue(self.db.connect())
+    
+    def tearDown(self):
+        self.db.close()
+        self._tmpdir.cleanup()
+    
+    def add_transaction(self, kind: str, **changes: Any) -> Dict[str, Any]:
+        """复制最后一笔交易并按 changes 修改后插入，返回插入的行"""
+        table = TRANSACTION_TABLES[kind]
+        row = dict(self.db.conn.execute(f"SELECT * FROM {table} ORDER BY id DESC LIMIT 1").fetchone())
+        row.pop('id')
+        row.update(changes)
+        self._insert(table, row)
+        return row
+    
+    def add_value(self, kind: str, date: str, factor: float = 1.05) -> Dict[str, Any]:
+        """为最新一条净值所属的资产插入 date 的净值（最新净值乘以 factor），返回插入的行"""
+        table, id_column, value_column = VALUE_TABLES[kind]
+        row = dict(self.db.conn.execute(f"SELECT * FROM {table} ORDER BY date DESC, id DESC LIMIT 1").fetchone())
+        row.pop('id')
+        row['date'] = date
+        row[value_column] = float(row[value_column]) * factor
+        self._insert(table, row)
+        return row
+    
+    def latest_date(self, kind: str) -> str:
+        """某类资产最新的净值日期"""
+        table = VALUE_TABLES[kind][0]
+        return self.db.conn.execute(f"SELECT MAX(date) FROM {table}").fetchone()[0]
+    
+    def _insert(self, table: str, row: Dict[str, Any]):
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" * len(row))
+        with self.db.conn:
+            self.db.conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(row.values()))
\ No newline at end of file
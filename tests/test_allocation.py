@@ -0,0 +1,83 @@
+# tests/test_allocation.py
+import unittest
+
+import numpy as np
+
+from allocation import compute_allocation, update_allocation
+from tests.fixtures import FixtureDatabaseTestCase
+
+
+class AllocationTest(FixtureDatabaseTestCase):
+
+    def snapshot(self):
+        return [tuple(row) for row in self.db.conn.execute(
+            "SELECT dimension, date, member_id, market_value, weight FROM allocation_snapshot "
+            "ORDER BY dimension, date, member_id").fetchall()]
+    
+    def assert_same_rows(self, left, right):
+        self.assertEqual([row[:3] for row in left], [row[:3] for row in right])
+        np.testing.assert_allclose([row[3] for row in left], [row[3] for row in right], rtol=1e-9)
+    
+    def test_every_dimension_sums_to_the_same_total(self):
+        update_allocation(self.db)
+        rows = self.db.conn.execute(
+            "SELECT date, dimension, SUM(market_value), SUM(weight) FROM allocation_snapshot GROUP BY 1, 2"
+        ).fetchall()
+        self.assertTrue(rows)
+        totals = {}
+        for date, _, market_value, weight in rows:
+            totals.setdefault(date, []).append(market_value)
+            self.assertAlmostEqual(weight, 1.0, places=9)
+        for values in totals.values():
+            np.testing.assert_allclose(values, values[0], rtol=1e-9)
+    
+    def test_chunked_dates_match_a_single_chunk(self):
+        single = sorted(compute_allocation(self.db, chunk_dates=10 ** 6))
+        chunked = sorted(compute_allocation(self.db, chunk_dates=1))
+        self.assertTrue(single)
+        self.assert_same_rows(chunked, single)
+    
+    def test_incremental_update_matches_rebuild(self):
+        update_allocation(self.db)
+        transaction_date = self.latest_date("fund")
+        self.add_transaction("fund", transaction_date=transaction_date)
+        self.add_value("fund", "2099-01-02")
+        result = update_allocation(self.db)
+        # 只从新交易的日期起重算
+        self.assertEqual(result['start_date'], transaction_date[:10])
+        incremental = self.snapshot()
+        
+        update_allocation(self.db, rebuild=True)
+        self.assert_same_rows(incremental, self.snapshot())
+    
+    def test_earlier_first_fx_rate_recomputes_backfilled_dates(self):
+        update_allocation(self.db)
+        usd = self.db.get_currency_by_code("USD")['id']
+        first_rate = self.db.conn.execute("SELECT MIN(date) FROM foreign_exchange_rate WHERE currency_id = ?",
+                                          (usd,)).fetchone()[0]
+        # 新汇率早于原有的第一条汇率，但晚于美元持仓的第一笔交易
+        with self.db.conn:
+            self.db.conn.execute("INSERT INTO foreign_exchange_rate (currency_id, date, rate) VALUES (?, ?, ?)",
+                                 (usd, f"{int(first_rate[:4]) - 1}{first_rate[4:]}", 6.5))
+        result = update_allocation(self.db)
+        self.assertEqual(result['start_date'], self.db.get_first_position_date([usd]))
+        incremental = self.snapshot()
+        
+        update_allocation(self.db, rebuild=True)
+        self.assert_same_rows(incremental, self.snapshot())
+    
+    def test_deleted_source_row_rebuilds(self):
+        update_allocation(self.db)
+        with self.db.conn:
+            self.db.conn.execute("DELETE FROM fund_transactions WHERE id = (SELECT MAX(id) FROM fund_transactions)")
+        result = update_allocation(self.db)
+        self.assertIsNone(result['start_date'])
+        self.assertGreater(result['rows'], 0)
+    
+    def test_no_changes_skips_the_update(self):
+        update_allocation(self.db)
+        self.assertEqual(update_allocation(self.db), {'start_date': None, 'rows': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,61 @@
+# tests/test_currency_converter.py
+import unittest
+
+import numpy as np
+
+from currency_converter import CurrencyConverter, asof_lookup, to_days
+from tests.fixtures import FixtureDatabaseTestCase
+
+
+class AsofLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = np.array([2, 2, 3, 2])
+        self.days = to_days(["2026-01-10", "2026-01-05", "2026-01-07", "2026-01-20"])
+        self.values = np.array([7.1, 7.0, 0.9, 7.2])
+    
+    def test_takes_latest_value_on_or_before_date(self):
+        result = asof_lookup(self.keys, self.days, self.values, np.array([2, 2, 2, 2, 3]),
+                             to_days(["2026-01-05", "2026-01-09", "2026-01-10", "2026-02-01", "2026-01-08"]))
+        np.testing.assert_allclose(result, [7.0, 7.0, 7.1, 7.2, 0.9])
+    
+    def test_before_first_and_unknown_keys(self):
+        query_keys = np.array([2, 4])
+        query_days = to_days(["2026-01-01", "2026-01-10"])
+        self.assertTrue(np.isnan(asof_lookup(self.keys, self.days, self.values, query_keys, query_days)).all())
+        result = asof_lookup(self.keys, self.days, self.values, query_keys, query_days, before_first=True)
+        self.assertAlmostEqual(result[0], 7.0)
+        self.assertTrue(np.isnan(result[1]))
+    
+    def test_missing_query_dates_are_nan(self):
+        result = asof_lookup(self.keys, self.days, self.values, np.array([2]), to_days([None]), before_first=True)
+        self.assertTrue(np.isnan(result[0]))
+
+
+class CurrencyConverterTest(FixtureDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usd = self.db.get_currency_by_code("USD")['id']
+        self.cny = self.db.get_currency_by_code("CNY")['id']
+        with self.db.conn:
+            self.db.conn.execute("DELETE FROM foreign_exchange_rate")
+            self.db.conn.executemany("INSERT INTO foreign_exchange_rate (currency_id, rate, date) VALUES (?, ?, ?)",
+                                     [(self.usd, 7.0, "2026-01-05"), (self.usd, 7.2, "2026-01-10")])
+    
+    def test_rates_are_joined_as_of_each_date(self):
+        converter = CurrencyConverter(self.db, before_first=False)
+        rates = converter.rates_on(np.array([self.usd, self.usd, self.usd, self.usd, self.cny, -1]),
+                                   to_days(["2026-01-01", "2026-01-05", "2026-01-09", "2026-01-11",
+                                            "2026-01-01", "2026-01-01"]))
+        self.assertTrue(np.isnan(rates[0]))
+        np.testing.assert_allclose(rates[1:], [7.0, 7.0, 7.2, 1.0, 1.0])
+    
+    def test_other_base_currency_divides_by_its_rate(self):
+        converter = CurrencyConverter(self.db, base_currency="USD")
+        rates = converter.rates_on(np.array([self.cny, self.usd]), to_days(["2026-01-10", "2026-01-10"]))
+        np.testing.assert_allclose(rates, [1 / 7.2, 1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
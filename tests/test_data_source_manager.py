@@ -0,0 +1,48 @@
+# tests/test_data_source_manager.py
+import unittest
+from unittest import mock
+
+from data_sources.base_data_source import DataSourceType
+from data_sources.data_source_manager import DataSourceManager
+
+
+class FakeSource:
+    """按 prices 返回批量价格的数据源，记录每次请求的代码"""
+    
+    def __init__(self, source_type, prices):
+        self.source_type = source_type
+        self.prices = prices
+        self.requests = []
+    
+    def get_data_source_type(self):
+        return self.source_type
+    
+    def get_stock_prices_batch(self, codes, market_code):
+        self.requests.append(list(codes))
+        return {code: self.prices.get(code, (None, None)) for code in codes}
+
+
+class RouteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = DataSourceManager()
+        self.primary = FakeSource(DataSourceType.AKSHARE, {"AAPL": (1.0, "2026-10-16")})
+        self.secondary = FakeSource(DataSourceType.YFINANCE, {"MSFT": (2.0, "2026-10-16")})
+        patcher = mock.patch.object(DataSourceManager, "_iter_market_sources",
+                                    side_effect=lambda market: iter([self.primary, self.secondary]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_missing_codes_retried_on_next_source(self):
+        result = self.manager.get_stock_prices_batch(["AAPL", "MSFT", "NVDA"], "US")
+        self.assertEqual(result, {"AAPL": (1.0, "2026-10-16"), "MSFT": (2.0, "2026-10-16"), "NVDA": (None, None)})
+        self.assertEqual(self.secondary.requests, [["MSFT", "NVDA"]])
+    
+    def test_complete_result_skips_next_source(self):
+        self.manager.get_stock_prices_batch(["AAPL"], "US")
+        self.assertEqual(self.secondary.requests, [])
+    
+    def test_empty_batches_do_not_stop_routing_to_primary(self):
+        for _ in range(10):
+            self.manager.get_stock_prices_batch(["NVDA"], "US")
+        self.assertEqual(len(self.primary.requests), 10)
\ No newline at end of file
@@ -0,0 +1,64 @@
+# tests/test_db_writer.py
+import threading
+from unittest import mock
+
+from database import DatabaseManager
+from db_writer import DatabaseWriter
+from tests.fixtures import FixtureDatabaseTestCase
+
+
+class DatabaseWriterTest(FixtureDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stock_id = self.db.conn.execute("SELECT id FROM stock ORDER BY id LIMIT 1").fetchone()[0]
+        self.writer = DatabaseWriter(self.db.db_file, flush_interval=60)
+        self.writer.start()
+    
+    def tearDown(self):
+        self.writer.close()
+        super().tearDown()
+    
+    def flush(self):
+        """flush() 在子线程中执行，写线程卡住时测试失败而不是一直等待"""
+        thread = threading.Thread(target=self.writer.flush, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), "flush() 没有返回")
+    
+    def test_invalid_values_are_skipped(self):
+        self.writer.put("stock", self.stock_id, "2099-01-01", "abc")
+        self.writer.put("stock", self.stock_id, "2099-01-02", float("nan"))
+        self.writer.put("stock", self.stock_id, "2099-01-03", 1.5)
+        self.flush()
+        self.assertEqual(self.writer.get_stats()["stock"], (1, 2))
+        count = self.db.conn.execute("SELECT COUNT(*) FROM stock_net_asset_value WHERE stock_id = ? AND date >= ?",
+                                     (self.stock_id, "2099-01-01")).fetchone()[0]
+        self.assertEqual(count, 1)
+    
+    def test_write_error_does_not_stop_writer(self):
+        with mock.patch.object(DatabaseManager, "insert_stock_navs_bulk", side_effect=RuntimeError("boom")):
+            self.writer.put("stock", self.stock_id, "2099-01-01", 1.0)
+            self.flush()
+        self.assertEqual(self.writer.get_stats()["stock"], (0, 1))
+        
+        self.writer.put("stock", self.stock_id, "2099-01-02", 1.0)
+        self.flush()
+        self.assertEqual(self.writer.get_stats()["stock"], (1, 1))
+    
+    def test_closing_value_replaces_provisional_value(self):
+        self.writer.put("stock", self.stock_id, "2099-01-02", 1.0, provisional=True)
+        self.flush()
+        self.assertEqual(self.db.get_provisional_quotes("stock"), {self.stock_id: "2099-01-02"})
+        
+        self.writer.put("stock", self.stock_id, "2099-01-02", 1.2)
+        self.flush()
+        nav = self.db.conn.execute("SELECT nav FROM stock_net_asset_value WHERE stock_id = ? AND date = ?",
+                                   (self.stock_id, "2099-01-02")).fetchone()[0]
+        self.assertAlmostEqual(nav, 1.2)
+        self.assertEqual(self.db.get_provisional_quotes("stock"), {})
+        
+        # 没有临时记录时，已存在的日期仍然跳过
+        self.writer.put("stock", self.stock_id, "2099-01-02", 1.3)
+        self.flush()
+        self.assertEqual(self.writer.get_stats()["stock"], (2, 1))
\ No newline at end of file
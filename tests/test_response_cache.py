@@ -0,0 +1,75 @@
+# tests/test_response_cache.py
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+
+from data_sources.akshare_data_source import AkshareDataSource
+from data_sources.base_data_source import DataSource
+from data_sources.response_cache import ResponseCache
+
+
+class FakeCalendar:
+    """交易时段内 snapshot_session_date 返回 None，收盘后返回当日"""
+    
+    def __init__(self):
+        self.in_session = True
+    
+    def snapshot_session_date(self, market):
+        return None if self.in_session else "2026-10-16"
+    
+    def last_closed_session(self, market):
+        return "2026-10-15" if self.in_session else "2026-10-16"
+
+
+class RealtimeEndpointCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self._tmpdir.name, ttl=3600, enabled=True)
+        self.calendar = FakeCalendar()
+        self.frames = []
+        self.source = object.__new__(AkshareDataSource)
+        self.source.ak = SimpleNamespace(stock_zh_a_spot_em=self._spot, currency_boc_safe=self._spot)
+        self.source.timeout = 5
+        self.source._snapshots = {}
+        self.source._snapshot_lock = threading.Lock()
+        for patcher in (
+            mock.patch("data_sources.response_cache._response_cache", self.cache),
+            mock.patch("data_sources.akshare_data_source.get_trading_calendar", return_value=self.calendar),
+            mock.patch.object(DataSource, "_throttle"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        self._tmpdir.cleanup()
+    
+    def _spot(self):
+        return self.frames.pop(0)
+    
+    def test_session_snapshot_not_reused_after_close(self):
+        self.frames = [
+            pd.DataFrame({"代码": ["600000"], "最新价": [10.5], "昨收": [10.0]}),
+            pd.DataFrame({"代码": ["600000"], "最新价": [10.8], "昨收": [10.0]}),
+        ]
+        during = self.source.get_stock_prices_batch(["600000"], "SH")
+        self.assertEqual(during["600000"], (10.0, "2026-10-15"))
+        
+        # 收盘后内存中的快照已过期，重新下载而不是读取交易时段内写入的响应缓存
+        self.calendar.in_session = False
+        self.source._snapshots.clear()
+        after = self.source.get_stock_prices_batch(["600000"], "SH")
+        self.assertEqual(after["600000"], (10.8, "2026-10-16"))
+        self.assertEqual(self.frames, [])
+    
+    def test_other_endpoints_are_cached(self):
+        frame = pd.DataFrame({"日期": ["2026-10-16"], "美元": [712.0]})
+        self.frames = [frame]
+        self.source._fetch("currency_boc_safe", self.source.ak.currency_boc_safe)
+        cached = self.source._fetch("currency_boc_safe", self.source.ak.currency_boc_safe)
+        self.assertIs(type(cached), pd.DataFrame)
+        self.assertEqual(self.frames, [])
\ No newline at end of file
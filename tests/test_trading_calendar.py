@@ -0,0 +1,16 @@
+# tests/test_trading_calendar.py
+import unittest
+from unittest import mock
+
+from data_sources.trading_calendar import plan_stale_assets
+
+
+class PlanStaleAssetsTest(unittest.TestCase):
+
+    def test_provisional_latest_value_is_refetched(self):
+        calendar = mock.Mock(**{"last_closed_session.return_value": "2026-10-16"})
+        assets = [{"id": 1, "market_code": "US", "date": "2026-10-16"},
+                  {"id": 2, "market_code": "US", "date": "2026-10-16"}]
+        stale, up_to_date = plan_stale_assets("stock", assets, calendar=calendar, provisional={2: "2026-10-16"})
+        self.assertEqual([asset["id"] for asset in stale], [2])
+        self.assertEqual([asset["id"] for asset in up_to_date], [1])
\ No newline at end of file
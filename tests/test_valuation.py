@@ -0,0 +1,107 @@
+# tests/test_valuation.py
+import unittest
+
+import numpy as np
+
+from tests.fixtures import FixtureDatabaseTestCase
+from valuation import apply_transactions, rebuild_holdings, transaction_signs, update_holdings
+
+HOLDING_QUERIES = {
+    "stock": """SELECT stock_id, position_quantity, cost_price, floating_profit_loss, profit_loss_percentage,
+                annualized_return FROM stock_position_holding ORDER BY stock_id""",
+    "fund": """SELECT fund_id, date, position_quantity, cost_price, floating_profit_loss, profit_loss_percentage,
+               annualized_return FROM fund_position_holding ORDER BY fund_id""",
+}
+# 持仓表的键列数：每个资产一行，基金还有估值所用的净值日期
+KEY_LENGTHS = {"stock": 1, "fund": 2}
+
+
+class TransactionSignsTest(unittest.TestCase):
+
+    def test_signed_quantity_mapping(self):
+        # 1 买入, 2 卖出, 3 分红, 4 保费, 5 现金价值提取；未知类型和未设置（-1）不改变持仓
+        signs = transaction_signs(np.array([1, 2, 3, 4, 5, 0, 9, -1]))
+        np.testing.assert_array_equal(signs, [1, -1, 1, 1, -1, 0, 0, 0])
+
+
+class ApplyTransactionsTest(unittest.TestCase):
+
+    def test_moving_average_cost_basis_on_sell(self):
+        states = {}
+        touched = apply_transactions(states, [
+            # (交易ID, 资产ID, 账户ID, 类型ID, 日期, 数量, 发生额)，买入发生额为负
+            (1, 7, 1, 1, "2026-01-01", 100, -1000.0),
+            (2, 7, 1, 1, "2026-01-02", 100, -2000.0),
+            (3, 7, 1, 2, "2026-01-03", 50, 1500.0),
+            (4, 7, 1, 3, "2026-01-04", 0, 30.0),
+        ])
+        
+        self.assertEqual(touched, {7})
+        quantity, invested, cost_basis, realized = states[(7, 1)]
+        self.assertAlmostEqual(quantity, 150)
+        self.assertAlmostEqual(invested, 1000 + 2000 - 1500 - 30)
+        # 卖出结转 50/200 的成本，剩余成本按平均成本 15 计
+        self.assertAlmostEqual(cost_basis, 2250)
+        self.assertAlmostEqual(realized, (1500 - 750) + 30)
+    
+    def test_accounts_are_kept_apart(self):
+        states = {}
+        apply_transactions(states, [
+            (1, 7, 1, 1, "2026-01-01", 100, -1000.0),
+            (2, 7, None, 1, "2026-01-01", 10, -120.0),
+        ])
+        self.assertEqual(sorted(states), [(7, 0), (7, 1)])
+        self.assertAlmostEqual(states[(7, 0)][0], 10)
+
+
+class IncrementalHoldingsTest(FixtureDatabaseTestCase):
+    """增量更新的持仓表与从全部交易重新累计的结果一致"""
+    
+    def holdings(self, kind):
+        return [tuple(row) for row in self.db.conn.execute(HOLDING_QUERIES[kind]).fetchall()]
+    
+    def assert_matches_rebuild(self, kind):
+        incremental = self.holdings(kind)
+        self.assertTrue(incremental)
+        rebuild_holdings(self.db, kind)
+        full = self.holdings(kind)
+        self.assertEqual(len(incremental), len(full))
+        key_length = KEY_LENGTHS[kind]
+        for left, right in zip(incremental, full):
+            self.assertEqual(left[:key_length], right[:key_length])
+            np.testing.assert_allclose(np.array(left[key_length:], dtype=float),
+                                       np.array(right[key_length:], dtype=float), rtol=1e-6, atol=1e-6)
+    
+    def test_new_transactions_and_values(self):
+        for kind in ("stock", "fund"):
+            update_holdings(self.db, kind)
+            self.add_transaction(kind, transaction_date=self.latest_date(kind))
+            self.add_value(kind, "2099-01-02")
+            result = update_holdings(self.db, kind)
+            self.assertEqual(result['transactions'], 1)
+            self.assert_matches_rebuild(kind)
+    
+    def test_deleted_transaction_recounts_everything(self):
+        update_holdings(self.db, "fund")
+        with self.db.conn:
+            self.db.conn.execute("DELETE FROM fund_transactions WHERE id = (SELECT MAX(id) FROM fund_transactions)")
+        update_holdings(self.db, "fund")
+        self.assert_matches_rebuild("fund")
+    
+    def test_new_fund_value_updates_the_existing_row(self):
+        update_holdings(self.db, "fund")
+        before = len(self.holdings("fund"))
+        fund_id = self.add_value("fund", "2099-01-02")['fund_id']
+        update_holdings(self.db, "fund")
+        self.assertEqual(len(self.holdings("fund")), before)
+        dates = [row[1] for row in self.holdings("fund") if row[0] == fund_id]
+        self.assertEqual(dates, ["2099-01-02"])
+    
+    def test_no_changes_writes_nothing(self):
+        update_holdings(self.db, "stock")
+        result = update_holdings(self.db, "stock")
+        self.assertEqual(result, {'transactions': 0, 'positions': 0, 'written': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
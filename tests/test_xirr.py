@@ -0,0 +1,75 @@
+# tests/test_xirr.py
+import unittest
+
+import numpy as np
+
+from xirr import RATE_LOWER, RATE_UPPER, pad_cash_flows, solve_xirr, xirr_matrix
+
+
+def scalar_xirr(amounts, days, tolerance=1e-10):
+    """逐个持仓的二分法参考实现"""
+    years = (np.asarray(days) - days[0]) / 365.0
+    
+    def npv(rate):
+        return sum(amount * (1.0 + rate) ** -year for amount, year in zip(amounts, years))
+    
+    lower, upper = RATE_LOWER, RATE_UPPER
+    if np.sign(npv(lower)) == np.sign(npv(upper)):
+        return np.nan
+    while upper - lower > tolerance:
+        middle = (lower + upper) / 2
+        if np.sign(npv(middle)) == np.sign(npv(lower)):
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+def random_cash_flows(count, seed=0):
+    """count 个持仓的随机现金流：先投入，之后若干笔投入或收回，最后一笔为期末市值"""
+    rng = np.random.default_rng(seed)
+    group_ids, days, amounts = [], [], []
+    for group in range(count):
+        flows = rng.integers(2, 8)
+        group_days = np.sort(rng.choice(np.arange(1, 2000), flows - 1, replace=False))
+        group_amounts = np.concatenate([[-1000.0], rng.normal(-200, 300, flows - 2), [rng.uniform(500, 4000)]])
+        group_ids += [group] * flows
+        days += [0] + group_days.tolist()
+        amounts += group_amounts.tolist()
+    dates = np.datetime64("2020-01-01") + np.array(days).astype("timedelta64[D]")
+    return np.array(group_ids), dates, np.array(amounts)
+
+
+class XirrTest(unittest.TestCase):
+
+    def test_batched_matches_scalar_bisection(self):
+        group_ids, dates, amounts = random_cash_flows(60)
+        ids, rates = solve_xirr(group_ids, dates, amounts)
+        
+        day_numbers = dates.astype(np.int64)
+        for group, rate in zip(ids, rates):
+            selected = group_ids == group
+            expected = scalar_xirr(amounts[selected], day_numbers[selected])
+            if np.isnan(expected):
+                self.assertTrue(np.isnan(rate), f"持仓 {group}")
+            else:
+                self.assertAlmostEqual(rate, expected, places=6, msg=f"持仓 {group}")
+    
+    def test_bisection_fallback_matches_newton(self):
+        _, amount_matrix, year_matrix = pad_cash_flows(*random_cash_flows(30, seed=1))
+        newton = xirr_matrix(amount_matrix, year_matrix)
+        # 不做牛顿迭代时全部由二分法求解
+        bisection = xirr_matrix(amount_matrix, year_matrix, max_iterations=0)
+        np.testing.assert_allclose(bisection, newton, atol=1e-6)
+    
+    def test_unsolvable_rows_are_nan(self):
+        amounts = np.array([[-100.0, -50.0, 0.0], [100.0, 20.0, 0.0], [-100.0, 110.0, 0.0]])
+        years = np.array([[0.0, 1.0, 0.0], [0.0, 1.0, 0.0], [0.0, 1.0, 0.0]])
+        rates = xirr_matrix(amounts, years)
+        self.assertTrue(np.isnan(rates[0]))
+        self.assertTrue(np.isnan(rates[1]))
+        self.assertAlmostEqual(rates[2], 0.1, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,391 @@
+# valuation.py
+"""
+持仓估值
+
+把交易记录、最新净值和汇率一次读入 NumPy 数组，按资产分组汇总持仓数量和成本，
+再整体计算市值（原币和人民币）、浮动盈亏和盈亏百分比，结果批量写回持仓表。
+外币按估值日当天或之前最近的汇率换算（currency_converter 模块）；value_history 按同样的
+as-of 连接计算每个资产每个净值日的持仓数量和人民币市值。
+
+年化收益率按资金加权（XIRR）计算：交易发生额为现金流，估值日的市值为最后一笔流入，
+所有持仓由 xirr 模块批量求解。
+
+增量模式（update_holdings）在 position_state 表中保存每个资产、账户的累计持仓，
+只计入交易高水位之后的新交易，只重写有新交易或新净值的持仓行。
+
+用法: python -m valuation [--full] [--workers N]
+"""
+
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import LOG_LEVEL, XIRR_WORKERS
+from currency_converter import CurrencyConverter, asof_lookup, to_days
+from database import DatabaseManager, POSITION_TABLES, get_database
+from utils import setup_logging
+from xirr import solve_xirr
+
+logger = logging.getLogger(__name__)
+
+# 交易类型ID -> 持仓数量变化方向（type_transaction 表: 1 买入, 2 卖出, 3 分红/利息, 4 保费缴纳, 5 现金价值提取）
+QUANTITY_SIGNS = {1: 1.0, 2: -1.0, 3: 1.0, 4: 1.0, 5: -1.0}
+
+
+def _column(rows: List[Tuple], index: int) -> np.ndarray:
+    """取元组列表中的一列转换为浮点数组，None 转为 NaN"""
+    return np.array([row[index] for row in rows], dtype=float)
+
+
+def _id_column(rows: List[Tuple], index: int) -> np.ndarray:
+    """取元组列表中的一列转换为整数数组，None 转为 -1"""
+    return np.nan_to_num(_column(rows, index), nan=-1).astype(np.int64)
+
+
+def transaction_signs(type_ids: np.ndarray) -> np.ndarray:
+    """交易类型ID对应的持仓数量变化方向，未知类型为 0"""
+    table = np.zeros(max(QUANTITY_SIGNS) + 1)
+    for type_id, sign in QUANTITY_SIGNS.items():
+        table[type_id] = sign
+    known = (type_ids >= 0) & (type_ids < len(table))
+    return np.where(known, table[np.clip(type_ids, 0, len(table) - 1)], 0.0)
+
+
+def aggregate_positions(asset_ids: np.ndarray, type_ids: np.ndarray, quantities: np.ndarray,
+                        amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按资产分组汇总交易，返回 (资产ID, 持仓数量, 持仓成本)
+    
+    持仓数量 = Σ 方向 × 数量；持仓成本 = -Σ 发生额（买入发生额为负，卖出和分红为正）
+    """
+    ids, groups = np.unique(asset_ids, return_inverse=True)
+    signed_quantities = transaction_signs(type_ids) * np.nan_to_num(quantities)
+    quantity = np.bincount(groups, weights=signed_quantities, minlength=len(ids))
+    cost = -np.bincount(groups, weights=np.nan_to_num(amounts), minlength=len(ids))
+    return ids, quantity, cost
+
+
+def lookup(keys: np.ndarray, values: np.ndarray, query: np.ndarray, default: Any = np.nan) -> np.ndarray:
+    """按 query 在 keys 中查找对应的 values，找不到时取 default（keys 不要求有序、不能重复）"""
+    if len(keys) == 0:
+        return np.full(len(query), default, dtype=values.dtype if values.dtype == object else float)
+    
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    positions = np.clip(np.searchsorted(sorted_keys, query), 0, len(keys) - 1)
+    found = sorted_keys[positions] == query
+    return np.where(found, values[order][positions], default)
+
+
+def value_positions(quantity: np.ndarray, cost: np.ndarray, price: np.ndarray,
+                    fx_rate: np.ndarray) -> Dict[str, np.ndarray]:
+    """按持仓数量、原币成本、最新价格和汇率（1 单位外币折合人民币）整体计算估值
+    
+    没有价格或汇率的持仓结果为 NaN；成本不为正（投入已全部收回）时不计算盈亏百分比
+    """
+    market_value = quantity * price
+    profit_loss = market_value - cost
+    percentage = np.full(len(cost), np.nan)
+    np.divide(profit_loss, cost, out=percentage, where=cost > 0)
+    return {
+        'market_value': market_value,
+        'market_value_cny': market_value * fx_rate,
+        'cost_cny': cost * fx_rate,
+        'profit_loss': profit_loss,
+        'profit_loss_cny': profit_loss * fx_rate,
+        'profit_loss_percentage': percentage,
+    }
+
+
+def annualized_returns(transactions: List[Tuple], asset_ids: np.ndarray, valuation_dates: np.ndarray,
+                       market_values: np.ndarray, workers: int = XIRR_WORKERS) -> np.ndarray:
+    """持仓的年化收益率（XIRR），按 asset_ids 对齐；没有市值或无解的持仓为 NaN
+    
+    现金流为各笔交易的发生额（买入为负，卖出和分红为正）加上估值日的市值
+    """
+    priced = ~np.isnan(market_values)
+    flow_ids = np.concatenate([_id_column(transactions, 1), asset_ids[priced]])
+    flow_dates = np.array([str(row[4] or "NaT")[:10] for row in transactions] + list(valuation_dates[priced]),
+                          dtype="datetime64[D]")
+    flow_amounts = np.concatenate([np.nan_to_num(_column(transactions, 6)), market_values[priced]])
+    
+    dated = ~np.isnat(flow_dates)
+    ids, rates = solve_xirr(flow_ids[dated], flow_dates[dated], flow_amounts[dated], workers)
+    return np.where(priced, lookup(ids, rates, asset_ids), np.nan)
+
+
+def _valuation_dates(dates: np.ndarray) -> np.ndarray:
+    """估值日期：最新净值的日期，没有净值时取当天"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    return np.array([str(date)[:10] if date else today for date in dates], dtype=object)
+
+
+def _to_optional(value: float) -> Optional[float]:
+    """NaN 转为 None，写入数据库为 NULL"""
+    return None if np.isnan(value) else float(value)
+
+
+def revalue(db: DatabaseManager, kind: str, converter: Optional[CurrencyConverter] = None,
+            write: bool = True, workers: int = XIRR_WORKERS) -> Dict[str, Any]:
+    """重新计算某类持仓（stock/fund）的估值，write 为 True 时批量写回持仓表
+    
+    fx_rate 为估值日期当天或之前最近的汇率（折合基准货币），*_cny 各项为基准货币金额
+    
+    返回结果中各数组按资产ID对齐：asset_id, code, name, currency_id, date, valuation_date, quantity, cost,
+    price, fx_rate, annualized_return 以及 value_positions 的各项结果
+    """
+    if kind not in POSITION_TABLES:
+        raise ValueError(f"不支持的持仓类别: {kind}")
+    
+    transactions = db.get_transaction_rows(kind)
+    assets = db.get_latest_values(kind)
+    if converter is None:
+        converter = CurrencyConverter(db)
+    
+    started = time.perf_counter()
+    asset_ids, quantity, cost = aggregate_positions(
+        _id_column(transactions, 1), _id_column(transactions, 3),
+        _column(transactions, 5), _column(transactions, 6)
+    )
+    
+    # 资产的最新价格、日期、币种按资产ID对齐到持仓
+    field = _asset_fields(assets, asset_ids)
+    price = np.array(field('nav'), dtype=float)
+    currency_ids = np.array([-1 if c is None else c for c in field('currency_id')], dtype=np.int64)
+    valuation_dates = _valuation_dates(field('date'))
+    fx_rate = converter.rates_on(currency_ids, to_days(valuation_dates))
+    
+    result = {
+        'kind': kind,
+        'asset_id': asset_ids,
+        'code': field('code'),
+        'name': field('name'),
+        'currency_id': currency_ids,
+        'date': field('date'),
+        'valuation_date': valuation_dates,
+        'quantity': quantity,
+        'cost': cost,
+        'price': price,
+        'fx_rate': fx_rate,
+    }
+    result.update(value_positions(quantity, cost, price, fx_rate))
+    result['annualized_return'] = annualized_returns(
+        transactions, asset_ids, result['valuation_date'], result['market_value'], workers
+    )
+    elapsed = time.perf_counter() - started
+    logger.info(f"{kind} 持仓估值完成: {len(asset_ids)} 个持仓, {len(transactions)} 条交易, "
+                f"计算耗时 {elapsed * 1000:.1f} ms")
+    
+    if write:
+        result['written'] = db.upsert_position_holdings(kind, _holding_rows(result))
+    return result
+
+
+def _asset_fields(assets: List[Dict[str, Any]], asset_ids: np.ndarray) -> Callable[[str], np.ndarray]:
+    """返回按 asset_ids 顺序取资产字段的函数，资产表中不存在的资产为 None"""
+    asset_keys = np.array([asset['id'] for asset in assets], dtype=np.int64)
+    index = lookup(asset_keys, np.arange(len(assets)), asset_ids, default=-1).astype(np.int64)
+    index[index < 0] = len(assets)
+    
+    def field(name: str) -> np.ndarray:
+        values = np.array([asset.get(name) for asset in assets] + [None], dtype=object)
+        return values[index]
+    
+    return field
+
+
+def _holding_rows(result: Dict[str, Any]) -> List[Tuple]:
+    """估值结果转换为持仓表的行 (资产ID, 估值日期, 持仓数量, 持仓成本, 浮动盈亏, 浮动盈亏百分比, 年化收益率)
+    
+    持仓表保存原币金额
+    """
+    return [
+        (int(asset_id), date, float(quantity), float(cost),
+         _to_optional(profit_loss), _to_optional(percentage), _to_optional(annualized_return))
+        for asset_id, date, quantity, cost, profit_loss, percentage, annualized_return in zip(
+            result['asset_id'], result['valuation_date'], result['quantity'], result['cost'],
+            result['profit_loss'], result['profit_loss_percentage'], result['annualized_return'])
+    ]
+
+
+def revalue_all(db: DatabaseManager, write: bool = True, workers: int = XIRR_WORKERS) -> Dict[str, Dict[str, Any]]:
+    """重新计算股票和基金持仓的估值，汇率只读取一次"""
+    converter = CurrencyConverter(db)
+    return {kind: revalue(db, kind, converter, write, workers) for kind in POSITION_TABLES}
+
+
+def cumulative_by_key(keys: np.ndarray, days: np.ndarray,
+                      values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按 (键, 日期) 排序后分组累计 values，返回排序后的 (键, 日期, 累计值)，可直接用于 asof_lookup"""
+    order = np.lexsort((days, keys))
+    keys, days, values = keys[order], days[order], values[order]
+    running = np.cumsum(values)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(running[starts] - values[starts], np.diff(np.r_[starts, len(keys)]))
+    return keys, days, running - offsets
+
+
+def value_history(db: DatabaseManager, kind: str, converter: Optional[CurrencyConverter] = None,
+                  start_date: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """计算某类持仓（stock/fund）每个资产每个净值日的持仓数量和市值（原币和基准货币）
+    
+    持仓数量是交易日期不晚于净值日期的全部交易的累计数量，汇率取净值日期当天或之前最近的汇率，
+    两者都是 as-of 连接；从未持有的资产不返回。返回按资产ID和日期排序的数组：asset_id, date,
+    currency_id, nav, quantity, fx_rate, market_value, market_value_cny
+    """
+    if kind not in POSITION_TABLES:
+        raise ValueError(f"不支持的持仓类别: {kind}")
+    converter = converter or CurrencyConverter(db)
+    
+    transactions = db.get_transaction_rows(kind)
+    asset_ids = _id_column(transactions, 1)
+    days = to_days([row[4] for row in transactions])
+    signed = transaction_signs(_id_column(transactions, 3)) * np.nan_to_num(_column(transactions, 5))
+    
+    asset_ids, days, cumulative = cumulative_by_key(asset_ids, days, signed)
+    
+    series = converter.convert_series(kind, start_date)
+    held = np.isin(series['asset_id'], asset_ids)
+    series = {name: values[held] for name, values in series.items()}
+    quantity = np.nan_to_num(asof_lookup(asset_ids, days, cumulative, series['asset_id'], series['date']))
+    market_value = quantity * series['value']
+    return {
+        'asset_id': series['asset_id'],
+        'date': series['date'],
+        'currency_id': series['currency_id'],
+        'nav': series['value'],
+        'quantity': quantity,
+        'fx_rate': series['fx_rate'],
+        'market_value': market_value,
+        'market_value_cny': market_value * series['fx_rate'],
+    }
+
+
+def apply_transactions(states: Dict[Tuple[int, int], List[float]], transactions: List[Tuple]) -> Set[int]:
+    """按交易ID顺序把交易计入累计持仓，返回涉及的资产ID
+    
+    states 为 {(资产ID, 账户ID): [数量, 净投入, 剩余成本, 已实现盈亏]}，原地更新。净投入与全量估值的
+    持仓成本一致（-Σ 发生额）；剩余成本按移动加权平均法结转，卖出和现金价值提取时收回金额与结转成本
+    之差、以及分红收到的现金计入已实现盈亏
+    """
+    touched = set()
+    for _, asset_id, account_id, type_id, _, quantity, amount in transactions:
+        state = states.setdefault((asset_id, account_id or 0), [0.0, 0.0, 0.0, 0.0])
+        quantity, amount = quantity or 0.0, amount or 0.0
+        sign = QUANTITY_SIGNS.get(type_id, 0.0)
+        
+        state[1] -= amount
+        if sign < 0:
+            released = state[2] * min(quantity / state[0], 1.0) if state[0] > 0 else 0.0
+            state[2] -= released
+            state[3] += amount - released
+        elif type_id == 3:
+            state[3] += amount
+        else:
+            state[2] -= amount
+        state[0] += sign * quantity
+        touched.add(asset_id)
+    return touched
+
+
+def update_holdings(db: DatabaseManager, kind: str, workers: int = XIRR_WORKERS) -> Dict[str, int]:
+    """增量更新某类持仓（stock/fund）的持仓表
+    
+    只读取交易高水位之后的新交易计入 position_state，只重写有新交易或净值日期比上次估值更新的资产，
+    年化收益率只读取这些资产的交易重新求解；
+    交易记录被删除（最大交易ID小于高水位）时自动从全部交易重新累计。交易被修改时需用 rebuild_holdings
+    返回 {'transactions': 新计入的交易数, 'positions': 更新的持仓数, 'written': 写入持仓表的行数}
+    """
+    if kind not in POSITION_TABLES:
+        raise ValueError(f"不支持的持仓类别: {kind}")
+    
+    started = time.perf_counter()
+    last_id = db.get_valuation_watermark(kind)
+    if last_id and db.get_last_transaction_id(kind) < last_id:
+        logger.warning(f"{kind} 交易记录的最大ID小于已计入的高水位 {last_id}，从全部交易重新累计")
+        db.reset_position_state(kind)
+        last_id = 0
+    
+    transactions = db.get_transaction_rows(kind, after_id=last_id)
+    touched: Set[int] = set()
+    if transactions:
+        states = db.get_position_states(kind, sorted({row[1] for row in transactions}))
+        touched = apply_transactions(states, transactions)
+        if not db.save_position_states(kind, states, transactions[-1][0]):
+            return {'transactions': 0, 'positions': 0, 'written': 0}
+    
+    affected = sorted(touched | set(db.get_repriced_assets(kind)))
+    totals = db.get_position_totals(kind, affected) if affected else []
+    written = 0
+    if totals:
+        asset_ids = np.array([row[0] for row in totals], dtype=np.int64)
+        quantity = np.array([row[1] for row in totals], dtype=float)
+        cost = np.array([row[2] for row in totals], dtype=float)
+        field = _asset_fields(db.get_latest_values(kind), asset_ids)
+        price = np.array(field('nav'), dtype=float)
+        
+        # 持仓表保存原币金额，不需要汇率
+        result = {'asset_id': asset_ids, 'date': field('date'), 'valuation_date': _valuation_dates(field('date')),
+                  'quantity': quantity, 'cost': cost}
+        result.update(value_positions(quantity, cost, price, np.ones(len(asset_ids))))
+        result['annualized_return'] = annualized_returns(
+            db.get_transaction_rows(kind, asset_ids=asset_ids.tolist()), asset_ids,
+            result['valuation_date'], result['market_value'], workers
+        )
+        written = db.upsert_position_holdings(kind, _holding_rows(result))
+        db.set_valuation_quote_dates(kind, [
+            (int(asset_id), date) for asset_id, date in zip(asset_ids, result['date']) if date
+        ])
+    
+    logger.info(f"{kind} 持仓增量更新完成: 新交易 {len(transactions)} 条, 更新持仓 {len(totals)} 个, "
+                f"耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+    return {'transactions': len(transactions), 'positions': len(totals), 'written': written}
+
+
+def rebuild_holdings(db: DatabaseManager, kind: str, workers: int = XIRR_WORKERS) -> Dict[str, int]:
+    """清空累计数据后从全部交易重新累计并更新持仓表（交易记录被修改后使用）"""
+    db.reset_position_state(kind)
+    return update_holdings(db, kind, workers)
+
+
+def summarize(result: Dict[str, Any]) -> Dict[str, float]:
+    """汇总人民币市值、成本和浮动盈亏（缺少价格或汇率的持仓不计入市值和盈亏）"""
+    priced = ~np.isnan(result['market_value_cny'])
+    return {
+        'positions': int(len(result['asset_id'])),
+        'priced': int(priced.sum()),
+        'market_value_cny': float(result['market_value_cny'][priced].sum()),
+        'cost_cny': float(result['cost_cny'][priced].sum()),
+        'profit_loss_cny': float(result['profit_loss_cny'][priced].sum()),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口：增量更新股票和基金持仓表（供定时任务在获取数据后运行），--full 时重新累计全部交易"""
+    parser = argparse.ArgumentParser(prog="python -m valuation", description="更新持仓估值并写回持仓表")
+    parser.add_argument("--full", action="store_true", help="清空累计数据，从全部交易重新计算（交易记录被修改后使用）")
+    parser.add_argument("--workers", type=int, default=XIRR_WORKERS,
+                        help=f"求解年化收益率的进程数（默认: {XIRR_WORKERS}）")
+    args = parser.parse_args(argv)
+    setup_logging(LOG_LEVEL)
+    
+    db = get_database()
+    if not db.connect():
+        logger.error("无法连接数据库")
+        return 1
+    try:
+        update = rebuild_holdings if args.full else update_holdings
+        for kind in POSITION_TABLES:
+            result = update(db, kind, args.workers)
+            print(f"{kind}: 新交易 {result['transactions']} 条, 更新持仓 {result['positions']} 个")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,134 @@
+# xirr.py
+"""
+批量求解年化收益率（XIRR）
+
+每个持仓的不规则现金流排成矩阵的一行（不足的位置补 0），所有持仓同时做牛顿迭代；
+未收敛或迭代越界的持仓改用向量化的二分法。持仓很多时按块分给进程池并行求解。
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+import numpy as np
+
+from config import XIRR_MAX_ITERATIONS, XIRR_TOLERANCE, XIRR_WORKERS, XIRR_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 收益率的求解范围
+RATE_LOWER = -0.99
+RATE_UPPER = 100.0
+NEWTON_INITIAL_RATE = 0.1
+BISECTION_MAX_ITERATIONS = 200
+
+
+def pad_cash_flows(group_ids: np.ndarray, dates: np.ndarray,
+                   amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按持仓分组排列现金流，返回 (持仓ID, 金额矩阵, 年数矩阵)
+    
+    矩阵每行是一个持仓的现金流，年数从该持仓第一笔现金流的日期起按 365 天计；不足的位置为 0
+    """
+    ids, groups = np.unique(group_ids, return_inverse=True)
+    if len(ids) == 0:
+        return ids, np.zeros((0, 0)), np.zeros((0, 0))
+    
+    order = np.argsort(groups, kind="stable")
+    groups = groups[order]
+    days = dates.astype("datetime64[D]").astype(np.int64)[order]
+    counts = np.bincount(groups, minlength=len(ids))
+    columns = np.arange(len(groups)) - (np.cumsum(counts) - counts)[groups]
+    
+    first_day = np.full(len(ids), np.iinfo(np.int64).max)
+    np.minimum.at(first_day, groups, days)
+    
+    amount_matrix = np.zeros((len(ids), counts.max()))
+    year_matrix = np.zeros_like(amount_matrix)
+    amount_matrix[groups, columns] = amounts[order]
+    year_matrix[groups, columns] = (days - first_day[groups]) / 365.0
+    return ids, amount_matrix, year_matrix
+
+
+def _npv(rates: np.ndarray, amounts: np.ndarray, years: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """各行现金流在对应收益率下的净现值及其对收益率的导数"""
+    base = 1.0 + rates[:, None]
+    discounted = np.where(amounts != 0, amounts * base ** -years, 0.0)
+    npv = discounted.sum(axis=1)
+    derivative = (-years * discounted / base).sum(axis=1)
+    return npv, derivative
+
+
+def _bisect(amounts: np.ndarray, years: np.ndarray, tolerance: float) -> np.ndarray:
+    """向量化二分法，求解范围两端净现值同号的行返回 NaN"""
+    lower = np.full(len(amounts), RATE_LOWER)
+    upper = np.full(len(amounts), RATE_UPPER)
+    npv_lower, _ = _npv(lower, amounts, years)
+    npv_upper, _ = _npv(upper, amounts, years)
+    bracketed = np.sign(npv_lower) * np.sign(npv_upper) < 0
+    
+    for _ in range(BISECTION_MAX_ITERATIONS):
+        if np.all(upper - lower < tolerance):
+            break
+        middle = (lower + upper) / 2
+        npv_middle, _ = _npv(middle, amounts, years)
+        same_side = np.sign(npv_middle) == np.sign(npv_lower)
+        lower = np.where(same_side, middle, lower)
+        npv_lower = np.where(same_side, npv_middle, npv_lower)
+        upper = np.where(same_side, upper, middle)
+    
+    return np.where(bracketed, (lower + upper) / 2, np.nan)
+
+
+def xirr_matrix(amounts: np.ndarray, years: np.ndarray, max_iterations: int = XIRR_MAX_ITERATIONS,
+                tolerance: float = XIRR_TOLERANCE) -> np.ndarray:
+    """求解金额矩阵每一行的 XIRR，没有同时包含流入和流出的行为 NaN"""
+    rates = np.full(len(amounts), np.nan)
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+    current = np.full(len(amounts), NEWTON_INITIAL_RATE)
+    converged = np.zeros(len(amounts), dtype=bool)
+    active = solvable.copy()
+    
+    with np.errstate(all="ignore"):
+        # 只对还在迭代的行计算，已收敛或越界的行退出
+        for _ in range(max_iterations):
+            rows = np.flatnonzero(active)
+            if len(rows) == 0:
+                break
+            npv, derivative = _npv(current[rows], amounts[rows], years[rows])
+            updated = current[rows] - npv / derivative
+            diverged = ~np.isfinite(updated) | (updated <= RATE_LOWER) | (updated >= RATE_UPPER)
+            done = ~diverged & (np.abs(updated - current[rows]) < tolerance)
+            current[rows] = np.where(diverged, current[rows], updated)
+            converged[rows[done]] = True
+            active[rows[done | diverged]] = False
+        rates[converged] = current[converged]
+        
+        pending = np.flatnonzero(solvable & ~converged)
+        if len(pending):
+            logger.debug(f"{len(pending)} 个持仓牛顿迭代未收敛，改用二分法")
+            rates[pending] = _bisect(amounts[pending], years[pending], tolerance)
+    return rates
+
+
+def _solve_chunk(chunk: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """进程池任务：求解一块持仓"""
+    amounts, years = chunk
+    return xirr_matrix(amounts, years)
+
+
+def solve_xirr(group_ids: np.ndarray, dates: np.ndarray, amounts: np.ndarray, workers: int = XIRR_WORKERS,
+               chunk_size: int = XIRR_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """按持仓分组求解现金流的 XIRR，返回 (持仓ID, 年化收益率)；无解的持仓为 NaN
+    
+    现金流金额按投资者视角：投入为负，收回（卖出、分红、期末市值）为正。
+    workers 大于 1 且持仓数超过 chunk_size 时，按块分给进程池并行求解
+    """
+    ids, amount_matrix, year_matrix = pad_cash_flows(group_ids, dates, amounts)
+    if workers > 1 and len(ids) > chunk_size:
+        chunks = [(amount_matrix[start:start + chunk_size], year_matrix[start:start + chunk_size])
+                  for start in range(0, len(ids), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rates = np.concatenate(list(executor.map(_solve_chunk, chunks)))
+    else:
+        rates = xirr_matrix(amount_matrix, year_matrix)
+    return ids, rates
\ No newline at end of file